@@ -0,0 +1,142 @@
+# benchmarks/bench_async_firestore.py
+# Load test for the async data layer: POST /chat/send-message against the
+# in-memory Firestore fake (benchmarks/fake_firestore.py) with a fixed
+# per-RPC latency and a fixed threadpool size, comparing
+#
+#   before  the blocking handler (benchmarks/chat_service_reference.py),
+#           one threadpool worker held per request for every round trip
+#   after   the async handler (routers/chat.py), no worker held while waiting
+#
+# Requests go through the ASGI app in-process (httpx.ASGITransport), so the
+# numbers are handler + data layer only. After each run every chat is
+# checked for lost or duplicated messages.
+#
+#   python -m benchmarks.bench_async_firestore [--requests 2000] [--concurrency 64]
+#       [--workers 8] [--latency-ms 20] [--chats 64]
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from typing import List
+
+from benchmarks import fake_firestore
+
+PROMPTS = [
+    "Generate temperature data in Chennai from 3 pm to 4 pm with AC on",
+    "humidity readings at home, ac is off, summer",
+    "co2 in the classroom at night",
+    "outdoor wind near Delhi in winter",
+]
+
+
+def build_apps():
+    import httpx  # noqa: F401  (fail early if the test client is missing)
+    from fastapi import FastAPI, HTTPException
+    from models.chat import MessageIn
+    from routers import chat
+    from benchmarks import chat_service_reference as reference
+
+    before = FastAPI()
+
+    @before.post("/chat/send-message/{project_id}/{chat_id}/{user_id}")
+    def send(project_id: str, chat_id: str, user_id: str, payload: MessageIn):
+        res = reference.send_message(project_id, chat_id, user_id, payload.message)
+        if not res:
+            raise HTTPException(400, "Failed to send")
+        return res
+
+    after = FastAPI()
+    after.include_router(chat.router)
+    return {"before (sync def)": before, "after (async def)": after}
+
+
+async def seed(store, chats: int) -> List[str]:
+    from services import chat_service
+    from services.project_cache import project_cache
+    store.docs["projects/p"] = {"user_id": "u", "name": "bench", "sensor_type": "temp"}
+    latency, store.latency = store.latency, 0.0
+    ids = [(await chat_service.create_chat("p", "u", f"chat {i}"))["chat_id"] for i in range(chats)]
+    store.latency = latency
+    project_cache.clear()
+    return ids
+
+
+async def run(app, chat_ids: List[str], requests: int, concurrency: int, workers: int):
+    import anyio.to_thread
+    import httpx
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = workers
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            nonlocal failures
+            chat_id = chat_ids[i % len(chat_ids)]
+            async with gate:
+                t0 = time.perf_counter()
+                r = await client.post(
+                    f"/chat/send-message/p/{chat_id}/u", json={"message": PROMPTS[i % len(PROMPTS)]},
+                )
+                latencies.append(time.perf_counter() - t0)
+                failures += r.status_code != 200
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - t0
+    return wall, latencies, failures
+
+
+def check_chats(store, chat_ids: List[str]) -> List[str]:
+    problems = []
+    for chat_id in chat_ids:
+        path = f"projects/p/chats/{chat_id}"
+        count = store.docs[path]["message_count"]
+        seqs = sorted(d["seq"] for p, d in store.docs.items() if p.startswith(path + "/messages/"))
+        if seqs != list(range(count)):
+            problems.append(f"{chat_id}: message_count={count}, stored seqs={len(seqs)}")
+    return problems
+
+
+async def main_async(args) -> int:
+    store = fake_firestore.install(latency=args.latency_ms / 1000)
+    apps = build_apps()
+    print(
+        f"{args.requests} sends, concurrency {args.concurrency}, {args.workers} threadpool workers, "
+        f"{args.latency_ms} ms per Firestore RPC, {args.chats} chats"
+    )
+    print(f"{'handler':<20} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'RPCs/req':>9} {'peak RPCs':>10} {'errors':>7}")
+    ok = True
+    for name, app in apps.items():
+        store.docs.clear()
+        chat_ids = await seed(store, args.chats)
+        store.reset_counters()
+        wall, lat, failures = await run(app, chat_ids, args.requests, args.concurrency, args.workers)
+        lat.sort()
+        p95 = lat[int(0.95 * (len(lat) - 1))]
+        print(
+            f"{name:<20} {args.requests / wall:>8.0f} {statistics.median(lat) * 1000:>8.1f} "
+            f"{p95 * 1000:>8.1f} {store.calls / args.requests:>9.2f} {store.peak_in_flight:>10} {failures:>7}"
+        )
+        problems = check_chats(store, chat_ids)
+        for p in problems[:10]:
+            print(f"  lost/duplicated messages: {p}")
+        ok = ok and not problems and not failures
+    return 0 if ok else 1
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--workers", type=int, default=8, help="threadpool size (sync handlers)")
+    ap.add_argument("--latency-ms", type=float, default=20.0)
+    ap.add_argument("--chats", type=int, default=64, help="fewer chats = more concurrent sends per chat")
+    return asyncio.run(main_async(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
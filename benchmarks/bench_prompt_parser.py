@@ -0,0 +1,136 @@
+# benchmarks/bench_prompt_parser.py
+# Check the single-pass services.ai_service.parse_prompt against the original
+# extractor-per-field parser (benchmarks.prompt_parser_reference) on a
+# regression corpus, then compare their throughput.
+#
+#   python -m benchmarks.bench_prompt_parser [--prompts 20000] [--repeat 3] [--seed 0]
+#
+# Exits non-zero if any prompt parses differently.
+import argparse
+import random
+import sys
+import time
+from typing import List
+from benchmarks import prompt_parser_reference as reference
+from services import ai_service
+
+# hand-picked edge cases for every extractor
+EDGE_CASES = [
+    "Generate a temperate data in chennai from 3-4 pm",
+    "Generate temperature data in Chennai from 3 pm to 4 pm with AC on",
+    "humidity readings at home, ac is off, summer",
+    "tempo of the wind near Delhi around 11:30 pm - 11:35 pm",
+    "pm2.5 and pm10 levels at the Office at night",
+    "co2 in the classroom with the air conditioner set to 24 c",
+    "turn on ac in Mumbai",
+    "switch off air conditioner",
+    "I want a place with each sound and light reading",
+    "show pressure for   , then in at the airport",
+    "in at from between",
+    "data in ,Bangalore",
+    "data for 3 pm in Pune",
+    "data for    ",
+    "near\tGoa  during the monsoon rainy season",
+    "Outdoor sensors in Kochi when it is chilly and cold",
+    "a shot of heat in autumn or fall",
+    "spring readings inside use only",
+    "AC:on temp 23:29:54",
+    "ac 18.5f at noon",
+    "the AC is   on",
+    "Humidity Temperature Pressure",
+    "temperatureHUMIDITY in New York City, USA at 5am",
+    "around midnight near St. Louis",
+    "at 12 - 1 am in Oslo",
+    "INDOORS outdoors",
+    "hot wind from the Sahara and Arabian desert",
+    "give me windy winter weather",
+    "    leading spaces in Paris",
+    "İstanbul temperature in İzmir",
+    "x",
+]
+
+VOCAB = [
+    "generate", "give me", "data", "readings", "temperature", "temp", "Temp", "tempo", "humidity",
+    "pressure", "wind", "windy", "co2", "CO2", "pm2.5", "pm10", "light", "sound", "AC", "ac", "Ac",
+    "air conditioner", "on", "off", "is", "is on", "set", "turn", "switch", "to", "24", "24 c", "18.5f",
+    "summer", "hot", "heat", "heater", "winter", "cold", "chilly", "monsoon", "rain", "rainy", "spring",
+    "autumn", "fall", "indoor", "inside", "home", "outdoor", "outside", "in", "at", "for", "near",
+    "around", "from", "between", "and", "with", "Chennai", "New Delhi", "Pune", "St. Louis", "Kochi",
+    "the", "office", "Airport", "3", "3 pm", "4pm", "11:30 pm", "23:29:54", "-", "to", "–", "morning",
+    "afternoon", "evening", "night", "noon", "midnight", ",", ".", ":", "place", "each", "shot", "Mumbai",
+]
+SEPARATORS = [" ", " ", " ", "  ", "\t", ", ", "\n", ""]
+
+
+def make_corpus(n: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    corpus = list(EDGE_CASES)
+    while len(corpus) < n:
+        words = [rng.choice(VOCAB) for _ in range(rng.randint(1, 14))]
+        prompt = words[0]
+        for w in words[1:]:
+            prompt += rng.choice(SEPARATORS) + w
+        corpus.append(prompt)
+    return corpus
+
+
+def _parse_uncached(prompt: str):
+    ai_service._parse_fields.cache_clear()
+    return ai_service.parse_prompt(prompt)
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--prompts", type=int, default=20000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    corpus = make_corpus(args.prompts, args.seed)
+    mismatches = [p for p in corpus if _parse_uncached(p) != reference.parse_prompt(p)]
+    print(f"regression corpus: {len(corpus)} prompts, {len(mismatches)} mismatches")
+    for p in mismatches[:10]:
+        print(f"  {p!r}\n    reference: {reference.parse_prompt(p)}\n    new:       {ai_service.parse_prompt(p)}")
+    if mismatches:
+        return 1
+
+    def run_reference():
+        for p in corpus:
+            reference.parse_prompt(p)
+
+    def run_single_pass():
+        ai_service._parse_fields.cache_clear()
+        for p in corpus:
+            ai_service.parse_prompt(p)
+
+    # repeat traffic: the same prompts again, as many as the memo holds
+    hot = (corpus[: max(1, ai_service.AI_PARSE_CACHE_SIZE)] * len(corpus))[: len(corpus)]
+
+    def run_memoised():
+        for p in hot:
+            ai_service.parse_prompt(p)
+
+    t_ref = _best(run_reference, args.repeat)
+    t_new = _best(run_single_pass, args.repeat)
+    ai_service._parse_fields.cache_clear()
+    run_memoised()  # warm
+    t_memo = _best(run_memoised, args.repeat)
+    n = len(corpus)
+    print(f"{'parser':<22} {'prompts/s':>10} {'speedup':>8}")
+    for name, t in (("reference", t_ref), ("single-pass", t_new), ("single-pass, repeats", t_memo)):
+        print(f"{name:<22} {n / t:>10.0f} {t_ref / t:>7.1f}x")
+    print(f"(repeats: the first {len(set(hot))} prompts cycled; memo size AI_PARSE_CACHE_SIZE)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+# benchmarks/bench_sampler.py
+# Compare the fast-path sampler (services/fast_sampler.py) with the stock
+# sampler of the same model - CTGAN.sample for a pickle, the plain
+# ArtifactModel for an artifact directory:
+#
+#   equivalence  --rows rows from each, column by column (KS for numeric,
+#                chi-square for categorical; services.fast_sampler.
+#                equivalence_report, the test the registry's equivalence_gate
+#                runs on every model it loads); exits 1 if any column differs
+#   throughput   rows/sec of each at several sizes (best of --repeat)
+#
+# Without MODEL_PATH the fixture CTGAN (benchmarks/fixture_model.py) is used,
+# so `python -m benchmarks.bench_sampler --equivalence-only` is a
+# self-contained check of the fast path.
+#
+#   python -m benchmarks.bench_sampler [MODEL_PATH] [--rows 20000] [--alpha 0.01]
+#       [--sizes 2000,10000,50000] [--repeat 3] [--precision fp32|bf16|int8]
+#       [--equivalence-only]
+import argparse
+import sys
+import time
+
+from services.fast_sampler import PRECISIONS, equivalence_report, fast_sampler, stock_sample
+from services.model_artifact import is_artifact
+from services.model_registry import load_model_file
+
+
+def stock_sampler(path: str):
+    """(model, description, sample(n, seed)) for the model's stock sampling path."""
+    model = load_model_file(path, fast=False)
+    name = "ArtifactModel.sample" if is_artifact(path) else "CTGAN.sample"
+    return model, name, lambda n, seed: stock_sample(model, n, seed)
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("model", nargs="?", help="CTGAN pickle or artifact directory (default: the fixture CTGAN)")
+    ap.add_argument("--rows", type=int, default=20000, help="rows per sampler for the equivalence check")
+    ap.add_argument("--alpha", type=float, default=0.01)
+    ap.add_argument("--sizes", default="2000,10000,50000")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--precision", default="fp32", choices=PRECISIONS, help="FastSampler generator precision")
+    ap.add_argument("--equivalence-only", action="store_true", help="skip the throughput measurements")
+    args = ap.parse_args()
+    if args.model is None:
+        from benchmarks import fixture_model
+        args.model = fixture_model.ensure()
+
+    model, stock_name, stock = stock_sampler(args.model)
+    fast = fast_sampler(model, args.precision)
+    fast.sample(fast.meta["batch_size"], seed=0)  # build the frozen generator
+
+    report = equivalence_report(stock(args.rows, 1), fast.sample(args.rows, seed=2), args.alpha)
+    print(f"equivalence, {args.rows} rows each, alpha {args.alpha} (Bonferroni over columns)")
+    for c in report["columns"]:
+        print(f"  {c['column']:<24} {c['test']:<5} stat {c['statistic']:>10.4f}  p {c['p_value']:.4f}"
+              f"{'' if c['ok'] else '  DIFFERS'}")
+    if args.equivalence_only:
+        return 0 if report["ok"] else 1
+
+    print(f"\n{'rows':>8} {stock_name + ' rows/s':>28} {'FastSampler/' + args.precision + ' rows/s':>25} {'speedup':>8}")
+    for n in (int(s) for s in args.sizes.split(",")):
+        t_stock = _best(lambda: stock(n, 0), args.repeat)
+        t_fast = _best(lambda: fast.sample(n, seed=0), args.repeat)
+        print(f"{n:>8} {n / t_stock:>28.0f} {n / t_fast:>25.0f} {t_stock / t_fast:>7.2f}x")
+    return 0 if report["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
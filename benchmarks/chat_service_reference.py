@@ -0,0 +1,64 @@
+# benchmarks/chat_service_reference.py
+# The blocking send_message path as it was before the async data layer: a
+# sync `def` handler on the threadpool, the ownership read, then a
+# transaction that reads message_count and writes both messages. Kept only
+# as the "before" side of benchmarks/bench_async_firestore.py (legacy-chat
+# migration left out; the benchmark chats are all in the current layout).
+import time
+from typing import List, Optional
+import google.cloud.firestore as firestore
+from utils.firebase import db
+from services.ai_service import parse_and_respond
+from services.chat_service import MESSAGES, PREVIEW_CHARS, _message_id
+from services.project_cache import project_cache
+
+
+def _chat_ref(project_id: str, chat_id: str):
+    return (
+        db.collection("projects")
+        .document(project_id)
+        .collection("chats")
+        .document(chat_id)
+    )
+
+
+def _append_messages(chat_ref, messages: List[dict], chat_fields: dict) -> Optional[List[dict]]:
+    @firestore.transactional
+    def append(transaction) -> Optional[List[dict]]:
+        snap = chat_ref.get(field_paths=["message_count"], transaction=transaction)
+        if not snap.exists:
+            return None
+        count = snap.to_dict().get("message_count")
+        stored = []
+        for i, msg in enumerate(messages):
+            doc = {**msg, "seq": count + i}
+            transaction.create(chat_ref.collection(MESSAGES).document(_message_id(count + i)), doc)
+            stored.append(doc)
+        transaction.update(
+            chat_ref,
+            {**chat_fields, "message_count": count + len(messages), "updated_at": time.time()},
+        )
+        return stored
+
+    return append(db.transaction())
+
+
+def send_message(project_id: str, chat_id: str, user_id: str, user_prompt: str):
+    if project_cache.owned(project_id, user_id) is None:
+        return None
+    user_message = {"role": "user", "content": user_prompt, "timestamp": time.time()}
+    params = None
+    try:
+        ai_result = parse_and_respond(user_prompt)
+        ai_message = ai_result["message"]
+        params = ai_result["params"]
+    except Exception:
+        ai_message = "Sorry, I couldn't understand that request."
+    reply = {"role": "assistant", "content": ai_message, "timestamp": time.time()}
+    if params is not None:
+        reply["params"] = params
+    chat_fields = {"last_message": user_prompt[:PREVIEW_CHARS]}
+    stored = _append_messages(_chat_ref(project_id, chat_id), [user_message, reply], chat_fields)
+    if stored is None:
+        return None
+    return {"messages": stored}
@@ -0,0 +1,406 @@
+# benchmarks/fake_firestore.py
+# In-memory stand-in for the Firestore clients in utils/firebase.py, for
+# benchmarks and load tests that should run without credentials or the
+# emulator. One FakeFirestore holds the documents; .client() and
+# .async_client() return a blocking and an asyncio client over the same
+# data, with the API surface the services use (documents, subcollections,
+# batches, transactions that work with firestore.transactional /
+# async_transactional, and where / order_by / start_after / limit / select
+# queries).
+#
+# Every RPC waits `latency` seconds (time.sleep or asyncio.sleep) and the
+# store counts calls and the peak number in flight, which is what the load
+# tests compare.
+#
+#   from benchmarks import fake_firestore
+#   store = fake_firestore.install(latency=0.02)  # before importing services
+import asyncio
+import copy
+import itertools
+import sys
+import threading
+import time
+import types
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.api_core.exceptions import Aborted, AlreadyExists, NotFound
+import google.cloud.firestore as firestore
+
+_DESCENDING = "DESCENDING"
+_NAME = "__name__"
+
+
+class FakeFirestore:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.docs: Dict[str, dict] = {}
+        self.versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._version = itertools.count(1)
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def client(self) -> "FakeClient":
+        return FakeClient(self)
+
+    def async_client(self) -> "FakeAsyncClient":
+        return FakeAsyncClient(self)
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.peak_in_flight = self.in_flight
+
+    # ---- RPC accounting ----------------------------------------------------
+    def _enter(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _exit(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    # ---- storage (called with the RPC already accounted for) ----------------
+    def read(self, path: str) -> Tuple[Optional[dict], int]:
+        with self._lock:
+            return copy.deepcopy(self.docs.get(path)), self.versions.get(path, 0)
+
+    def query(self, parent: str) -> List[Tuple[str, dict]]:
+        prefix = parent + "/"
+        with self._lock:
+            return [
+                (path, copy.deepcopy(data)) for path, data in self.docs.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+
+    def apply(self, writes: List[tuple], reads: Optional[Dict[str, int]] = None) -> None:
+        # all-or-nothing, like a commit: preconditions first, then the writes
+        with self._lock:
+            for path, version in (reads or {}).items():
+                if self.versions.get(path, 0) != version:
+                    raise Aborted(f"{path} changed during the transaction")
+            exists = {path: path in self.docs for _, path, _ in writes}
+            for op, path, _ in writes:
+                if op == "create" and exists[path]:
+                    raise AlreadyExists(f"Document already exists: {path}")
+                if op == "update" and not exists[path]:
+                    raise NotFound(f"No document to update: {path}")
+                exists[path] = op != "delete"
+            for op, path, data in writes:
+                if op == "delete":
+                    self.docs.pop(path, None)
+                    self.versions.pop(path, None)
+                    continue
+                doc = self.docs.get(path, {}) if op == "update" else {}
+                for key, value in data.items():
+                    if value is firestore.DELETE_FIELD:
+                        doc.pop(key, None)
+                    elif value is firestore.SERVER_TIMESTAMP:
+                        doc[key] = datetime.now(timezone.utc)
+                    else:
+                        doc[key] = copy.deepcopy(value)
+                self.docs[path] = doc
+                self.versions[path] = next(self._version)
+
+
+class _Client:
+    def __init__(self, store: FakeFirestore):
+        self._store = store
+
+    def collection(self, name: str) -> "CollectionReference":
+        return CollectionReference(self, name)
+
+    def batch(self) -> "WriteBatch":
+        return WriteBatch(self)
+
+    def transaction(self, **_) -> "Transaction":
+        return Transaction(self)
+
+
+class FakeClient(_Client):
+    def _rpc(self, fn: Callable[[], Any]) -> Any:
+        self._store._enter()
+        try:
+            time.sleep(self._store.latency)
+            return fn()
+        finally:
+            self._store._exit()
+
+    def _stream(self, fn: Callable[[], list]):
+        return iter(self._rpc(fn))
+
+
+class FakeAsyncClient(_Client):
+    async def _rpc(self, fn: Callable[[], Any]) -> Any:
+        self._store._enter()
+        try:
+            await asyncio.sleep(self._store.latency)
+            return fn()
+        finally:
+            self._store._exit()
+
+    async def _stream(self, fn: Callable[[], list]):
+        for item in await self._rpc(fn):
+            yield item
+
+
+class DocumentSnapshot:
+    def __init__(self, reference: "DocumentReference", data: Optional[dict], fields=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        if data is not None and fields is not None:
+            data = {k: v for k, v in data.items() if k in fields}
+        self._data = data
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field: str) -> Any:
+        return self._data[field]
+
+
+class DocumentReference:
+    def __init__(self, client: _Client, path: str):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str) -> "CollectionReference":
+        return CollectionReference(self._client, f"{self.path}/{name}")
+
+    def get(self, field_paths=None, transaction: "Transaction" = None):
+        def read():
+            data, version = self._client._store.read(self.path)
+            if transaction is not None:
+                transaction._reads.setdefault(self.path, version)
+            return DocumentSnapshot(self, data, field_paths)
+        return self._client._rpc(read)
+
+    def _write(self, op: str, data: Optional[dict] = None):
+        return self._client._rpc(lambda: self._client._store.apply([(op, self.path, data or {})]))
+
+    def set(self, data: dict):
+        return self._write("set", data)
+
+    def create(self, data: dict):
+        return self._write("create", data)
+
+    def update(self, data: dict):
+        return self._write("update", data)
+
+    def delete(self):
+        return self._write("delete")
+
+
+class Query:
+    def __init__(self, client: _Client, path: str, filters=(), orders=(), fields=None, after=None, limit=None):
+        self._client = client
+        self._path = path
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._fields = fields
+        self._after = after
+        self._limit = limit
+
+    def _with(self, **changes) -> "Query":
+        q = Query(self._client, self._path, self._filters, self._orders, self._fields, self._after, self._limit)
+        for key, value in changes.items():
+            setattr(q, "_" + key, value)
+        return q
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None) -> "Query":
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._with(filters=self._filters + [(field_path, op_string, value)])
+
+    def order_by(self, field_path: str, direction: str = "ASCENDING") -> "Query":
+        return self._with(orders=self._orders + [(field_path, direction)])
+
+    def select(self, field_paths) -> "Query":
+        return self._with(fields=list(field_paths))
+
+    def start_after(self, values) -> "Query":
+        if isinstance(values, DocumentSnapshot):
+            values = {**(values.to_dict() or {}), _NAME: values.id}
+        return self._with(after=dict(values))
+
+    def limit(self, count: int) -> "Query":
+        return self._with(limit=count)
+
+    def _run(self) -> List[DocumentSnapshot]:
+        orders = list(self._orders)
+        if not any(f == _NAME for f, _ in orders):
+            orders.append((_NAME, orders[-1][1] if orders else "ASCENDING"))
+        rows = []
+        for path, data in self._client._store.query(self._path):
+            doc_id = path.rsplit("/", 1)[-1]
+            if not all(_matches(_value(doc_id, data, f), op, v) for f, op, v in self._filters):
+                continue
+            if any(f != _NAME and f not in data for f, _ in orders):
+                continue  # Firestore skips documents without an order_by field
+            rows.append((_sort_key(orders, lambda f: _value(doc_id, data, f)), path, data))
+        rows.sort(key=lambda r: r[0])
+        if self._after is not None:
+            after = self._after
+            known = [(f, d) for f, d in orders if f in after]
+            cursor = _sort_key(known, lambda f: _cursor_value(after[f]) if f == _NAME else after[f])
+            rows = [r for r in rows if r[0][: len(cursor)] > cursor]
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        return [
+            DocumentSnapshot(DocumentReference(self._client, path), data, self._fields)
+            for _, path, data in rows
+        ]
+
+    def stream(self):
+        return self._client._stream(self._run)
+
+    def get(self):
+        return self._client._rpc(self._run)
+
+
+class CollectionReference(Query):
+    def __init__(self, client: _Client, path: str):
+        super().__init__(client, path)
+        self.id = path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> DocumentReference:
+        return DocumentReference(self._client, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+
+class _Descending:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+
+def _value(doc_id: str, data: dict, field: str) -> Any:
+    return doc_id if field == _NAME else data.get(field)
+
+
+def _cursor_value(value: Any) -> Any:
+    return value.rsplit("/", 1)[-1] if isinstance(value, str) else value.id
+
+
+def _sort_key(orders, get) -> tuple:
+    return tuple(_Descending(get(f)) if d == _DESCENDING else get(f) for f, d in orders)
+
+
+def _matches(actual: Any, op: str, expected: Any) -> bool:
+    if op == "==":
+        return actual == expected
+    if op == "in":
+        return actual in expected
+    if op == "array_contains":
+        return isinstance(actual, list) and expected in actual
+    if actual is None:
+        return False
+    return {"<": actual < expected, "<=": actual <= expected, ">": actual > expected, ">=": actual >= expected}[op]
+
+
+class WriteBatch:
+    def __init__(self, client: _Client):
+        self._client = client
+        self._writes: List[tuple] = []
+
+    def set(self, reference: DocumentReference, data: dict) -> None:
+        self._writes.append(("set", reference.path, data))
+
+    def create(self, reference: DocumentReference, data: dict) -> None:
+        self._writes.append(("create", reference.path, data))
+
+    def update(self, reference: DocumentReference, data: dict) -> None:
+        self._writes.append(("update", reference.path, data))
+
+    def delete(self, reference: DocumentReference) -> None:
+        self._writes.append(("delete", reference.path, None))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        return self._client._rpc(lambda: self._client._store.apply(writes))
+
+
+class Transaction(WriteBatch):
+    # Enough of google.cloud.firestore's Transaction for the transactional
+    # decorators: begin / commit / rollback are RPCs, and a commit is aborted
+    # (and retried by the decorator) if a document it read has changed.
+    _max_attempts = 5
+    _read_only = False
+
+    def __init__(self, client: _Client):
+        super().__init__(client)
+        self._id = None
+        self._reads: Dict[str, int] = {}
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    def _clean_up(self) -> None:
+        self._writes, self._reads, self._id = [], {}, None
+
+    def _begin(self, retry_id=None):
+        def begin():
+            self._id = uuid.uuid4().bytes
+        return self._client._rpc(begin)
+
+    def _commit(self):
+        writes, reads = self._writes, self._reads
+
+        def commit():
+            try:
+                self._client._store.apply(writes, reads)
+            finally:
+                self._clean_up()
+        return self._client._rpc(commit)
+
+    def _rollback(self):
+        return self._client._rpc(self._clean_up)
+
+
+class FakeAuth:
+    # the firebase_admin.auth calls user_service makes
+    def __init__(self):
+        self.users: Dict[str, dict] = {}
+
+    def create_user(self, email: str, password: str):
+        uid = uuid.uuid4().hex[:28]
+        self.users[uid] = {"email": email}
+        return types.SimpleNamespace(uid=uid, email=email)
+
+    def update_user(self, uid: str, **fields):
+        self.users.setdefault(uid, {}).update(fields)
+
+
+def install(latency: float = 0.0) -> FakeFirestore:
+    """Register a fake utils.firebase (db, adb, auth) backed by a new store.
+
+    Must run before anything imports utils.firebase, which would otherwise
+    try to load real credentials.
+    """
+    if "utils.firebase" in sys.modules and not getattr(sys.modules["utils.firebase"], "FAKE", False):
+        raise RuntimeError("utils.firebase is already imported")
+    store = FakeFirestore(latency)
+    module = types.ModuleType("utils.firebase")
+    module.db = store.client()
+    module.adb = store.async_client()
+    module.auth = FakeAuth()
+    module.FAKE = True
+    module.store = store
+    import utils
+    utils.firebase = module
+    sys.modules["utils.firebase"] = module
+    return store
@@ -0,0 +1,112 @@
+# benchmarks/fixture_model.py
+# A small CTGAN trained on a generated IoT dataset, so benchmarks and load
+# tests can sample without the production pickle. The dataset mimics the
+# production schema (Date, Time, Temperature(F), Humidity(%)) plus the
+# discrete columns the chat parser conditions on (Location, Season, AC,
+# Indoor); everything is seeded, so a given FIXTURE_VERSION always trains
+# to the same artifact on the same library versions.
+#
+#   python -m benchmarks.fixture_model OUT_DIR [--rows 4000] [--epochs 10]
+#
+# ensure() builds the artifact once and reuses it after that.
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+FIXTURE_VERSION = 1
+_STAMP = "fixture.json"
+
+LOCATIONS = ["Chennai", "New Delhi", "Pune", "Mumbai"]
+SEASONS = ["summer", "winter", "monsoon", "spring"]
+DISCRETE_COLUMNS = ["Date", "Time", "Location", "Season", "AC", "Indoor"]
+
+
+def make_dataset(rows: int = 4000, seed: int = 0) -> pd.DataFrame:
+    """Readings every few minutes across a week, with temperature and
+    humidity depending on the hour, season, location, AC and indoor flag."""
+    rng = np.random.default_rng(seed)
+    minute = rng.integers(0, 24 * 4, rows) * 15  # quarter-hour slots
+    day = rng.integers(0, 7, rows)
+    location = rng.integers(0, len(LOCATIONS), rows)
+    season = rng.integers(0, len(SEASONS), rows)
+    indoor = rng.random(rows) < 0.6
+    ac = indoor & (rng.random(rows) < 0.5)
+    hour = minute / 60.0
+    temp_c = (
+        27 + 5 * np.sin((hour - 9) / 24 * 2 * np.pi)
+        + np.array([4.0, -9.0, 0.0, 1.5])[season]
+        + np.array([3.0, 1.0, -2.0, 2.0])[location]
+        - 6 * ac + rng.normal(0, 1.2, rows)
+    )
+    humidity = np.clip(
+        60 + np.array([-5.0, -15.0, 25.0, 0.0])[season] - 10 * ac - 5 * indoor + rng.normal(0, 6, rows), 5, 100,
+    )
+    return pd.DataFrame({
+        "Date": [f"2025-09-{d + 1:02d}" for d in day],
+        "Time": [f"{m // 60:02d}:{m % 60:02d}:00" for m in minute],
+        "Location": np.array(LOCATIONS)[location],
+        "Season": np.array(SEASONS)[season],
+        "AC": np.where(ac, "on", "off"),
+        "Indoor": np.where(indoor, "indoor", "outdoor"),
+        "Temperature(F)": np.round(temp_c * 9 / 5 + 32, 2),
+        "Humidity(%)": np.round(humidity, 2),
+    })
+
+
+def build(out_dir: str, rows: int = 4000, epochs: int = 10, seed: int = 0) -> dict:
+    """Train the fixture CTGAN and export it as an artifact directory."""
+    import torch
+    from ctgan import CTGAN
+    from services.model_artifact import export_artifact
+
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    t0 = time.perf_counter()
+    model = CTGAN(
+        embedding_dim=32, generator_dim=(64, 64), discriminator_dim=(64, 64),
+        batch_size=500, epochs=epochs, pac=10, cuda=False,
+    )
+    model.fit(make_dataset(rows, seed), discrete_columns=DISCRETE_COLUMNS)
+    export_artifact(model, out_dir)
+    stamp = {"version": FIXTURE_VERSION, "rows": rows, "epochs": epochs, "seed": seed,
+             "train_seconds": round(time.perf_counter() - t0, 2)}
+    with open(os.path.join(out_dir, _STAMP), "w", encoding="utf-8") as f:
+        json.dump(stamp, f, indent=2)
+    return stamp
+
+
+def ensure(out_dir: Optional[str] = None, **kwargs) -> str:
+    """The fixture artifact directory, trained on first use."""
+    out_dir = out_dir or os.path.join(
+        os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "synthiot-bench", f"fixture_v{FIXTURE_VERSION}",
+    )
+    try:
+        with open(os.path.join(out_dir, _STAMP), encoding="utf-8") as f:
+            if json.load(f).get("version") == FIXTURE_VERSION:
+                return out_dir
+    except (OSError, ValueError):
+        pass
+    stamp = build(out_dir, **kwargs)
+    print(f"[fixture] trained {out_dir} in {stamp['train_seconds']}s", file=sys.stderr)
+    return out_dir
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("out_dir")
+    ap.add_argument("--rows", type=int, default=4000)
+    ap.add_argument("--epochs", type=int, default=10)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    print(json.dumps(build(args.out_dir, args.rows, args.epochs, args.seed)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
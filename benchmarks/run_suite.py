@@ -0,0 +1,280 @@
+# benchmarks/run_suite.py
+# Offline benchmark suite: the routers run in-process (httpx.ASGITransport)
+# over the in-memory Firestore fake (benchmarks/fake_firestore.py) and the
+# fixture CTGAN (benchmarks/fixture_model.py), so it needs no credentials,
+# network or production model and gives the same workload on every run.
+#
+#   generate   GET /synth/generate rows/s and MB/s per batch size
+#   parse      parse_prompt latency on the parser regression corpus, uncached
+#   send       POST /chat/send-message latency and RPCs vs. chat length, plus
+#              the newest history page
+#   list       project and chat list pages
+#
+# The fake answers queries by scanning its whole store, so list and history
+# numbers measure the handlers plus the fake, not Firestore: compare them
+# between commits, not with production.
+#
+# Results go to a JSON file: one entry per metric with its unit and whether
+# higher or lower is better, plus the commit and library versions. With
+# --compare, each metric is checked against an earlier run and the exit
+# status is 1 if any got worse by more than --tolerance.
+#
+#   python -m benchmarks.run_suite [--out bench.json] [--compare base.json]
+#       [--quick] [--model PATH] [--latency-ms 0] [--only generate,send]
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks import fake_firestore
+
+SUITES = ("generate", "parse", "send", "list")
+
+
+class Results:
+    def __init__(self):
+        self.metrics: Dict[str, dict] = {}
+
+    def add(self, name: str, value: float, unit: str, better: str) -> None:
+        self.metrics[name] = {"value": round(value, 6), "unit": unit, "better": better}
+        print(f"  {name:<44} {value:>14.3f} {unit}")
+
+    def latencies(self, name: str, seconds: List[float]) -> None:
+        ordered = sorted(seconds)
+        self.add(f"{name}.p50_ms", statistics.median(ordered) * 1000, "ms", "lower")
+        self.add(f"{name}.p95_ms", ordered[int(0.95 * (len(ordered) - 1))] * 1000, "ms", "lower")
+
+
+def _meta(args) -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    versions = {}
+    for name in ("torch", "numpy", "pandas", "fastapi"):
+        module = sys.modules.get(name)
+        versions[name] = getattr(module, "__version__", None)
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "versions": versions,
+        "args": vars(args),
+    }
+
+
+def setup(args):
+    """Fake Firestore + fixture model, then the app (services read their
+    settings from the environment at import time)."""
+    store = fake_firestore.install(latency=args.latency_ms / 1000)
+    if args.model is None:
+        from benchmarks import fixture_model
+        args.model = fixture_model.ensure()
+    os.environ.pop("SYNTH_MODEL_REGISTRY", None)
+    os.environ["CTGAN_MODEL_PATH"] = args.model
+    os.environ["SYNTH_CACHE_DIR"] = tempfile.mkdtemp(prefix="synth-bench-cache-")
+    os.environ["SYNTH_JOB_DIR"] = tempfile.mkdtemp(prefix="synth-bench-jobs-")
+    os.environ["SYNTH_ROW_POOL"] = "0"
+
+    from fastapi import FastAPI
+    from routers import chat, project, synth
+    from services.synth_service import ensure_model_loaded
+
+    app = FastAPI()
+    for module in (chat, project, synth):
+        app.include_router(module.router)
+    ensure_model_loaded()
+    return store, app
+
+
+async def _timed(fn: Callable, n: int) -> List[float]:
+    out = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        await fn(i)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def _expect(r, status: int = 200):
+    if r.status_code != status:
+        raise RuntimeError(f"{r.request.method} {r.request.url.path}: {r.status_code} {r.text[:200]}")
+    return r
+
+
+# ------------------------------------------------------------------
+# Suites
+# ------------------------------------------------------------------
+async def bench_generate(client, store, res: Results, args) -> None:
+    store.docs["projects/gen"] = {"user_id": "u", "name": "gen", "sensor_type": "temp"}
+    rows = 20_000 if args.quick else 100_000
+    for batch in (500, 2000, 10_000):
+        params = {"project_id": "gen", "user_id": "u", "chat_id": "c", "rows": rows,
+                  "batch_size": batch, "sharded": False, "cache": False}
+        _expect(await client.get("/synth/generate", params={**params, "rows": batch}))  # warm up
+        best, size = float("inf"), 0
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            r = _expect(await client.get("/synth/generate", params=params, headers={"Accept-Encoding": "identity"}))
+            best = min(best, time.perf_counter() - t0)
+            size = len(r.content)
+        res.add(f"generate.batch_{batch}.rows_per_s", rows / best, "rows/s", "higher")
+        res.add(f"generate.batch_{batch}.mb_per_s", size / best / 2**20, "MB/s", "higher")
+
+
+async def bench_parse(client, store, res: Results, args) -> None:
+    from benchmarks.bench_prompt_parser import _parse_uncached, make_corpus
+    corpus = make_corpus(2000 if args.quick else 20_000)
+    for prompt in corpus[:200]:
+        _parse_uncached(prompt)
+    seconds = []
+    for prompt in corpus:
+        t0 = time.perf_counter()
+        _parse_uncached(prompt)
+        seconds.append(time.perf_counter() - t0)
+    res.add("parse.prompts_per_s", len(seconds) / sum(seconds), "prompts/s", "higher")
+    res.add("parse.p50_us", statistics.median(seconds) * 1e6, "us", "lower")
+    res.add("parse.p99_us", sorted(seconds)[int(0.99 * (len(seconds) - 1))] * 1e6, "us", "lower")
+
+
+def _seed_chat(store, chat_id: str, length: int) -> None:
+    from services.chat_service import MESSAGES, _message_id
+    path = f"projects/p/chats/{chat_id}"
+    now = time.time()
+    store.docs[path] = {"user_id": "u", "name": chat_id, "preview": chat_id, "last_message": "",
+                        "created_at": now, "updated_at": now, "message_count": length}
+    for seq in range(length):
+        role = "user" if seq % 2 == 0 else "assistant"
+        store.docs[f"{path}/{MESSAGES}/{_message_id(seq)}"] = {
+            "seq": seq, "role": role, "content": f"message {seq}", "timestamp": now + seq,
+        }
+
+
+async def bench_send(client, store, res: Results, args) -> None:
+    from benchmarks.bench_async_firestore import PROMPTS
+    store.docs["projects/p"] = {"user_id": "u", "name": "bench", "sensor_type": "temp"}
+    sends = 50 if args.quick else 200
+    for length in (0, 100, 1000) if args.quick else (0, 100, 1000, 10_000):
+        chat_id = f"len{length}"
+        _seed_chat(store, chat_id, length)
+        url = f"/chat/send-message/p/{chat_id}/u"
+
+        async def send(i: int):
+            _expect(await client.post(url, json={"message": PROMPTS[i % len(PROMPTS)]}))
+
+        await send(0)
+        store.reset_counters()
+        res.latencies(f"send.len_{length}", await _timed(send, sends))
+        res.add(f"send.len_{length}.rpcs", store.calls / sends, "RPCs/req", "lower")
+
+        async def history(i: int):
+            _expect(await client.get(f"/chat/get-chat-history/p/{chat_id}/u", params={"limit": 50}))
+
+        res.latencies(f"history.len_{length}.page_50", await _timed(history, sends))
+
+
+async def bench_list(client, store, res: Results, args) -> None:
+    from services import chat_service
+    n = 200 if args.quick else 1000
+    store.docs["projects/lp"] = {"user_id": "lister", "name": "list", "sensor_type": "temp"}
+    for i in range(n):
+        store.docs[f"projects/lp{i:05d}"] = {"user_id": "lister", "name": f"project {i}", "sensor_type": "temp",
+                                            "description": "x" * 200, "created_at": float(i)}
+    latency, store.latency = store.latency, 0.0
+    for i in range(n):
+        await chat_service.create_chat("lp", "lister", f"chat {i}")
+    store.latency = latency
+    requests = 50 if args.quick else 200
+
+    for name, url in (("list.projects", "/project/get-project/lister"),
+                      ("list.chats", "/chat/get-chat-list/lp/lister")):
+        async def page(i: int):
+            _expect(await client.get(url, params={"limit": 50}))
+
+        await page(0)
+        store.reset_counters()
+        res.latencies(f"{name}.page_50", await _timed(page, requests))
+        res.add(f"{name}.page_50.rpcs", store.calls / requests, "RPCs/req", "lower")
+
+        async def everything(i: int):
+            _expect(await client.get(url))
+
+        res.latencies(f"{name}.all_{n}", await _timed(everything, max(5, requests // 10)))
+
+
+# ------------------------------------------------------------------
+# Comparison
+# ------------------------------------------------------------------
+def compare(current: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Metrics that got worse than the baseline by more than `tolerance`."""
+    worse = []
+    print(f"\n{'metric':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if base is None or not base["value"]:
+            continue
+        change = cur["value"] / base["value"] - 1
+        regressed = -change if cur["better"] == "higher" else change
+        flag = "  WORSE" if regressed > tolerance else ""
+        print(f"{name:<44} {base['value']:>12.3f} {cur['value']:>12.3f} {change:>+7.1%}{flag}")
+        if flag:
+            worse.append(name)
+    return worse
+
+
+async def main_async(args) -> int:
+    import httpx
+
+    store, app = setup(args)
+    res = Results()
+    suites = {"generate": bench_generate, "parse": bench_parse, "send": bench_send, "list": bench_list}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name in args.only:
+            print(f"[{name}]")
+            await suites[name](client, store, res, args)
+
+    report = {"meta": _meta(args), "metrics": res.metrics}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nwrote {args.out}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        worse = compare(res.metrics, baseline["metrics"], args.tolerance)
+        print(f"{len(worse)} regressions beyond {args.tolerance:.0%} vs {baseline['meta'].get('commit')}")
+        return 1 if worse else 0
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default="bench.json")
+    ap.add_argument("--compare", help="earlier results file to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="allowed relative slowdown per metric")
+    ap.add_argument("--quick", action="store_true", help="smaller workloads (CI smoke run)")
+    ap.add_argument("--model", help="model to generate from (default: the fixture CTGAN)")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="simulated Firestore RPC latency")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", default=",".join(SUITES))
+    args = ap.parse_args()
+    args.only = [s for s in args.only.split(",") if s]
+    unknown = set(args.only) - set(SUITES)
+    if unknown:
+        ap.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    return asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,12 @@
 # main.py
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware  
-from routers import user, project, chat, ai_route, synth
-from services.synth_service import ensure_model_loaded, get_model_path
+# Only the app shell is built at import time; Firebase, the routers, torch
+# and the default model come up on a background thread (services/startup.py)
+# so /, /healthz, /readyz and /metrics answer immediately after a restart.
+from services.startup import startup
+from services import metrics, profiler
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 
 app = FastAPI(
     title="SYNTHIOT API",
@@ -10,32 +14,104 @@ app = FastAPI(
     version="1.0"
 )
 
+# answered before (and regardless of) the background startup
+_ALWAYS_UP = {"/", "/healthz", "/readyz", "/metrics"}
+
+@app.middleware("http")
+async def wait_for_routers(request: Request, call_next):
+    # until the routers are mounted, wait briefly, then refuse with 503
+    if request.url.path not in _ALWAYS_UP and not startup.ok("routers"):
+        if not await startup.wait("routers") or not startup.ok("routers"):
+            return JSONResponse(
+                {"detail": "Service is starting up", "startup": startup.status()},
+                status_code=503, headers={"Retry-After": str(startup.retry_after())},
+            )
+    return await call_next(request)
+
 # === FIX CORS IN 3 LINES ===
+# (added after the middleware above, so it wraps the 503s too)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:5173", 
+    allow_origins=["http://localhost:5173",
                    "https://synthiot-frontend-cqpons0qy-dreammart1331-9605s-projects.vercel.app",
-                   "https://synthiot-frontend.vercel.app"],  
+                   "https://synthiot-frontend.vercel.app"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# outermost: a profiled request is sampled through all of the above
+app.add_middleware(profiler.ProfilingMiddleware)
 
-@app.on_event("startup")
-def load_models():
+def _init_firebase():
+    import utils.firebase  # noqa: F401  (initialises the Firebase app)
+
+def _mount_routers():
+    from fastapi import Depends
+    from routers import user, project, chat, ai_route, synth
+    from services.auth import authenticate
+    # bearer-token check on every API route (a no-op unless SYNTH_AUTH is
+    # set), except sign-up and login
+    app.include_router(user.public_router)
+    for module in (user, project, chat, ai_route, synth):
+        app.include_router(module.router, dependencies=[Depends(authenticate)])
+
+def _fetch_auth_keys():
+    from services import auth
+    auth.warm()
+
+def _import_torch():
+    import torch  # noqa: F401
+
+def _default_model_resident() -> bool:
+    # readiness follows the registry, not the startup phase: a model the
+    # startup load failed on is ready once a later request has loaded it
+    from services.model_registry import registry
+    return registry.is_loaded()
+
+def _load_default_model():
+    from services.synth_service import ensure_model_loaded, get_model_path
     print(f"[synth] CTGAN path: {get_model_path() or '(not set)'}")
-    try:
-        ensure_model_loaded()
-        print("[synth] CTGAN loaded ✅")
-    except Exception as e:
-        print(f"[synth] CTGAN not loaded: {e}")
-
-app.include_router(user.router)
-app.include_router(project.router)
-app.include_router(chat.router)
-app.include_router(ai_route.router)
-app.include_router(synth.router) 
+    ensure_model_loaded()
+    print("[synth] CTGAN loaded ✅")
+
+@app.on_event("startup")
+def start_background_startup():
+    startup.start([
+        ("firebase", _init_firebase, True),
+        ("routers", _mount_routers, True),
+        ("torch", _import_torch, False),
+        # a failed load is retried by the first request that needs the model
+        ("model", _load_default_model, False),
+        ("auth_keys", _fetch_auth_keys, False),
+    ], checks={"model": _default_model_resident})
 
 @app.get("/")
 def home():
-    return {"message": "SYNTHIOT API Running 🟢"}
\ No newline at end of file
+    return {"message": "SYNTHIOT API Running 🟢"}
+
+@app.get("/healthz")
+def healthz():
+    # liveness: the process is up and serving
+    return {"status": "ok", "uptime_seconds": startup.status()["uptime_seconds"]}
+
+@app.get("/readyz")
+def readyz():
+    # readiness: required phases done and the default model resident now
+    status = startup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    # stage latencies, Firestore round trips, generation throughput, startup
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "folded"):
+    # a request sent with "X-Profile: 1" (SYNTH_PROFILING=1) names its profile
+    # in the X-Profile-Id response header
+    folded = profiler.load(profile_id)
+    if folded is None:
+        raise HTTPException(404, "Profile not found")
+    if format == "svg":
+        return Response(profiler.flame_svg(folded), media_type="image/svg+xml")
+    return PlainTextResponse(folded)
@@ -1,4 +1,8 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import List
 
 class ParseRequest(BaseModel):
-    prompt: str
\ No newline at end of file
+    prompt: str
+
+class ParseBatchRequest(BaseModel):
+    prompts: List[str] = Field(..., max_length=10_000)
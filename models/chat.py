@@ -1,6 +1,6 @@
 # models/chat.py
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Dict, List, Optional
 
 class ChatCreate(BaseModel):
     message: str  # user's prompt
@@ -9,10 +9,16 @@ class ChatMessage(BaseModel):
     role: str  # "user" or "assistant"
     content: str
     timestamp: float
+    params: Optional[Dict[str, Any]] = None  # assistant replies: parsed request
+    seq: Optional[int] = None  # position in the chat
 
 class ChatResponse(BaseModel):
     chat_id: str
     messages: List[ChatMessage]
 
+class ChatHistoryPage(BaseModel):
+    messages: List[ChatMessage]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for older messages
+
 class MessageIn(BaseModel):
     message: str
\ No newline at end of file
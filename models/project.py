@@ -5,8 +5,10 @@ class ProjectCreate(BaseModel):
     name: str
     description: str
     sensor_type: str
+    model_id: Optional[str] = None  # pin a registry model instead of the sensor_type default
 
 class ProjectUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
-    sensor_type: Optional[str] = None
\ No newline at end of file
+    sensor_type: Optional[str] = None
+    model_id: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,28 @@
+# models/synth.py
+from pydantic import BaseModel, Field
+from typing import Optional, Union
+
+class JobCreate(BaseModel):
+    project_id: str
+    user_id: str
+    chat_id: str  # names the downloaded file, and the source of chat conditions
+    rows: Optional[int] = Field(None, ge=1, le=10_000_000)
+    # fleet mode instead of rows, as on /synth/generate
+    devices: Optional[int] = Field(None, ge=1, le=1_000_000)
+    start: Optional[str] = None
+    interval: Optional[Union[int, str]] = None  # seconds, or e.g. "15m"
+    duration: Optional[Union[int, str]] = None
+    batch_size: int = Field(2000, ge=100, le=100_000)
+    sharded: Optional[bool] = None
+    seed: Optional[int] = Field(None, ge=0)
+    format: str = Field("csv", pattern="^(csv|parquet|arrow)$")
+    compression: Optional[str] = Field(None, pattern="^(gzip|zstd)$")  # csv / arrow only
+    # write a dataset profile next to the output (GET /synth/jobs/{id}/profile)
+    profile: bool = False
+    # same conditions as /synth/generate
+    use_chat_conditions: bool = False
+    ac: Optional[str] = None
+    season: Optional[str] = None
+    indoor: Optional[str] = None
+    time: Optional[str] = None
+    location: Optional[str] = None
@@ -1,7 +1,7 @@
 # routers/ai_router.py
 from fastapi import APIRouter, HTTPException
-from models.ai import ParseRequest
-from services.ai_service import parse_and_respond
+from models.ai import ParseBatchRequest, ParseRequest
+from services.ai_service import parse_and_respond, parse_batch
 
 router = APIRouter(prefix="/ai", tags=["AI"])
 
@@ -11,4 +11,10 @@ def parse_endpoint(req: ParseRequest):
     if not req.prompt:
         raise HTTPException(status_code=400, detail="Prompt required")
     res = parse_and_respond(req.prompt)
-    return res
\ No newline at end of file
+    return res
+
+
+@router.post("/parse-batch")
+def parse_batch_endpoint(req: ParseBatchRequest):
+    # results line up with req.prompts; empty prompts get {"error": ...}
+    return {"results": parse_batch(req.prompts)}
@@ -1,39 +1,69 @@
 # routers/chat.py
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
 from models.chat import ChatCreate, MessageIn
 from services.chat_service import (
+    HISTORY_PAGE_MAX,
+    LIST_PAGE_MAX,
     create_chat,
     get_chat_list,
     get_chat_history,
     send_message,
 )
+from services.speculation import speculator
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
 @router.post("/create-chat/{project_id}/{user_id}")
-def create(project_id: str, user_id: str, data: ChatCreate):
-    res = create_chat(project_id, user_id, data.message)
+async def create(project_id: str, user_id: str, data: ChatCreate):
+    res = await create_chat(project_id, user_id, data.message)
     if not res:
         raise HTTPException(404, "Project not found or not yours")
     return res
 
 @router.get("/get-chat-list/{project_id}/{user_id}")
-def list_chats(project_id: str, user_id: str):
-    res = get_chat_list(project_id, user_id)
+async def list_chats(
+    project_id: str,
+    user_id: str,
+    # paginated: {"chats": [...], "next_cursor": ...}; without limit/cursor
+    # the plain list of every chat, as before
+    limit: Optional[int] = Query(None, ge=1, le=LIST_PAGE_MAX),
+    cursor: Optional[str] = None,
+):
+    try:
+        res = await get_chat_list(project_id, user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     if res is None:
         raise HTTPException(404, "Unauthorized")
-    return res
+    chats, next_cursor = res
+    if limit is None and cursor is None:
+        return chats
+    return {"chats": chats, "next_cursor": next_cursor}
 
 @router.get("/get-chat-history/{project_id}/{chat_id}/{user_id}")
-def history(project_id: str, chat_id: str, user_id: str):
-    res = get_chat_history(project_id, chat_id, user_id)
+async def history(
+    project_id: str,
+    chat_id: str,
+    user_id: str,
+    # newest `limit` messages; follow next_cursor for older ones (no limit = all)
+    limit: Optional[int] = Query(None, ge=1, le=HISTORY_PAGE_MAX),
+    cursor: Optional[str] = None,
+):
+    try:
+        res = await get_chat_history(project_id, chat_id, user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     if not res:
         raise HTTPException(404, "Chat not found")
     return res
 
 @router.post("/send-message/{project_id}/{chat_id}/{user_id}")
-def send(project_id: str, chat_id: str, user_id: str, payload: MessageIn):
-    res = send_message(project_id, chat_id, user_id, payload.message)
+async def send(project_id: str, chat_id: str, user_id: str, payload: MessageIn):
+    res = await send_message(project_id, chat_id, user_id, payload.message)
     if not res:
         raise HTTPException(400, "Failed to send")
+    # start sampling what the reply promises before the download is asked
+    # for (no-op unless SYNTH_SPECULATE=1)
+    speculator.start(project_id, chat_id, user_id, res["messages"][-1].get("params"))
     return res
\ No newline at end of file
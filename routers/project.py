@@ -1,27 +1,48 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
 from models.project import ProjectCreate, ProjectUpdate
-from services.project_service import create_project, get_user_projects, update_project, delete_project
+from services.project_cache import project_cache
+from services.project_service import (
+    LIST_PAGE_MAX, create_project, get_user_projects, update_project, delete_project,
+)
 
 router = APIRouter(prefix="/project", tags=["Projects"])
 
 @router.post("/create-project/{user_id}")
-def create(user_id: str, project: ProjectCreate):
-    return create_project(user_id, project)
+async def create(user_id: str, project: ProjectCreate):
+    return await create_project(user_id, project)
 
 @router.get("/get-project/{user_id}")
-def get_projects(user_id: str):
-    return get_user_projects(user_id)
+async def get_projects(
+    user_id: str,
+    # paginated: {"projects": [...], "next_cursor": ...}; without limit/cursor
+    # the plain list of every project, as before
+    limit: Optional[int] = Query(None, ge=1, le=LIST_PAGE_MAX),
+    cursor: Optional[str] = None,
+):
+    try:
+        projects, next_cursor = await get_user_projects(user_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if limit is None and cursor is None:
+        return projects
+    return {"projects": projects, "next_cursor": next_cursor}
 
 @router.put("/update-project/{project_id}/{user_id}")
-def update(project_id: str, user_id: str, update: ProjectUpdate):
-    res = update_project(project_id, user_id, update)
+async def update(project_id: str, user_id: str, update: ProjectUpdate):
+    res = await update_project(project_id, user_id, update)
     if not res:
         raise HTTPException(404, "Project not found or unauthorized")
     return res
 
 @router.delete("/delete-project/{project_id}/{user_id}")
-def delete(project_id: str, user_id: str):
-    res = delete_project(project_id, user_id)
+async def delete(project_id: str, user_id: str):
+    res = await delete_project(project_id, user_id)
     if not res:
         raise HTTPException(404, "Project not found or unauthorized")
-    return res
\ No newline at end of file
+    return res
+
+@router.get("/cache")
+async def cache_stats():
+    # ownership/metadata cache used by chat and generation requests
+    return project_cache.stats()
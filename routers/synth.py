@@ -1,31 +1,363 @@
 # routers/synth.py
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from services.synth_service import stream_synthetic_csv, ensure_model_loaded
+import asyncio
+import os
+from time import perf_counter
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from models.synth import JobCreate
+from services.synth_service import generation_slots, plan_generation, stream_plan
+from services.fleet import FleetSpec, plan_fleet
+from services.synth_cache import dataset_cache, etag_matches, iter_open_file, plan_key
+from services.chat_service import get_last_params
+from services.project_cache import project_cache
+from services.synth_formats import (
+    COMPRESSIBLE_FORMATS, COMPRESSION_SUFFIXES, EXTENSIONS, MEDIA_TYPES, negotiate_encoding,
+)
+from services.synth_jobs import DONE, SynthJob, iter_file, jobs, parse_range
+from services.synth_scheduler import Overloaded, generation_scheduler
+from services.model_registry import registry
+from services.row_pool import row_pools
+from services.speculation import Speculated, speculator
+from services.startup import startup
+from services.metrics import STAGE_SECONDS, track_generation
+from services.dataset_profile import DatasetProfile, profiles
 
 router = APIRouter(prefix="/synth", tags=["Synthesis"])
 
+async def _request_params(project_id: str, chat_id: str, user_id: str, use_chat_conditions: bool, **explicit):
+    # (owned project, params): the project and the chat are read concurrently.
+    # Chat conditions first, explicit query / body values override them.
+    reads = [project_cache.aowned(project_id, user_id)]
+    if use_chat_conditions:
+        reads.append(get_last_params(project_id, chat_id, user_id))
+    project, *chat_params = await asyncio.gather(*reads)
+    if project is None:
+        raise PermissionError("Unauthorized")
+    params = dict(chat_params[0] or {}) if chat_params else {}
+    params.update({k: v for k, v in explicit.items() if v is not None})
+    return project, params
+
+async def _await_model():
+    # right after a restart the default model may still be loading in the
+    # background: wait briefly, then fail fast instead of queueing behind it
+    if not await startup.wait("model"):
+        raise HTTPException(
+            status_code=503, detail="Model is still loading",
+            headers={"Retry-After": str(startup.retry_after())},
+        )
+
+def _fleet_spec(rows, devices, start, interval, duration) -> Optional[FleetSpec]:
+    # either `rows` independent rows, or a fleet of `devices` x timestamps
+    if devices is None:
+        if rows is None:
+            raise ValueError("rows is required (or devices, start, interval and duration for a fleet)")
+        if start is not None or interval is not None or duration is not None:
+            raise ValueError("start, interval and duration describe a fleet: pass devices too")
+        return None
+    if rows is not None:
+        raise ValueError("Pass rows or devices, not both: a fleet has one row per device and timestamp")
+    if start is None or interval is None or duration is None:
+        raise ValueError("A fleet needs start, interval and duration")
+    return plan_fleet(devices, start, interval, duration)
+
+def _timed_first_byte(stream, started: float, source: str):
+    # time-to-first-byte per source (pool / partial / live), for /synth/pool
+    first = True
+    for chunk in stream:
+        if first:
+            row_pools.record_ttfb(source, perf_counter() - started)
+            first = False
+        yield chunk
+
+def _sampled(plan, headers: dict, profile_user: Optional[str] = None, pooled=None):
+    # the plan's stream; a profiled generation (profile_user set) registers
+    # its profile under a new id, sent back as X-Generation-Id
+    if profile_user is None:
+        return stream_plan(plan, pooled=pooled)
+    generation_id, profile = profiles.start(profile_user)
+    headers["X-Generation-Id"] = generation_id
+    return profiles.track(generation_id, stream_plan(plan, profile=profile))
+
+def _plan_and_key(*args, **kwargs):
+    # a seeded plan's cache key hashes the model file the first time it is
+    # seen, so it is computed here on the threadpool, not on the event loop
+    plan = plan_generation(*args, **kwargs)
+    return plan, plan_key(plan) if plan.seed is not None else None
+
+def _hold_slot(ticket, make_stream):
+    # the generation slot is released when the stream ends (or fails to start)
+    try:
+        return generation_scheduler.hold(ticket, make_stream())
+    except BaseException:
+        generation_scheduler.release(ticket)
+        raise
+
 @router.get("/generate")
-def generate_csv(
+async def generate_csv(
     project_id: str,
     user_id: str,
     chat_id: str,  # include chat_id so filename uses it
-    rows: int = Query(..., ge=1, le=1_000_000),
+    rows: Optional[int] = Query(None, ge=1, le=1_000_000),
+    # fleet mode instead of rows: `devices` sensors, one reading each per
+    # `interval` from `start` (ISO 8601) for `duration`, in time order;
+    # interval / duration in seconds or with s/m/h/d (see services/fleet.py)
+    devices: Optional[int] = Query(None, ge=1, le=1_000_000),
+    start: Optional[str] = None,
+    interval: Optional[str] = None,
+    duration: Optional[str] = None,
     batch_size: int = Query(2000, ge=100, le=100_000),
+    # batches sampled ahead while the current one is sent (0 = no pipelining)
+    prefetch: Optional[int] = Query(None, ge=0, le=16),
+    # split rows across the process pool (default: by SYNTH_SHARD_MIN_ROWS)
+    sharded: Optional[bool] = None,
+    seed: Optional[int] = Query(None, ge=0),  # per-shard seeds derive from it
+    # seeded output is deterministic: served with an ETag, from the dataset cache
+    cache: bool = True,
+    format: str = Query("csv", pattern="^(csv|parquet|arrow)$"),
+    # conditions on discrete columns, same vocabulary as the chat parser;
+    # use_chat_conditions takes them from the chat's latest request and the
+    # explicit ones override it
+    use_chat_conditions: bool = False,
+    ac: Optional[str] = None,
+    season: Optional[str] = None,
+    indoor: Optional[str] = None,
+    time: Optional[str] = None,
+    location: Optional[str] = None,
+    # profile the rows as they are sampled (GET /synth/profiles/{X-Generation-Id});
+    # always samples: the warm pool, 304s and cache hits are skipped
+    profile: bool = False,
+    accept_encoding: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
 ):
+    started = perf_counter()
+    await _await_model()
     try:
-        # FAIL FAST here (no 200 until we know the model is loaded)
-        ensure_model_loaded()
+        content_encoding = negotiate_encoding(format, accept_encoding)
+        fleet = _fleet_spec(rows, devices, start, interval, duration)
+        project, params = await _request_params(
+            project_id, chat_id, user_id, use_chat_conditions,
+            ac=ac, season=season, indoor=indoor, time=time, location=location,
+        )
+        # FAIL FAST here: ownership, model resolution and loading all happen
+        # before the first byte, so errors still map to a status code. A
+        # model load blocks, so planning runs on the threadpool.
+        with STAGE_SECONDS.time(stage="plan"):
+            plan, key = await run_in_threadpool(
+                _plan_and_key, project_id, user_id, fleet.rows if fleet else rows, batch_size, prefetch,
+                sharded, seed, fmt=format, content_encoding=content_encoding, params=params, project=project,
+                fleet=fleet,
+            )
+        rows = plan.rows
+        filename = f"{chat_id}.{EXTENSIONS[format]}"
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"', "Vary": "Accept-Encoding"}
+        if content_encoding:
+            headers["Content-Encoding"] = content_encoding
+        profile_user = user_id if profile else None
+        if plan.seed is None:
+            # this chat's speculative generation or the warm pool first; a
+            # request they cover entirely takes no slot
+            pooled = None
+            if not profile:
+                pooled = speculator.take(plan, project_id, user_id, chat_id) or row_pools.take(plan)
+            speculative = isinstance(pooled, Speculated)
+            if pooled is not None and pooled.rows == rows:
+                source = "speculative" if speculative else "pool"
+                stream = track_generation(_sampled(plan, headers, pooled=pooled), rows)
+            else:
+                try:
+                    with STAGE_SECONDS.time(stage="slot_wait"):
+                        ticket = await generation_scheduler.acquire(
+                            user_id, rows - (pooled.rows if pooled else 0), slots=generation_slots(plan),
+                        )
+                except BaseException:
+                    (speculator if speculative else row_pools).restore(pooled)
+                    raise
+                source = "live" if pooled is None else ("speculative-partial" if speculative else "partial")
+                stream = _hold_slot(ticket, lambda: track_generation(
+                    _sampled(plan, headers, profile_user, pooled), rows,
+                ))
+            headers["X-Row-Pool"] = source
+            stream = _timed_first_byte(stream, started, source)
+            return StreamingResponse(stream, media_type=MEDIA_TYPES[format], headers=headers)
 
-        generator = stream_synthetic_csv(project_id, user_id, rows, batch_size)
-        filename = f"{chat_id}.csv"
-        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
-        return StreamingResponse(generator, media_type="text/csv", headers=headers)
+        headers["ETag"] = f'"{key}"'
+        if not profile and etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers={"ETag": headers["ETag"], "Vary": "Accept-Encoding"})
+        hit = dataset_cache.open(key) if cache and not profile else None
+        if hit is not None:
+            f, size = hit
+            headers["Content-Length"] = str(size)
+            headers["X-Cache"] = "HIT"
+            return StreamingResponse(iter_open_file(f), media_type=MEDIA_TYPES[format], headers=headers)
+        # only actual sampling takes a generation slot; 304s and hits don't
+        with STAGE_SECONDS.time(stage="slot_wait"):
+            ticket = await generation_scheduler.acquire(user_id, rows, slots=generation_slots(plan))
+        stream = _hold_slot(ticket, lambda: track_generation(
+            dataset_cache.store(key, _sampled(plan, headers, profile_user))
+            if cache else _sampled(plan, headers, profile_user), rows,
+        ))
+        headers["X-Cache"] = "MISS"
+        return StreamingResponse(stream, media_type=MEDIA_TYPES[format], headers=headers)
 
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except PermissionError:
         raise HTTPException(status_code=403, detail="Unauthorized")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except FileNotFoundError as e:
         # clean 500 before streaming
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate CSV: {e}")
+
+@router.get("/profiles/{generation_id}")
+def generation_profile(generation_id: str, user_id: str):
+    # the profile of a /synth/generate?profile=true download; 202 until its
+    # stream has ended (status "aborted" if the client went away early)
+    entry = profiles.get(generation_id, user_id)
+    if entry is None:
+        raise HTTPException(404, "Profile not found")
+    if entry["status"] == "running":
+        return JSONResponse(entry, status_code=202)
+    return entry
+
+@router.get("/models")
+def list_models():
+    # registry view: which models exist, which are resident and how big
+    return registry.stats()
+
+@router.get("/cache")
+def cache_stats():
+    return dataset_cache.stats()
+
+@router.get("/pool")
+def pool_stats():
+    # warm row pool: fill level, refill rate, hit rate, time to first byte
+    return row_pools.stats()
+
+@router.get("/speculation")
+def speculation_stats():
+    # speculative generations started from chat messages, and how many
+    # downloads attached to one
+    return speculator.stats()
+
+@router.get("/scheduler")
+def scheduler_stats():
+    # generation slots, queue depth, rejections and the torch thread budget
+    return generation_scheduler.stats()
+
+# ------------------------------------------------------------------
+# Asynchronous jobs: submit -> poll -> download (resumable with Range)
+# ------------------------------------------------------------------
+@router.post("/jobs")
+async def submit_job(req: JobCreate):
+    await _await_model()
+    try:
+        if req.compression and req.format not in COMPRESSIBLE_FORMATS:
+            raise ValueError(f"{req.format} output cannot be compressed")
+        fleet = _fleet_spec(req.rows, req.devices, req.start, req.interval, req.duration)
+        rows = fleet.rows if fleet else req.rows
+        project, params = await _request_params(
+            req.project_id, req.chat_id, req.user_id, req.use_chat_conditions,
+            ac=req.ac, season=req.season, indoor=req.indoor, time=req.time, location=req.location,
+        )
+        filename = f"{req.chat_id}.{EXTENSIONS[req.format]}"
+        media_type = MEDIA_TYPES[req.format]
+        if req.compression:
+            filename += "." + COMPRESSION_SUFFIXES[req.compression]
+            media_type = "application/octet-stream"
+        job = SynthJob(req.user_id, req.project_id, req.chat_id, rows, filename, media_type)
+        if req.profile:
+            job.profile = DatasetProfile()
+        # validated here (403/400 right away); sampling starts on a job worker
+        with STAGE_SECONDS.time(stage="plan"):
+            plan = await run_in_threadpool(
+                plan_generation, req.project_id, req.user_id, rows, req.batch_size, None, req.sharded, req.seed,
+                fmt=req.format, content_encoding=req.compression, params=params, project=project, fleet=fleet,
+            )
+        job.slots = generation_slots(plan)
+        chunks = stream_plan(plan, jobs.progress_callback(job), profile=job.profile)
+        return jobs.submit(job, track_generation(chunks, rows)).to_dict()
+
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Unauthorized")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to submit job: {e}")
+
+@router.get("/jobs")
+def list_jobs(user_id: str):
+    return [j.to_dict() for j in jobs.for_user(user_id)]
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str, user_id: str):
+    job = jobs.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job.to_dict()
+
+@router.delete("/jobs/{job_id}")
+def cancel_job(job_id: str, user_id: str):
+    # cancels a pending job, or deletes a finished one's file
+    job = jobs.cancel(job_id, user_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return job.to_dict()
+
+@router.get("/jobs/{job_id}/profile")
+def job_profile(job_id: str, user_id: str):
+    job = jobs.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    if job.profile is None:
+        raise HTTPException(404, "Job was not profiled")
+    if job.status != DONE:
+        raise HTTPException(409, f"Job is {job.status}")
+    if not os.path.exists(job.profile_path):
+        raise HTTPException(410, "Job output expired")
+    return FileResponse(job.profile_path, media_type="application/json")
+
+@router.get("/jobs/{job_id}/download")
+def download_job(
+    job_id: str,
+    user_id: str,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+):
+    job = jobs.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    if job.status != DONE:
+        raise HTTPException(409, f"Job is {job.status}")
+    try:
+        size = os.path.getsize(job.path)
+    except OSError:
+        raise HTTPException(410, "Job output expired")
+
+    etag = f'"{job.job_id}"'  # the spooled file never changes
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="{job.filename}"',
+    }
+    if if_range is not None and if_range != etag:
+        range = None  # a different file than the client's partial copy: send it all
+    try:
+        span = parse_range(range, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if span is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(iter_file(job.path, 0, size - 1), media_type=job.media_type, headers=headers)
+    start, end = span
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file(job.path, start, end), status_code=206, media_type=job.media_type, headers=headers,
+    )
@@ -1,23 +1,41 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from models.user import UserCreate, UserLogin, UserUpdate
 from services.user_service import create_user, login_user, update_user
 
 router = APIRouter(prefix="/users", tags=["Users"])
+# sign-up and login: mounted without the bearer-token check (main.py), since
+# callers have no token yet
+public_router = APIRouter(prefix="/users", tags=["Users"])
 
-@router.post("/create-users")
-def create(user: UserCreate):
+@public_router.post("/create-users")
+async def create(user: UserCreate):
     try:
-        return create_user(user)
+        return await create_user(user)
     except Exception as e:
         raise HTTPException(400, str(e))
 
-@router.post("/get-users")
-def login(login: UserLogin):
-    user = login_user(login)
+@public_router.post("/get-users")
+async def login(login: UserLogin):
+    user = await login_user(login)
     if not user:
         raise HTTPException(401, "Invalid credentials")
     return user
 
+@router.get("/me")
+def me(request: Request):
+    # identity from the verified bearer token, without a Firestore read
+    claims = getattr(request.state, "auth", None)
+    if claims is None:
+        raise HTTPException(401, "Bearer token required", headers={"WWW-Authenticate": "Bearer"})
+    return {
+        "uid": claims["uid"],
+        "email": claims.get("email"),
+        "email_verified": claims.get("email_verified"),
+        "name": claims.get("name"),
+        "auth_time": claims.get("auth_time"),
+        "expires_at": claims["exp"],
+    }
+
 @router.put("/update-users/{uid}")
-def update(uid: str, update: UserUpdate):
-    return update_user(uid, update.name, update.password)
\ No newline at end of file
+async def update(uid: str, update: UserUpdate):
+    return await update_user(uid, update.name, update.password)
\ No newline at end of file
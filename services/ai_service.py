@@ -1,7 +1,9 @@
 # services/ai_service.py
+import os
 import re
 import json
-from typing import Dict, Any, Optional
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
 
 # Patterns
 TIME_RANGE_REGEX = re.compile(
@@ -20,112 +22,123 @@ SEASON_KEYWORDS = {
 
 LOCATION_PREPS = ["in", "at", "for", "near", "around"]
 
+# checked in this order; the first one present wins
+REQUEST_TYPES = ["temperature", "temp", "humidity", "pressure", "wind", "co2", "pm2.5", "pm10", "light", "sound"]
+REQUEST_TYPE_ALIASES = {"temp": "temperature"}
+AC_MENTIONS = ["ac", "air conditioner"]
+
+# parsed prompts remembered (chat replays, batch re-submissions)
+AI_PARSE_CACHE_SIZE = int(os.getenv("AI_PARSE_CACHE_SIZE", "4096"))
+
+AC_STATE_REGEX = re.compile(r"\b(?:ac|air conditioner)[^\w]{0,5}?(is\s*)?(on|off)\b")
+AC_SETPOINT_REGEX = re.compile(r"\b(?:ac|air conditioner)[^\d]{0,6}(\d{1,2}(?:\.\d)?\s?(?:c|f)?)\b")
+AC_COMMAND_REGEX = re.compile(r"\b(turn|switch|set)\s+(on|off|to)\s+(ac|air conditioner)\b")
+INDOOR_REGEX = re.compile(r"\b(indoor|inside|indoors|home|inside use)\b")
+OUTDOOR_REGEX = re.compile(r"\b(outdoor|outside|outdoors)\b")
+LOCATION_PREP_REGEX = re.compile(r"\b(" + "|".join(LOCATION_PREPS) + r")(?=\s)")
+LOCATION_TAIL_REGEX = re.compile(r"\s+([A-Z]?[a-zA-Z0-9\-\s\.]+)")
+LOCATION_STOP_REGEX = re.compile(r"\b(at|from|between|and|for|with)\b")
+CAPITALISED_REGEX = re.compile(r"[A-Z][a-z]{2,}")
+DIGIT_REGEX = re.compile(r"\d")
+
+
+# (field, [(keyword, value), ...]) in priority order: a field takes the
+# value of its first keyword that occurs anywhere in the lowered prompt.
+# Substring tests on one lowered copy are cheaper in CPython than a regex
+# alternation over the same keywords.
+KEYWORD_TABLE = [
+    ("request_type", [(c, REQUEST_TYPE_ALIASES.get(c, c)) for c in REQUEST_TYPES]),
+    ("season", [(kw, season) for season, kws in SEASON_KEYWORDS.items() for kw in kws]),
+    ("ac", [(kw, True) for kw in AC_MENTIONS]),
+]
+
+def _scan_keywords(low: str) -> Dict[str, Any]:
+    found: Dict[str, Any] = {}
+    for field, pairs in KEYWORD_TABLE:
+        for keyword, value in pairs:
+            if keyword in low:
+                found[field] = value
+                break
+    return found
+
 def _extract_time(prompt: str) -> Optional[str]:
-    m = TIME_RANGE_REGEX.search(prompt)
-    if m:
-        a, b = m.group(1).strip(), m.group(2).strip()
-        return f"{a} - {b}"
-    m2 = SINGLE_TIME_REGEX.search(prompt)
-    if m2:
-        return m2.group(2).strip()
+    if DIGIT_REGEX.search(prompt):  # both clock patterns need a digit
+        m = TIME_RANGE_REGEX.search(prompt)
+        if m:
+            a, b = m.group(1).strip(), m.group(2).strip()
+            return f"{a} - {b}"
+        m2 = SINGLE_TIME_REGEX.search(prompt)
+        if m2:
+            return m2.group(2).strip()
     m3 = TIME_WORDS_REGEX.search(prompt)
     if m3:
         return m3.group(1).lower()
     return None
 
 def _extract_location(prompt: str) -> Optional[str]:
+    # preposition order decides, then position: the first occurrence of a
+    # preposition that is followed by a place-like tail
+    found: Dict[str, List[int]] = {}
+    for m in LOCATION_PREP_REGEX.finditer(prompt):
+        found.setdefault(m.group(1), []).append(m.end())
     for p in LOCATION_PREPS:
-        pattern = rf"\b{p}\s+([A-Z]?[a-zA-Z0-9\-\s\.]+)"
-        m = re.search(pattern, prompt)
-        if m:
+        for end in found.get(p, ()):
+            m = LOCATION_TAIL_REGEX.match(prompt, end)
+            if m is None:
+                continue
             candidate = m.group(1).split(",")[0].strip()
-            candidate = re.split(r"\b(at|from|between|and|for|with)\b", candidate)[0].strip()
+            candidate = LOCATION_STOP_REGEX.split(candidate)[0].strip()
             if candidate:
                 return candidate.title()
-    tokens = re.findall(r"[A-Z][a-z]{2,}", prompt)
+            break
+    tokens = CAPITALISED_REGEX.findall(prompt)
     if tokens:
         return " ".join(tokens[:2])
     return None
 
-def _extract_ac(prompt: str) -> Optional[str]:
-    low = prompt.lower()
-    if "ac" not in low and "air conditioner" not in low:
+def _extract_ac(low: str, mentioned: bool) -> Optional[str]:
+    if not mentioned:
         return None
-    m = re.search(r"\b(?:ac|air conditioner)[^\w]{0,5}?(is\s*)?(on|off)\b", low)
+    m = AC_STATE_REGEX.search(low)
     if m:
         return m.group(2)
-    m2 = re.search(r"\b(?:ac|air conditioner)[^\d]{0,6}(\d{1,2}(?:\.\d)?\s?(?:c|f)?)\b", low)
+    m2 = AC_SETPOINT_REGEX.search(low)
     if m2:
         return m2.group(1).replace(" ", "").upper()
-    m3 = re.search(r"\b(turn|switch|set)\s+(on|off|to)\s+(ac|air conditioner)\b", low)
+    m3 = AC_COMMAND_REGEX.search(low)
     if m3:
         return m3.group(2)
     return "mentioned"
 
-def _extract_season(prompt: str) -> Optional[str]:
-    low = prompt.lower()
-    for season, kws in SEASON_KEYWORDS.items():
-        for kw in kws:
-            if kw in low:
-                return season
-    return None
-
-def _extract_indoor(prompt: str) -> Optional[str]:
-    low = prompt.lower()
-    if re.search(r"\b(indoor|inside|indoors|home|inside use)\b", low):
+def _extract_indoor(low: str) -> Optional[str]:
+    if ("in" in low or "home" in low) and INDOOR_REGEX.search(low):
         return "indoor"
-    if re.search(r"\b(outdoor|outside|outdoors)\b", low):
+    if "out" in low and OUTDOOR_REGEX.search(low):
         return "outdoor"
     return None
 
-def _extract_request_type(prompt: str) -> Optional[str]:
-    low = prompt.lower()
-    candidates = [
-        "temperature",
-        "temp",
-        "humidity",
-        "pressure",
-        "wind",
-        "co2",
-        "pm2.5",
-        "pm10",
-        "light",
-        "sound",
-    ]
-    for c in candidates:
-        if c in low:
-            if c == "temp":
-                return "temperature"
-            return c
-    return None
+_FIELDS = ("ac", "request_type", "location", "time", "season", "indoor")
+_CONFIDENCE = {"request_type": 100, "ac": 90, "time": 90, "location": 80, "season": 80, "indoor": 80}
+
+@lru_cache(maxsize=AI_PARSE_CACHE_SIZE)
+def _parse_fields(prompt: str) -> Tuple[Optional[str], ...]:
+    low = prompt.lower()  # lowered once, shared by every extractor
+    keywords = _scan_keywords(low)
+    return (
+        _extract_ac(low, keywords.get("ac", False)),
+        keywords.get("request_type"),
+        _extract_location(prompt),
+        _extract_time(prompt),
+        keywords.get("season"),
+        _extract_indoor(low),
+    )
 
 def parse_prompt(prompt: str) -> Dict[str, Any]:
     if not prompt or not prompt.strip():
         raise ValueError("Empty prompt")
-    request_type = _extract_request_type(prompt)
-    ac = _extract_ac(prompt)
-    time_expr = _extract_time(prompt)
-    location = _extract_location(prompt)
-    season = _extract_season(prompt)
-    indoor = _extract_indoor(prompt)
-    conf = {
-        "request_type": 100 if request_type else 0,
-        "ac": 90 if ac else 0,
-        "time": 90 if time_expr else 0,
-        "location": 80 if location else 0,
-        "season": 80 if season else 0,
-        "indoor": 80 if indoor else 0,
-    }
-    return {
-        "ac": ac,
-        "request_type": request_type,
-        "location": location,
-        "time": time_expr,
-        "season": season,
-        "indoor": indoor,
-        "raw_prompt": prompt,
-        "confidence": conf,
-    }
+    values = dict(zip(_FIELDS, _parse_fields(prompt)))
+    conf = {key: score if values[key] else 0 for key, score in _CONFIDENCE.items()}
+    return {**values, "raw_prompt": prompt, "confidence": conf}
 
 def format_reply(params: Dict[str, Any]) -> str:
     req = params.get("request_type") or "requested data"
@@ -155,6 +168,16 @@ def parse_and_respond(prompt: str) -> Dict[str, Any]:
     message = format_reply(parsed)
     return {"params": parsed, "message": message}
 
+def parse_batch(prompts: List[str]) -> List[Dict[str, Any]]:
+    # one result per prompt, in order; unparseable prompts get an error entry
+    results = []
+    for prompt in prompts:
+        try:
+            results.append(parse_and_respond(prompt))
+        except ValueError as e:
+            results.append({"error": str(e)})
+    return results
+
 # quick test
 if __name__ == "__main__":
     print(parse_and_respond("Generate a temperate data in chennai from 3-4 pm"))
@@ -0,0 +1,339 @@
+# services/auth.py
+# Bearer-token authentication with Firebase ID tokens, verified locally: the
+# RS256 signature is checked against Google's signing certificates, kept in
+# memory until their Cache-Control max-age runs out (or a token names a key
+# we don't have yet, i.e. the keys rotated), and the claims are checked as
+# Firebase documents them (aud / iss = the project, exp, iat, auth_time,
+# sub). A verified token's claims are then cached for
+# SYNTH_AUTH_CLAIMS_TTL_SECONDS, so a request costs a dictionary lookup, not
+# a round trip. Revocation is not seen locally: a revoked token is accepted
+# until it expires (Firebase ID tokens live an hour).
+#
+# SYNTH_AUTH=off (default) leaves the API as it was; "optional" checks a
+# token when one is sent; "required" refuses requests without one. A
+# verified token must belong to the user_id / uid the request names (path,
+# query or JSON body). SYNTH_AUTH_CERTS may be a file holding
+# {"kid": "PEM certificate", ...} instead of the URL, for offline use with
+# keys from tools/dev_auth.py. Check counts and key refreshes are exported
+# on /metrics (auth_token_checks_total, auth_signing_key_refreshes_total).
+import base64
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from services.metrics import AUTH_CHECKS_TOTAL, AUTH_KEY_REFRESHES_TOTAL
+
+load_dotenv()
+
+SYNTH_AUTH = os.getenv("SYNTH_AUTH", "off").lower()  # off | optional | required
+SYNTH_AUTH_CERTS = os.getenv(
+    "SYNTH_AUTH_CERTS", "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com",
+)
+SYNTH_AUTH_PROJECT_ID = os.getenv("SYNTH_AUTH_PROJECT_ID", "")  # default: FIREBASE_CREDENTIALS' project
+SYNTH_AUTH_CLAIMS_TTL_SECONDS = float(os.getenv("SYNTH_AUTH_CLAIMS_TTL_SECONDS", "300"))
+SYNTH_AUTH_CLAIMS_CACHE_SIZE = int(os.getenv("SYNTH_AUTH_CLAIMS_CACHE_SIZE", "10000"))
+SYNTH_AUTH_CLOCK_SKEW_SECONDS = float(os.getenv("SYNTH_AUTH_CLOCK_SKEW_SECONDS", "30"))
+# an unknown key id re-fetches the keys at most this often
+SYNTH_AUTH_KEYS_MIN_REFRESH_SECONDS = float(os.getenv("SYNTH_AUTH_KEYS_MIN_REFRESH_SECONDS", "30"))
+# how long keys from a file (or a response without max-age) are kept
+SYNTH_AUTH_KEYS_DEFAULT_MAX_AGE = float(os.getenv("SYNTH_AUTH_KEYS_DEFAULT_MAX_AGE", "3600"))
+
+_ISSUER = "https://securetoken.google.com/"
+
+
+class AuthError(Exception):
+    """The token is missing, malformed, expired or not signed by a known key."""
+
+
+def _b64decode(part: str) -> bytes:
+    return base64.urlsafe_b64decode(part + "=" * (-len(part) % 4))
+
+
+def _max_age(cache_control: Optional[str]) -> Optional[float]:
+    for directive in (cache_control or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age" and value.isdigit():
+            return float(value)
+    return None
+
+
+def default_project_id() -> str:
+    if SYNTH_AUTH_PROJECT_ID:
+        return SYNTH_AUTH_PROJECT_ID
+    path = os.getenv("FIREBASE_CREDENTIALS")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("project_id", "")
+    except (TypeError, OSError, ValueError):
+        return ""
+
+
+class SigningKeys:
+    """Public keys by key id, from the certificate URL or a local file."""
+
+    def __init__(self, source: str = SYNTH_AUTH_CERTS):
+        self.source = source
+        self._lock = threading.Lock()
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self.refreshes = 0
+
+    def _fetch(self) -> Tuple[Dict[str, str], float]:
+        if self.source.startswith(("http://", "https://")):
+            with urllib.request.urlopen(self.source, timeout=10) as resp:
+                certs = json.load(resp)
+                max_age = _max_age(resp.headers.get("Cache-Control"))
+        else:
+            with open(self.source, encoding="utf-8") as f:
+                certs = json.load(f)
+            max_age = None
+        return certs, SYNTH_AUTH_KEYS_DEFAULT_MAX_AGE if max_age is None else max_age
+
+    def needs_refresh(self, kid: Optional[str] = None) -> bool:
+        now = time.monotonic()
+        if now >= self._expires_at:
+            return True
+        # an unknown key id: the keys may have rotated (rate limited, so
+        # made-up key ids cannot hammer the certificate endpoint)
+        return kid is not None and kid not in self._keys and now - self._fetched_at >= SYNTH_AUTH_KEYS_MIN_REFRESH_SECONDS
+
+    def refresh(self, kid: Optional[str] = None) -> None:
+        from cryptography import x509
+        with self._lock:
+            if not self.needs_refresh(kid):
+                return  # another thread just did
+            self._fetched_at = time.monotonic()
+            try:
+                certs, max_age = self._fetch()
+                keys = {k: x509.load_pem_x509_certificate(pem.encode()).public_key() for k, pem in certs.items()}
+            except Exception as e:
+                # keep serving with the keys we have; try again shortly
+                print(f"[auth] could not refresh signing keys from {self.source}: {e}")
+                self._expires_at = self._fetched_at + SYNTH_AUTH_KEYS_MIN_REFRESH_SECONDS
+                return
+            self._keys = keys
+            self._expires_at = self._fetched_at + max_age
+            self.refreshes += 1
+        AUTH_KEY_REFRESHES_TOTAL.inc()
+
+    def get(self, kid: str):
+        return self._keys.get(kid)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class TokenVerifier:
+    def __init__(
+        self,
+        project_id: Optional[str] = None,
+        keys: Optional[SigningKeys] = None,
+        ttl: float = SYNTH_AUTH_CLAIMS_TTL_SECONDS,
+        cache_size: int = SYNTH_AUTH_CLAIMS_CACHE_SIZE,
+    ):
+        self._project_id = project_id
+        self.keys = keys or SigningKeys()
+        self.ttl = ttl
+        self.cache_size = max(1, cache_size)
+        self._lock = threading.Lock()
+        # token -> (claims, monotonic time the entry expires)
+        self._claims: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    @property
+    def project_id(self) -> str:
+        if self._project_id is None:
+            self._project_id = default_project_id()
+        return self._project_id
+
+    # -- claims cache --------------------------------------------------------
+    def cached(self, token: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            hit = self._claims.get(token)
+            if hit is not None and hit[1] > time.monotonic():
+                self._claims.move_to_end(token)
+                self.hits += 1
+                AUTH_CHECKS_TOTAL.inc(result="cached")
+                return hit[0]
+            if hit is not None:
+                del self._claims[token]
+        return None
+
+    def _remember(self, token: str, claims: Dict[str, Any]) -> None:
+        # never past the token's own expiry
+        lifetime = min(self.ttl, claims["exp"] - time.time())
+        if lifetime <= 0:
+            return
+        with self._lock:
+            self._claims[token] = (claims, time.monotonic() + lifetime)
+            self._claims.move_to_end(token)
+            while len(self._claims) > self.cache_size:
+                self._claims.popitem(last=False)
+
+    # -- verification --------------------------------------------------------
+    @staticmethod
+    def key_id(token: str) -> Optional[str]:
+        try:
+            return json.loads(_b64decode(token.split(".", 1)[0])).get("kid")
+        except (ValueError, AttributeError):
+            return None
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """The token's claims (plus "uid"); AuthError if it is not valid.
+        May fetch the signing keys (blocking); see averify."""
+        claims = self.cached(token)
+        if claims is not None:
+            return claims
+        try:
+            claims = self._verify(token)
+        except AuthError:
+            with self._lock:
+                self.failures += 1
+            AUTH_CHECKS_TOTAL.inc(result="rejected")
+            raise
+        with self._lock:
+            self.misses += 1
+        AUTH_CHECKS_TOTAL.inc(result="verified")
+        self._remember(token, claims)
+        return claims
+
+    async def averify(self, token: str) -> Dict[str, Any]:
+        # cached claims and known keys need no thread; a key fetch does
+        claims = self.cached(token)
+        if claims is not None:
+            return claims
+        kid = self.key_id(token)
+        if self.keys.needs_refresh(kid):
+            from starlette.concurrency import run_in_threadpool
+            await run_in_threadpool(self.keys.refresh, kid)
+        return self.verify(token)
+
+    def _verify(self, token: str) -> Dict[str, Any]:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        parts = token.split(".")
+        if len(parts) != 3:
+            raise AuthError("Malformed token")
+        try:
+            header = json.loads(_b64decode(parts[0]))
+            claims = json.loads(_b64decode(parts[1]))
+            signature = _b64decode(parts[2])
+        except ValueError:
+            raise AuthError("Malformed token")
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise AuthError("Malformed token")
+        if header.get("alg") != "RS256":
+            raise AuthError("Token must be signed with RS256")
+        kid = header.get("kid")
+        if not kid:
+            raise AuthError("Token has no key id")
+        if self.keys.needs_refresh(kid):
+            self.keys.refresh(kid)
+        key = self.keys.get(kid)
+        if key is None:
+            raise AuthError("Token is signed by an unknown key")
+        try:
+            key.verify(signature, f"{parts[0]}.{parts[1]}".encode(), padding.PKCS1v15(), hashes.SHA256())
+        except InvalidSignature:
+            raise AuthError("Invalid token signature")
+
+        now, skew = time.time(), SYNTH_AUTH_CLOCK_SKEW_SECONDS
+        project_id = self.project_id
+        if not project_id:
+            raise AuthError("No Firebase project configured to verify tokens for")
+        if claims.get("aud") != project_id:
+            raise AuthError("Token was issued for another project")
+        if claims.get("iss") != _ISSUER + project_id:
+            raise AuthError("Token has the wrong issuer")
+        for name in ("exp", "iat"):
+            if not isinstance(claims.get(name), (int, float)):
+                raise AuthError(f"Token has no {name}")
+        if claims["exp"] <= now - skew:
+            raise AuthError("Token has expired")
+        if claims["iat"] > now + skew:
+            raise AuthError("Token is not valid yet")
+        if isinstance(claims.get("auth_time"), (int, float)) and claims["auth_time"] > now + skew:
+            raise AuthError("Token has a future auth_time")
+        sub = claims.get("sub")
+        if not isinstance(sub, str) or not sub or len(sub) > 128:
+            raise AuthError("Token has no valid subject")
+        claims["uid"] = sub
+        return claims
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            checks = self.hits + self.misses
+            return {
+                "mode": SYNTH_AUTH,
+                "project_id": self.project_id,
+                "keys": len(self.keys),
+                "key_refreshes": self.keys.refreshes,
+                "cached_claims": len(self._claims),
+                "hits": self.hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "hit_rate": round(self.hits / checks, 4) if checks else 0.0,
+            }
+
+
+verifier = TokenVerifier()
+
+
+# ------------------------------------------------------------------
+# FastAPI dependency
+# ------------------------------------------------------------------
+_USER_FIELDS = ("user_id", "uid")
+
+
+async def _named_users(request: Request) -> set:
+    # every user id the request names: path, query and top-level JSON body
+    named = {request.path_params[k] for k in _USER_FIELDS if k in request.path_params}
+    named |= {v for k in _USER_FIELDS for v in request.query_params.getlist(k)}
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            body = await request.json()  # cached on the request for the handler
+        except ValueError:
+            body = None
+        if isinstance(body, dict):
+            named |= {body[k] for k in _USER_FIELDS if isinstance(body.get(k), str)}
+    return named
+
+
+async def authenticate(request: Request) -> Optional[Dict[str, Any]]:
+    """Router dependency: the verified claims of the request's bearer token
+    (also on request.state.auth), or None when auth is off / no token was
+    sent in optional mode."""
+    request.state.auth = None
+    if SYNTH_AUTH not in ("optional", "required"):
+        return None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if not token:
+        if SYNTH_AUTH == "required":
+            raise HTTPException(401, "Bearer token required", headers={"WWW-Authenticate": "Bearer"})
+        return None
+    if scheme.lower() != "bearer":
+        raise HTTPException(401, "Use a Bearer token", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        claims = await verifier.averify(token.strip())
+    except AuthError as e:
+        raise HTTPException(401, str(e), headers={"WWW-Authenticate": 'Bearer error="invalid_token"'})
+    if any(uid != claims["uid"] for uid in await _named_users(request)):
+        raise HTTPException(403, "Token does not belong to this user")
+    request.state.auth = claims
+    return claims
+
+
+def warm() -> None:
+    # startup phase: fetch the signing keys before the first request needs them
+    if SYNTH_AUTH in ("optional", "required"):
+        verifier.keys.refresh()
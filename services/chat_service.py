@@ -1,98 +1,340 @@
 # services/chat_service.py
-from utils.firebase import db
-from services.ai_service import parse_and_respond
+from utils.firebase import adb
+from services.metrics import FIRESTORE_SECONDS
+from services.ai_service import parse_and_respond, parse_prompt
+from services.project_cache import project_cache
+from utils.pagination import decode_cursor, encode_cursor
+from google.cloud.firestore_v1 import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core.exceptions import AlreadyExists, NotFound
+import google.cloud.firestore as firestore
+import asyncio
+import random
 import time
-from typing import List
+from typing import List, Optional, Tuple
 
-def create_chat(project_id: str, user_id: str, first_message: str):
+# Storage layout
+#   projects/{project_id}/chats/{chat_id}
+#       {created_at, name, preview, last_message, message_count, updated_at}
+#   projects/{project_id}/chats/{chat_id}/messages/{seq:010d}
+#       {seq, role, content, timestamp[, params]}
+# Messages are append-only: a send reads only the chat's message_count (at
+# the same time as the ownership check) and writes the new message documents
+# plus the new count in one batch, so its cost does not grow with the
+# history. The message documents are created with an exists=False
+# precondition: if a concurrent send already took those seq numbers the whole
+# batch fails, and it is retried with a fresh count (_APPEND_ATTEMPTS), so
+# concurrent sends cannot overwrite each other.
+#
+# Chats written before this layout keep their history in a "messages" array
+# on the chat document (and have no message_count). They are still readable
+# as-is and are moved to the subcollection by migrate_chat, which runs on
+# their next send, or in bulk with `python -m tools.migrate_chats`.
+#
+# preview / last_message are short denormalised copies (PREVIEW_CHARS) kept
+# up to date on every write, so the chat list can be served from a field
+# projection without touching messages.
+MESSAGES = "messages"
+HISTORY_PAGE_MAX = 500
+LIST_PAGE_MAX = 200
+PREVIEW_CHARS = 60
+_LIST_FIELDS = ["name", "preview", "last_message", "created_at", "updated_at"]
+_MIGRATE_BATCH = 400  # Firestore batches take at most 500 writes
+_APPEND_ATTEMPTS = 10
+_APPEND_BACKOFF = 0.01  # seconds, doubled per conflict
+
+
+def _chat_ref(project_id: str, chat_id: str):
+    return (
+        adb.collection("projects")
+        .document(project_id)
+        .collection("chats")
+        .document(chat_id)
+    )
+
+
+def _message_id(seq: int) -> str:
+    return f"{seq:010d}"  # zero-padded so ids sort like seq
+
+
+async def _owns_project(project_id: str, user_id: str) -> bool:
+    return await project_cache.aowned(project_id, user_id) is not None
+
+
+async def create_chat(project_id: str, user_id: str, first_message: str):
     # ownership check …
     chat_ref = (
-        db.collection("projects")
+        adb.collection("projects")
         .document(project_id)
         .collection("chats")
         .document()
     )
-    chat_ref.set(
+    now = time.time()
+    batch = adb.batch()
+    batch.set(
+        chat_ref,
         {
-            "created_at": time.time(),
-            "name": first_message,                    
-            "messages": [
-                {"role": "user", "content": first_message, "timestamp": time.time()}
-            ],
-        }
+            "created_at": now,
+            "name": first_message,
+            "preview": first_message[:PREVIEW_CHARS],
+            "last_message": first_message[:PREVIEW_CHARS],
+            "message_count": 1,
+            "updated_at": now,
+        },
+    )
+    batch.set(
+        chat_ref.collection(MESSAGES).document(_message_id(0)),
+        {"seq": 0, "role": "user", "content": first_message, "timestamp": now},
     )
+    with FIRESTORE_SECONDS.time(op="chat_create"):
+        await batch.commit()
     return {"chat_id": chat_ref.id}
 
 
-def get_chat_list(project_id: str, user_id: str):
+async def get_chat_list(
+    project_id: str,
+    user_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Newest chats first: (page, next_cursor). Only the list fields are read."""
     # ownership check …
-    chats = (
-        db.collection("projects")
+    query = (
+        adb.collection("projects")
         .document(project_id)
         .collection("chats")
+        .select(_LIST_FIELDS)
         .order_by("created_at", direction="DESCENDING")
-        .stream()
+        .order_by(FieldPath.document_id(), direction="DESCENDING")  # tie-break
     )
+    if cursor is not None:
+        created_at, chat_id = decode_cursor(cursor, 2)
+        query = query.start_after({"created_at": created_at, "__name__": chat_id})
+    if limit is not None:
+        query = query.limit(limit)
     result = []
-    for c in chats:
+    last = None
+    with FIRESTORE_SECONDS.time(op="chat_list"):
+        docs = [c async for c in query.stream()]
+    for c in docs:
         data = c.to_dict()
-        preview = data.get("name") or (data.get("messages") or [{}])[0].get("content", "")[:60]
-        result.append({"chat_id": c.id, "preview": preview})
-    return result
+        # chats created before the preview field fall back to their name
+        preview = data.get("preview") or (data.get("name") or "")[:PREVIEW_CHARS]
+        result.append({
+            "chat_id": c.id,
+            "preview": preview,
+            "last_message": data.get("last_message") or preview,
+            "created_at": data.get("created_at"),
+            "updated_at": data.get("updated_at") or data.get("created_at"),
+        })
+        last = (data.get("created_at"), c.id)
+    next_cursor = encode_cursor(list(last)) if limit is not None and len(result) == limit else None
+    return result, next_cursor
 
 
-def get_chat_history(project_id: str, chat_id: str, user_id: str):
+def _parse_cursor(cursor: Optional[str]) -> Optional[int]:
+    # the seq of the oldest message already returned
+    if cursor is None:
+        return None
+    (seq,) = decode_cursor(cursor, 1)
+    if not isinstance(seq, int) or seq < 0:
+        raise ValueError("Invalid cursor")
+    return seq
+
+
+def _page(messages: List[dict], first_seq: int, has_more: bool) -> dict:
+    return {
+        "messages": messages,
+        "next_cursor": encode_cursor([first_seq]) if has_more and messages else None,
+    }
+
+
+async def get_chat_history(
+    project_id: str,
+    chat_id: str,
+    user_id: str,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+):
+    """Messages oldest-first. With `limit`, the newest `limit` messages before
+    `cursor`; pass the returned next_cursor to get the page before that."""
     # ownership check …
-    doc = (
-        db.collection("projects")
-        .document(project_id)
-        .collection("chats")
-        .document(chat_id)
-        .get()
-    )
+    before = _parse_cursor(cursor)
+    chat_ref = _chat_ref(project_id, chat_id)
+    with FIRESTORE_SECONDS.time(op="chat_get"):
+        doc = await chat_ref.get(field_paths=["message_count"])
     if not doc.exists:
         return None
+    if doc.to_dict().get("message_count") is None:
+        return await _legacy_history(chat_ref, limit, before)
+
+    query = chat_ref.collection(MESSAGES)
+    if before is not None:
+        query = query.where(filter=FieldFilter("seq", "<", before))
+    if limit is None:
+        with FIRESTORE_SECONDS.time(op="chat_history"):
+            messages = [m.to_dict() async for m in query.order_by("seq").stream()]
+        return _page(messages, 0, False)
+    with FIRESTORE_SECONDS.time(op="chat_history"):
+        page = [m.to_dict() async for m in query.order_by("seq", direction="DESCENDING").limit(limit).stream()]
+    page.reverse()
+    first_seq = page[0]["seq"] if page else 0
+    return _page(page, first_seq, first_seq > 0)
+
+
+async def _legacy_history(chat_ref, limit: Optional[int], before: Optional[int]):
+    with FIRESTORE_SECONDS.time(op="chat_history"):
+        doc = await chat_ref.get(field_paths=[MESSAGES])
+    history = (doc.to_dict() or {}).get(MESSAGES, [])
+    end = len(history) if before is None else min(before, len(history))
+    start = 0 if limit is None else max(0, end - limit)
+    messages = [{**m, "seq": seq} for seq, m in enumerate(history[start:end], start)]
+    return _page(messages, start, start > 0)
+
+
+async def migrate_chat(chat_ref) -> bool:
+    """Move a legacy chat's "messages" array into the messages subcollection.
+
+    Idempotent and safe to run concurrently: message documents are written
+    with their array index as seq, and only the first run to finish sets
+    message_count and drops the array. Returns True if this call did so.
+    """
+    doc = await chat_ref.get()
+    if not doc.exists:
+        return False
     data = doc.to_dict()
-    return {"messages": data.get("messages", [])}
+    if data.get("message_count") is not None:
+        return False
+    history = data.get(MESSAGES) or []
+    for start in range(0, len(history), _MIGRATE_BATCH):
+        batch = adb.batch()
+        for seq in range(start, min(start + _MIGRATE_BATCH, len(history))):
+            batch.set(chat_ref.collection(MESSAGES).document(_message_id(seq)), {**history[seq], "seq": seq})
+        await batch.commit()
+
+    @firestore.async_transactional
+    async def finish(transaction) -> bool:
+        snap = await chat_ref.get(field_paths=["message_count"], transaction=transaction)
+        if snap.to_dict().get("message_count") is not None:
+            return False  # another migration got there first
+        prompts = [m.get("content", "") for m in history if m.get("role") == "user"]
+        transaction.update(
+            chat_ref,
+            {
+                "message_count": len(history),
+                MESSAGES: firestore.DELETE_FIELD,
+                "preview": (data.get("name") or (prompts[0] if prompts else ""))[:PREVIEW_CHARS],
+                "last_message": (prompts[-1] if prompts else "")[:PREVIEW_CHARS],
+                "updated_at": time.time(),
+            },
+        )
+        return True
+
+    return await finish(adb.transaction())
+
+
+async def _message_count(chat_ref) -> Tuple[bool, Optional[int]]:
+    # (exists, message_count); legacy chats have no count
+    with FIRESTORE_SECONDS.time(op="chat_get"):
+        snap = await chat_ref.get(field_paths=["message_count"])
+    if not snap.exists:
+        return False, None
+    return True, snap.to_dict().get("message_count")
+
+
+async def _append_messages(chat_ref, messages: List[dict], chat_fields: dict, count: int) -> Optional[List[dict]]:
+    # Writes the messages as seq count, count + 1, ... and chat_fields on the
+    # chat document in one batch. If another send took those seq numbers
+    # first the creates fail, nothing is written, and it goes again with the
+    # count re-read.
+    for attempt in range(_APPEND_ATTEMPTS):
+        batch = adb.batch()
+        stored = []
+        for i, msg in enumerate(messages):
+            doc = {**msg, "seq": count + i}
+            batch.create(chat_ref.collection(MESSAGES).document(_message_id(count + i)), doc)
+            stored.append(doc)
+        batch.update(
+            chat_ref,
+            {**chat_fields, "message_count": count + len(messages), "updated_at": time.time()},
+        )
+        try:
+            with FIRESTORE_SECONDS.time(op="message_append"):
+                await batch.commit()
+            return stored
+        except NotFound:  # the chat was deleted
+            return None
+        except AlreadyExists:
+            # back off (with jitter, so racing sends spread out) and re-read
+            await asyncio.sleep(random.uniform(0, _APPEND_BACKOFF * 2 ** attempt))
+            exists, count = await _message_count(chat_ref)
+            if not exists or count is None:
+                return None
+    raise ValueError(f"Failed to append messages after {_APPEND_ATTEMPTS} attempts")
 
 
 # ------------------------------------------------------------------
 # 4. Send a new user message → run AI → store both
 # ------------------------------------------------------------------
-def send_message(project_id: str, chat_id: str, user_id: str, user_prompt: str):
-    # ---- verify ownership -------------------------------------------------
-    proj = db.collection("projects").document(project_id).get()
-    if not proj.exists or proj.to_dict().get("user_id") != user_id:
-        return None
-
-    chat_ref = (
-        db.collection("projects")
-        .document(project_id)
-        .collection("chats")
-        .document(chat_id)
+async def send_message(project_id: str, chat_id: str, user_id: str, user_prompt: str):
+    # ---- verify ownership, read the chat's count (concurrently) -------------
+    chat_ref = _chat_ref(project_id, chat_id)
+    owned, (exists, count) = await asyncio.gather(
+        _owns_project(project_id, user_id),
+        _message_count(chat_ref),
     )
-    doc = chat_ref.get()
-    if not doc.exists:
+    if not owned or not exists:
         return None
+    if count is None:  # legacy chat: move it to the subcollection first
+        await migrate_chat(chat_ref)
+        exists, count = await _message_count(chat_ref)
+        if not exists or count is None:
+            return None
 
-    # ---- append user message ------------------------------------------------
-    messages: List[dict] = doc.to_dict().get("messages", [])
-    messages.append(
-        {"role": "user", "content": user_prompt, "timestamp": time.time()}
-    )
+    user_message = {"role": "user", "content": user_prompt, "timestamp": time.time()}
 
     # ---- call your AI parser ------------------------------------------------
+    params = None
     try:
         ai_result = parse_and_respond(user_prompt)
         ai_message = ai_result["message"]
+        params = ai_result["params"]
     except Exception as e:
         ai_message = "Sorry, I couldn't understand that request."
 
     # ---- append AI reply ----------------------------------------------------
-    messages.append(
-        {"role": "assistant", "content": ai_message, "timestamp": time.time()}
-    )
+    # the parsed params are kept so /synth/generate can condition on them
+    reply = {"role": "assistant", "content": ai_message, "timestamp": time.time()}
+    if params is not None:
+        reply["params"] = params
+
+    # ---- append both (one batch) --------------------------------------------
+    chat_fields = {"last_message": user_prompt[:PREVIEW_CHARS]}
+    stored = await _append_messages(chat_ref, [user_message, reply], chat_fields, count)
+    if stored is None:
+        return None
+    return {"messages": stored}
+
 
-    # ---- write back ---------------------------------------------------------
-    chat_ref.update({"messages": messages})
-    return {"messages": messages[-2:]}  
\ No newline at end of file
+# ------------------------------------------------------------------
+# 5. Parameters of the latest request in a chat (for generation)
+# ------------------------------------------------------------------
+_PARAMS_LOOKBACK = 20
+
+
+async def get_last_params(project_id: str, chat_id: str, user_id: str) -> Optional[dict]:
+    owned, history = await asyncio.gather(
+        _owns_project(project_id, user_id),
+        get_chat_history(project_id, chat_id, user_id, limit=_PARAMS_LOOKBACK),
+    )
+    if not owned or history is None:
+        return None
+    messages = history["messages"]
+    for msg in reversed(messages):
+        if msg.get("role") == "assistant" and msg.get("params"):
+            return msg["params"]
+    # chats written before params were stored: re-parse the last prompt
+    for msg in reversed(messages):
+        if msg.get("role") == "user":
+            return parse_prompt(msg.get("content", ""))
+    return None
@@ -0,0 +1,272 @@
+# services/csv_encoder.py
+# Vectorised CSV encoder writing each batch straight into a reusable byte
+# buffer. Every column is rendered as a fixed-width uint8 character matrix
+# plus a "keep" mask (leading zeros / padding are masked out); the matrices
+# are laid side by side with separators and one np.compress squeezes the
+# kept bytes into the output buffer. No per-cell Python objects are created.
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+DEFAULT_FLOAT_PRECISION = int(os.getenv("SYNTH_CSV_FLOAT_PRECISION", "6"))
+# e.g. {"Temperature(F)": 2, "Humidity(%)": 1}
+COLUMN_FLOAT_PRECISION: Dict[str, int] = json.loads(os.getenv("SYNTH_CSV_COLUMN_PRECISION") or "{}")
+
+_COMMA = ord(",")
+_NEWLINE = ord("\n")
+_DOT = ord(".")
+_MINUS = ord("-")
+_ZERO = ord("0")
+
+# distinct values cached per text column before its byte table is reset
+MAX_TABLE_ENTRIES = int(os.getenv("SYNTH_CSV_MAX_TABLE_ENTRIES", "65536"))
+
+# scaled |value| * 10**precision must stay exactly representable in int64
+_MAX_SCALED = 2 ** 53
+
+_Piece = Tuple[np.ndarray, Optional[np.ndarray]]  # (chars (n, w) uint8, keep (n, w) bool | None)
+
+
+def _quote(value: str) -> str:
+    # csv.QUOTE_MINIMAL, same rule as DataFrame.to_csv
+    if any(ch in value for ch in ',"\n\r'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _digit_count(max_value: int) -> int:
+    return max(1, len(str(int(max_value))))
+
+
+def _int_digits(values: np.ndarray, width: int) -> _Piece:
+    # values: non-negative int64; right-aligned digits, leading zeros masked
+    n = values.shape[0]
+    chars = np.empty((n, width), dtype=np.uint8)
+    keep = np.empty((n, width), dtype=bool)
+    power = 1
+    for k in range(width):
+        col = width - 1 - k
+        chars[:, col] = (values // power) % 10 + _ZERO
+        if k == 0:
+            keep[:, col] = True
+        else:
+            keep[:, col] = values >= power
+        power *= 10
+    return chars, keep
+
+
+class _CategoryTable:
+    """Pre-rendered (quoted, UTF-8) bytes for every value seen in a column."""
+
+    def __init__(self, values: Iterable = ()):
+        self._index: Dict[object, int] = {}
+        self._encoded: List[bytes] = []
+        self._table = np.zeros((0, 1), dtype=np.uint8)
+        self._lengths = np.zeros(0, dtype=np.int64)
+        self._dirty = False
+        # slot 0 renders missing values as an empty field
+        self._add(None)
+        for v in values:
+            self._add(v)
+
+    def __len__(self) -> int:
+        return len(self._encoded)
+
+    def _add(self, value) -> int:
+        idx = self._index.get(value)
+        if idx is None:
+            idx = len(self._encoded)
+            text = b"" if value is None else _quote(str(value)).encode("utf-8")
+            self._encoded.append(text)
+            self._index[value] = idx
+            self._dirty = True
+        return idx
+
+    def _rebuild(self) -> None:
+        width = max(1, max(len(b) for b in self._encoded))
+        table = np.zeros((len(self._encoded), width), dtype=np.uint8)
+        for i, b in enumerate(self._encoded):
+            table[i, : len(b)] = np.frombuffer(b, dtype=np.uint8)
+        self._table = table
+        self._lengths = np.array([len(b) for b in self._encoded], dtype=np.int64)
+        self._dirty = False
+
+    def render(self, series: pd.Series) -> _Piece:
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        lookup = np.empty(len(uniques) + 1, dtype=np.int64)
+        lookup[-1] = 0  # code -1 (NA) -> empty field
+        for i, u in enumerate(uniques):
+            lookup[i] = self._add(u)
+        if self._dirty:
+            self._rebuild()
+        rows = lookup[codes]
+        chars = self._table[rows]
+        keep = np.arange(self._table.shape[1]) < self._lengths[rows][:, None]
+        return chars, keep
+
+
+class CsvBatchEncoder:
+    """Encode DataFrame batches as CSV into one reusable buffer.
+
+    Float columns are written with a fixed number of decimals per column
+    (COLUMN_FLOAT_PRECISION / `precision`, default DEFAULT_FLOAT_PRECISION),
+    integers and booleans in their plain form, and everything else through a
+    per-column byte table that grows as new categories appear. `categories`
+    may pre-seed those tables, e.g. with the model's discrete values.
+    """
+
+    def __init__(
+        self,
+        precision: Optional[Dict[str, int]] = None,
+        default_precision: int = DEFAULT_FLOAT_PRECISION,
+        categories: Optional[Dict[str, Iterable]] = None,
+    ):
+        self._precision = {**COLUMN_FLOAT_PRECISION, **(precision or {})}
+        self._default_precision = default_precision
+        self._tables: Dict[str, _CategoryTable] = {
+            col: _CategoryTable(values) for col, values in (categories or {}).items()
+        }
+        self._buf = bytearray()
+        self._chars = np.empty(0, dtype=np.uint8)
+        self._keep = np.empty(0, dtype=bool)
+
+    # -- column renderers ------------------------------------------------
+    def _render_float(self, name: str, values: np.ndarray) -> Optional[_Piece]:
+        p = self._precision.get(name, self._default_precision)
+        values = values.astype(np.float64, copy=False)
+        finite = np.isfinite(values)
+        scale = 10 ** p
+        absval = np.where(finite, np.abs(values), 0.0)
+        if absval.size and absval.max() * scale >= _MAX_SCALED:
+            return None
+        scaled = np.rint(absval * scale).astype(np.int64)
+        int_part = scaled // scale
+        width = _digit_count(int_part.max() if int_part.size else 0)
+        int_chars, int_keep = _int_digits(int_part, width)
+
+        n = values.shape[0]
+        total = 1 + width + (1 + p if p > 0 else 0)
+        chars = np.empty((n, total), dtype=np.uint8)
+        keep = np.empty((n, total), dtype=bool)
+        chars[:, 0] = _MINUS
+        keep[:, 0] = np.signbit(values)  # like printf, -0.0 keeps its sign
+        chars[:, 1 : 1 + width] = int_chars
+        keep[:, 1 : 1 + width] = int_keep
+        if p > 0:
+            frac_chars, _ = _int_digits(scaled % scale, p)
+            chars[:, 1 + width] = _DOT
+            chars[:, 2 + width :] = frac_chars
+            keep[:, 1 + width :] = True
+        if not finite.all():
+            if np.isinf(values).any():
+                return None
+            keep[~finite] = False  # NaN -> empty field, as pandas writes it
+        return chars, keep
+
+    def _render_int(self, values: np.ndarray) -> Optional[_Piece]:
+        if values.size and (
+            (values.dtype.kind == "u" and values.max() > np.iinfo(np.int64).max)
+            or (values.dtype.kind == "i" and values.min() == np.iinfo(np.int64).min)
+        ):
+            return None
+        values = values.astype(np.int64, copy=False)
+        neg = values < 0
+        mag = np.abs(values)
+        width = _digit_count(mag.max() if mag.size else 0)
+        digits, digit_keep = _int_digits(mag, width)
+        chars = np.empty((values.shape[0], width + 1), dtype=np.uint8)
+        keep = np.empty((values.shape[0], width + 1), dtype=bool)
+        chars[:, 0] = _MINUS
+        keep[:, 0] = neg
+        chars[:, 1:] = digits
+        keep[:, 1:] = digit_keep
+        return chars, keep
+
+    def _render_table(self, name: str, series: pd.Series) -> _Piece:
+        table = self._tables.get(name)
+        if table is None or len(table) > MAX_TABLE_ENTRIES:
+            # high-cardinality text columns start over instead of growing forever
+            table = self._tables[name] = _CategoryTable()
+        return table.render(series)
+
+    def _render_column(self, name: str, series: pd.Series) -> _Piece:
+        kind = series.dtype.kind
+        piece = None
+        if kind == "f":
+            piece = self._render_float(name, series.to_numpy())
+            if piece is None:
+                # +/-inf or huge magnitudes: format per cell, table scoped to this batch
+                p = self._precision.get(name, self._default_precision)
+                text = series.map(lambda v: None if v != v else f"{v:.{p}f}")
+                return _CategoryTable().render(text)
+        elif kind in "iu":
+            piece = self._render_int(series.to_numpy())
+            if piece is None:
+                return _CategoryTable().render(series.astype(str))
+        if piece is None:
+            if kind == "M":
+                series = series.astype(str).where(series.notna())
+            piece = self._render_table(name, series)
+        return piece
+
+    # -- public API ------------------------------------------------------
+    def header_bytes(self, columns: Iterable) -> bytes:
+        return (",".join(_quote(str(c)) for c in columns) + "\n").encode("utf-8")
+
+    def encode_into(self, df: pd.DataFrame, header: bool = False) -> memoryview:
+        """Encode `df` and return a view of the internal buffer.
+
+        The view is only valid until the next call; use encode() when the
+        bytes have to outlive it.
+        """
+        head = self.header_bytes(df.columns) if header else b""
+        n = len(df)
+        pieces = [self._render_column(str(c), df[c]) for c in df.columns]
+        width = sum(chars.shape[1] for chars, _ in pieces) + max(1, len(pieces))
+
+        if self._chars.size < n * width:
+            self._chars = np.empty(n * width, dtype=np.uint8)
+            self._keep = np.empty(n * width, dtype=bool)
+        chars = self._chars[: n * width].reshape(n, width)
+        keep = self._keep[: n * width].reshape(n, width)
+
+        pos = 0
+        for i, (c, k) in enumerate(pieces):
+            w = c.shape[1]
+            chars[:, pos : pos + w] = c
+            keep[:, pos : pos + w] = True if k is None else k
+            pos += w
+            chars[:, pos] = _NEWLINE if i == len(pieces) - 1 else _COMMA
+            keep[:, pos] = True
+            pos += 1
+        if not pieces:
+            chars[:, pos] = _NEWLINE
+            keep[:, pos] = True
+        elif len(pieces) == 1:
+            # csv writes a row consisting of one empty field as ""
+            chars, keep = self._quote_empty_rows(chars, keep)
+
+        flat_keep = keep.reshape(-1)
+        body_len = int(np.count_nonzero(flat_keep))
+        total = len(head) + body_len
+        if len(self._buf) < total:
+            self._buf = bytearray(total)
+        out = np.frombuffer(self._buf, dtype=np.uint8, count=total)
+        out[: len(head)] = np.frombuffer(head, dtype=np.uint8)
+        np.compress(flat_keep, chars.reshape(-1), out=out[len(head) :])
+        return memoryview(self._buf)[:total]
+
+    @staticmethod
+    def _quote_empty_rows(chars: np.ndarray, keep: np.ndarray):
+        empty = ~keep[:, :-1].any(axis=1)
+        if not empty.any():
+            return chars, keep
+        quotes = np.full((chars.shape[0], 2), ord('"'), dtype=np.uint8)
+        chars = np.hstack([chars[:, :-1], quotes, chars[:, -1:]])
+        keep = np.hstack([keep[:, :-1], np.repeat(empty[:, None], 2, axis=1), keep[:, -1:]])
+        return chars, keep
+
+    def encode(self, df: pd.DataFrame, header: bool = False) -> bytes:
+        return bytes(self.encode_into(df, header))
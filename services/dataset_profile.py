@@ -0,0 +1,319 @@
+# services/dataset_profile.py
+# Single-pass profile of a generated dataset, built from the sampled batches
+# while they stream, so nobody has to read the download back to check it.
+# Per column:
+#   numeric      count, missing, mean / variance (Welford, merged per batch
+#                with Chan's formula), min / max and quantiles from a
+#                DDSketch (relative error SYNTH_DATASET_PROFILE_ALPHA)
+#   categorical  count, missing and frequencies of the most common
+#                SYNTH_DATASET_PROFILE_MAX_CATEGORIES values (the rest is
+#                counted as "other"); once values were dropped the counts
+#                are marked approximate, with a bound on how far each
+#                kept category may be undercounted ("count_error")
+# Memory is bounded by the sketch bucket and category caps, whatever the
+# row count, and profiles merge, so shards and parallel batches can each
+# keep a partial one. Numbers are profiled as sampled, before an encoder
+# rounds them (the fast CSV encoder writes 6 decimals). Profiles of
+# streamed generations are kept in memory by generation id (the
+# X-Generation-Id response header); jobs write theirs next to the spool
+# file.
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SYNTH_DATASET_PROFILE_ALPHA = float(os.getenv("SYNTH_DATASET_PROFILE_ALPHA", "0.01"))
+SYNTH_DATASET_PROFILE_MAX_BUCKETS = int(os.getenv("SYNTH_DATASET_PROFILE_MAX_BUCKETS", "2048"))
+SYNTH_DATASET_PROFILE_MAX_CATEGORIES = int(os.getenv("SYNTH_DATASET_PROFILE_MAX_CATEGORIES", "1000"))
+SYNTH_DATASET_PROFILE_KEEP = int(os.getenv("SYNTH_DATASET_PROFILE_KEEP", "256"))
+
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+_MIN_MAGNITUDE = 1e-9  # smaller magnitudes count as zero
+
+
+class QuantileSketch:
+    """DDSketch: values fall into logarithmic buckets, so every quantile is
+    within a relative error `alpha` and two sketches merge by adding counts.
+    Past `max_buckets` per sign the buckets nearest zero are folded together."""
+
+    def __init__(self, alpha: float = SYNTH_DATASET_PROFILE_ALPHA, max_buckets: int = SYNTH_DATASET_PROFILE_MAX_BUCKETS):
+        self.alpha = alpha
+        self.max_buckets = max_buckets
+        self._gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self._gamma)
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}  # keyed by magnitude
+        self.zeros = 0
+        self.count = 0
+
+    def _add(self, store: Dict[int, int], magnitudes: np.ndarray) -> None:
+        if not len(magnitudes):
+            return
+        keys, counts = np.unique(np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64), return_counts=True)
+        for k, n in zip(keys.tolist(), counts.tolist()):
+            store[k] = store.get(k, 0) + n
+        self._collapse(store)
+
+    def _collapse(self, store: Dict[int, int]) -> None:
+        if len(store) <= self.max_buckets:
+            return
+        keys = sorted(store)
+        cut = keys[len(keys) - self.max_buckets]
+        folded = sum(store.pop(k) for k in keys[: len(keys) - self.max_buckets])
+        store[cut] += folded
+
+    def update(self, values: np.ndarray) -> None:
+        """Add finite values."""
+        self.count += len(values)
+        self._add(self.positive, values[values > _MIN_MAGNITUDE])
+        self._add(self.negative, -values[values < -_MIN_MAGNITUDE])
+        self.zeros += int(np.count_nonzero(np.abs(values) <= _MIN_MAGNITUDE))
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.alpha != self.alpha:
+            raise ValueError("cannot merge sketches with different accuracy")
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for k, n in theirs.items():
+                mine[k] = mine.get(k, 0) + n
+            self._collapse(mine)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def _value(self, key: int) -> float:
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def quantiles(self, qs: Iterable[float]) -> List[Optional[float]]:
+        if not self.count:
+            return [None for _ in qs]
+        # buckets in value order: negatives (largest magnitude first), zero, positives
+        order: List[Tuple[float, int]] = [(-self._value(k), self.negative[k]) for k in sorted(self.negative, reverse=True)]
+        if self.zeros:
+            order.append((0.0, self.zeros))
+        order += [(self._value(k), self.positive[k]) for k in sorted(self.positive)]
+        cumulative = np.cumsum([n for _, n in order])
+        values = [v for v, _ in order]
+        return [values[int(np.searchsorted(cumulative, q * (self.count - 1), side="right"))] for q in qs]
+
+
+class NumericStats:
+    kind = "numeric"
+
+    def __init__(self):
+        self.count = 0
+        self.missing = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def _combine(self, n: int, mean: float, m2: float) -> None:
+        # Chan et al.: Welford's running (mean, M2) merged with a batch's
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    def update(self, series: pd.Series) -> None:
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        finite = values[np.isfinite(values)]
+        self.missing += len(values) - len(finite)
+        if not len(finite):
+            return
+        mean = float(finite.mean())
+        self._combine(len(finite), mean, float(((finite - mean) ** 2).sum()))
+        self.min = min(self.min, float(finite.min()))
+        self.max = max(self.max, float(finite.max()))
+        self.sketch.update(finite)
+
+    def merge(self, other: "NumericStats") -> None:
+        self.missing += other.missing
+        if other.count:
+            self._combine(other.count, other.mean, other.m2)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self.sketch.merge(other.sketch)
+
+    def to_dict(self) -> Dict[str, Any]:
+        variance = self.m2 / (self.count - 1) if self.count > 1 else None
+        return {
+            "type": self.kind,
+            "count": self.count,
+            "missing": self.missing,
+            "mean": self.mean if self.count else None,
+            "variance": variance,
+            "std": math.sqrt(variance) if variance is not None else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "quantiles": {f"p{round(q * 100):02d}": v for q, v in zip(QUANTILES, self.sketch.quantiles(QUANTILES))},
+        }
+
+
+class CategoryStats:
+    kind = "categorical"
+
+    def __init__(self, max_categories: int = SYNTH_DATASET_PROFILE_MAX_CATEGORIES):
+        self.max_categories = max_categories
+        self.count = 0
+        self.missing = 0
+        self.other = 0  # rows whose value fell out of the kept categories
+        # a kept category may have been dropped before with at most the
+        # largest count dropped in that trim: the sum of those bounds how
+        # far any count is below the true one
+        self.error = 0
+        self.counts: Dict[str, int] = {}
+
+    def _trim(self) -> None:
+        if len(self.counts) > self.max_categories:
+            ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)
+            self.counts = dict(ranked[: self.max_categories])
+            self.other += sum(n for _, n in ranked[self.max_categories :])
+            self.error += ranked[self.max_categories][1]
+
+    def update(self, series: pd.Series) -> None:
+        freq = series.value_counts(dropna=True, sort=False)
+        seen = int(freq.sum())
+        self.missing += len(series) - seen
+        self.count += seen
+        for value, n in zip(freq.index.tolist(), freq.tolist()):
+            key = str(value)
+            self.counts[key] = self.counts.get(key, 0) + n
+        self._trim()
+
+    def merge(self, other: "CategoryStats") -> None:
+        self.count += other.count
+        self.missing += other.missing
+        self.other += other.other
+        self.error += other.error
+        for key, n in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+        self._trim()
+
+    def to_dict(self) -> Dict[str, Any]:
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)
+        return {
+            "type": self.kind,
+            "count": self.count,
+            "missing": self.missing,
+            "distinct": len(ranked) if not self.other else None,  # unknown once values were dropped
+            # true counts lie in [count, count + count_error] (shares likewise)
+            "approximate": bool(self.other),
+            "count_error": self.error,
+            "categories": [
+                {"value": v, "count": n, "share": round(n / self.count, 6) if self.count else 0.0} for v, n in ranked
+            ],
+            "other": self.other,
+        }
+
+
+class DatasetProfile:
+    def __init__(self):
+        self.rows = 0
+        self.columns: Dict[str, Any] = {}  # name -> NumericStats | CategoryStats, in column order
+
+    def update(self, df: pd.DataFrame) -> None:
+        self.rows += len(df)
+        for name in df.columns:
+            stats = self.columns.get(name)
+            if stats is None:
+                numeric = df[name].dtype.kind in "fiu"
+                stats = self.columns[name] = NumericStats() if numeric else CategoryStats()
+            stats.update(df[name])
+
+    def merge(self, other: "DatasetProfile") -> "DatasetProfile":
+        self.rows += other.rows
+        for name, theirs in other.columns.items():
+            mine = self.columns.get(name)
+            if mine is None:
+                self.columns[name] = theirs
+            else:
+                mine.merge(theirs)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"rows": self.rows, "columns": {name: s.to_dict() for name, s in self.columns.items()}}
+
+
+def profile_frames(frames: Iterable[pd.DataFrame], profile: DatasetProfile) -> Iterator[pd.DataFrame]:
+    """Pass batches through, adding each one to `profile`."""
+    for df in frames:
+        profile.update(df)
+        yield df
+
+
+def merge_partials(items: Iterable[Tuple[Any, DatasetProfile]], profile: DatasetProfile) -> Iterator[Any]:
+    """Unwrap (payload, partial profile) pairs, e.g. from shard workers,
+    merging the partials into `profile`."""
+    for payload, partial in items:
+        profile.merge(partial)
+        yield payload
+
+
+# ------------------------------------------------------------------
+# Profiles of streamed generations, by generation id
+# ------------------------------------------------------------------
+RUNNING, DONE, ABORTED = "running", "done", "aborted"
+
+
+class _Entry:
+    __slots__ = ("user_id", "profile", "status", "created_at", "finished_at")
+
+    def __init__(self, user_id: str, profile: DatasetProfile):
+        self.user_id = user_id
+        self.profile = profile
+        self.status = RUNNING
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+
+class ProfileStore:
+    def __init__(self, keep: int = SYNTH_DATASET_PROFILE_KEEP):
+        self.keep = max(1, keep)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+    def start(self, user_id: str) -> Tuple[str, DatasetProfile]:
+        """A new generation id and the profile its stream should fill."""
+        generation_id = uuid.uuid4().hex
+        entry = _Entry(user_id, DatasetProfile())
+        with self._lock:
+            self._entries[generation_id] = entry
+            while len(self._entries) > self.keep:
+                self._entries.popitem(last=False)
+        return generation_id, entry.profile
+
+    def track(self, generation_id: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Re-yield a generation's chunks; its profile is final once they end."""
+        status = ABORTED
+        try:
+            yield from chunks
+            status = DONE
+        finally:
+            with self._lock:
+                entry = self._entries.get(generation_id)
+                if entry is not None:
+                    entry.status, entry.finished_at = status, time.time()
+
+    def get(self, generation_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(generation_id)
+        if entry is None or entry.user_id != user_id:
+            return None
+        out = {"generation_id": generation_id, "status": entry.status,
+               "created_at": entry.created_at, "finished_at": entry.finished_at}
+        if entry.status == DONE:
+            out["profile"] = entry.profile.to_dict()
+        return out
+
+
+profiles = ProfileStore()
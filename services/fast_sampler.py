@@ -0,0 +1,437 @@
+# services/fast_sampler.py
+# Fast-path sampler built from a loaded model (an ArtifactModel, or a legacy
+# CTGAN pickle converted in memory):
+#   - the generator is frozen for inference: BatchNorm folded into the
+#     linear layers (eval-mode generators) or computed per CTGAN-sized group
+#     inside one large batch (training-mode generators, whose BatchNorm uses
+#     batch statistics), traced and frozen with TorchScript, and run under
+#     inference_mode in chunks of SYNTH_FAST_SAMPLER_CHUNK rows;
+#   - the inverse transform is one tanh and one Gumbel draw over all columns
+#     at once, then per column a lookup in precomputed NumPy arrays (mode
+#     means / stds, category tables) written straight into preallocated
+#     column buffers.
+# Rows follow the same distribution as the stock sampler but not the same
+# random stream. model_registry only serves a FastSampler after
+# equivalence_gate has compared its rows with the stock sampler's
+# (equivalence_report) when the model loads, and keeps the stock sampler
+# otherwise; benchmarks/bench_sampler.py runs the same check on the fixture
+# model (or any other) and reports rows/sec.
+#
+# The generator can also run in bfloat16 or with dynamically quantized int8
+# linear layers (FastSampler(..., precision=...)); model_registry only serves
+# those after fidelity_gate has compared them with full precision.
+import math
+import os
+import threading
+import time
+import warnings
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from services.model_artifact import STD_MULTIPLIER, ArtifactModel
+
+load_dotenv()
+
+SYNTH_FAST_SAMPLER = os.getenv("SYNTH_FAST_SAMPLER", "1") != "0"
+SYNTH_FAST_SAMPLER_CHUNK = int(os.getenv("SYNTH_FAST_SAMPLER_CHUNK", "2048"))
+SYNTH_FAST_SAMPLER_JIT = os.getenv("SYNTH_FAST_SAMPLER_JIT", "1") != "0"
+# rows drawn from each sampler by equivalence_gate (0 = serve the fast path
+# unchecked), the test's significance level and the seed of the stock sample
+SYNTH_FAST_SAMPLER_CHECK_ROWS = int(os.getenv("SYNTH_FAST_SAMPLER_CHECK_ROWS", "5000"))
+SYNTH_FAST_SAMPLER_CHECK_ALPHA = float(os.getenv("SYNTH_FAST_SAMPLER_CHECK_ALPHA", "0.01"))
+SYNTH_FAST_SAMPLER_CHECK_SEED = int(os.getenv("SYNTH_FAST_SAMPLER_CHECK_SEED", "0"))
+
+# Reduced-precision generators (per model, see model_registry) are only
+# switched on when a fixed-seed sample stays within SYNTH_PRECISION_MAX_DRIFT
+# of full precision on every column: KS distance for continuous columns,
+# total variation distance of the category frequencies otherwise.
+PRECISIONS = ("fp32", "bf16", "int8")
+SYNTH_PRECISION_MAX_DRIFT = float(os.getenv("SYNTH_PRECISION_MAX_DRIFT", "0.02"))
+SYNTH_PRECISION_CHECK_ROWS = int(os.getenv("SYNTH_PRECISION_CHECK_ROWS", "20000"))
+SYNTH_PRECISION_CHECK_SEED = int(os.getenv("SYNTH_PRECISION_CHECK_SEED", "0"))
+
+
+class _Column:
+    __slots__ = ("name", "continuous", "alpha", "span", "means", "stds", "clip", "integer", "lookup")
+
+    def __init__(self, name: str, continuous: bool, span: Tuple[int, int]):
+        self.name = name
+        self.continuous = continuous
+        self.span = span  # columns of this one's Gumbel span in the score matrix
+        self.alpha = -1
+        self.means = self.stds = self.lookup = None
+        self.clip = None
+        self.integer = False
+
+
+def _layout(model: ArtifactModel) -> Tuple[List[_Column], np.ndarray, np.ndarray]:
+    # (columns, logit index of every tanh value, logit index of every Gumbel span column)
+    columns, alpha_idx, span_idx = [], [], []
+    st = 0
+    for col in model.columns:
+        dims = col["output_dims"]
+        if col["type"] == "continuous":
+            span = list(range(st + 1, st + 1 + dims[1]))
+            c = _Column(col["name"], True, (len(span_idx), len(span_idx) + len(span)))
+            c.alpha = len(alpha_idx)
+            alpha_idx.append(st)
+            key = col["arrays"]
+            c.means = np.ascontiguousarray(model._arrays[f"{key}.means"], dtype=np.float64)
+            c.stds = np.ascontiguousarray(model._arrays[f"{key}.stds"], dtype=np.float64)
+            c.clip = col["clip"]
+            c.integer = np.dtype(col["dtype"]).kind in "iu"
+        else:
+            span = list(range(st, st + dims[0]))
+            c = _Column(col["name"], False, (len(span_idx), len(span_idx) + len(span)))
+            c.lookup = col["_lookup"]
+        span_idx.extend(span)
+        columns.append(c)
+        st += sum(dims)
+    return columns, np.asarray(alpha_idx, dtype=np.int64), np.asarray(span_idx, dtype=np.int64)
+
+
+def _bf16_supported() -> bool:
+    import torch
+    try:
+        return bool(torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def _freeze_generator(gen, group: Optional[int], in_dim: int, precision: str = "fp32"):
+    """Inference-only copy of a ctgan Generator.
+
+    Each residual layer's input is cat([h_k, ..., h_1, z]). In fp32 / bf16
+    the weights are split into one pre-transposed block per feature instead,
+    so the forward pass accumulates addmm's and never concatenates; int8
+    keeps whole nn.Linear layers for dynamic quantization. group=None folds
+    BatchNorm's running statistics into the linear layers; otherwise
+    BatchNorm uses the statistics of each `group` consecutive rows, as
+    CTGAN's training-sized batches would.
+    """
+    import torch
+    from torch import nn
+
+    blocks, final = list(gen.seq)[:-1], list(gen.seq)[-1]
+    split_weights = precision != "int8"
+
+    def split(weight, widths):
+        # (out, sum(widths)) -> [(width, out)] for the features newest-first
+        return [p.t().contiguous() for p in torch.split(weight, list(reversed(widths)), dim=1)]
+
+    def linear(w, b):
+        fc = nn.Linear(w.shape[1], w.shape[0])
+        fc.weight.data.copy_(w)
+        fc.bias.data.copy_(b)
+        return fc
+
+    class Frozen(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.layers = len(blocks)
+            self.group = group
+            self.split_weights = split_weights
+            self.compute_dtype = torch.float32
+            self.eps: List[float] = []
+            fcs = []
+            widths = [in_dim]
+            for i, block in enumerate(blocks):
+                w, b, bn = block.fc.weight.detach(), block.fc.bias.detach(), block.bn
+                if group is None:
+                    scale = bn.weight.detach() / torch.sqrt(bn.running_var + bn.eps)
+                    w, b = w * scale[:, None], (b - bn.running_mean) * scale + bn.bias.detach()
+                else:
+                    self.register_buffer(f"gamma{i}", bn.weight.detach().clone())
+                    self.register_buffer(f"beta{i}", bn.bias.detach().clone())
+                if split_weights:
+                    for j, part in enumerate(split(w, widths)):
+                        self.register_buffer(f"w{i}_{j}", part)
+                    self.register_buffer(f"b{i}", b.clone())
+                else:
+                    fcs.append(linear(w, b))
+                self.eps.append(float(bn.eps))
+                widths.append(w.shape[0])
+            if split_weights:
+                for j, part in enumerate(split(final.weight.detach(), widths)):
+                    self.register_buffer(f"w_out_{j}", part)
+                self.register_buffer("b_out", final.bias.detach().clone())
+            else:
+                self.fcs = nn.ModuleList(fcs)
+                self.out = linear(final.weight.detach(), final.bias.detach())
+
+        def _affine(self, feats: List[torch.Tensor], name: str, bias: torch.Tensor) -> torch.Tensor:
+            out = torch.addmm(bias, feats[-1], getattr(self, f"{name}_0"))
+            for j in range(1, len(feats)):
+                out.addmm_(feats[-1 - j], getattr(self, f"{name}_{j}"))
+            return out
+
+        def forward(self, x):
+            feats = [x.to(self.compute_dtype)]
+            for i in range(self.layers):
+                if self.split_weights:
+                    h = self._affine(feats, f"w{i}", getattr(self, f"b{i}"))
+                else:
+                    h = self.fcs[i](torch.cat(feats[::-1], dim=1))
+                if self.group is not None:
+                    # in place on a (groups, group, d) view; var_mean over the
+                    # middle axis is an order of magnitude slower than this
+                    g = h.view(-1, self.group, h.shape[1])
+                    g.sub_(g.mean(dim=1, keepdim=True))
+                    g.mul_(torch.rsqrt((g * g).mean(dim=1, keepdim=True).add_(self.eps[i])))
+                    h.mul_(getattr(self, f"gamma{i}")).add_(getattr(self, f"beta{i}"))
+                feats.append(h.relu_())
+            if self.split_weights:
+                return self._affine(feats, "w_out", self.b_out).float()
+            return self.out(torch.cat(feats[::-1], dim=1))
+
+    frozen = Frozen().eval()
+    if precision == "int8":
+        frozen = torch.ao.quantization.quantize_dynamic(frozen, {nn.Linear}, dtype=torch.qint8)
+    elif precision == "bf16":
+        frozen = frozen.to(torch.bfloat16)
+        frozen.compute_dtype = torch.bfloat16
+    if not SYNTH_FAST_SAMPLER_JIT:
+        return frozen
+    try:
+        example = torch.zeros(2 * (group or 1), in_dim)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # TorchScript deprecation notices
+            return torch.jit.freeze(torch.jit.trace(frozen, example, check_trace=False))
+    except Exception as e:
+        print(f"[synth] generator not traced, running it eagerly: {e}")
+        return frozen
+
+
+class FastSampler(ArtifactModel):
+    """Drop-in ArtifactModel (same conditions, seeds and output columns) with
+    the fast sampling path; see the module comment."""
+
+    def __init__(self, source: ArtifactModel, precision: str = "fp32"):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}' (expected one of {', '.join(PRECISIONS)})")
+        if precision == "bf16" and not _bf16_supported():
+            raise ValueError("bfloat16 inference is not supported on this CPU")
+        # shares the source's arrays and (lazily loaded) generator weights
+        self._setup(source.path, source.meta, source._arrays, source._cond_freq, source._generator)
+        self.precision = precision
+        self._columns, self._alpha_idx, self._span_idx = _layout(self)
+        self._group = self.meta["batch_size"] if self.meta["generator_training"] else None
+        chunk = max(1, SYNTH_FAST_SAMPLER_CHUNK)
+        self._chunk = max(self._group, chunk // self._group * self._group) if self._group else chunk
+        self._frozen = None
+        self._frozen_lock = threading.Lock()
+
+    @property
+    def frozen_generator(self):
+        if self._frozen is None:
+            with self._frozen_lock:
+                if self._frozen is None:
+                    in_dim = self.meta["embedding_dim"] + self.meta["cond_dim"]
+                    self._frozen = _freeze_generator(self.generator, self._group, in_dim, self.precision)
+        return self._frozen
+
+    def sample(
+        self,
+        n: int,
+        seed: Optional[int] = None,
+        cond_choices: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> pd.DataFrame:
+        import torch
+        seq = np.random.SeedSequence(seed)
+        torch_gen = torch.Generator().manual_seed(int(seq.generate_state(1, dtype=np.uint64)[0] >> 1))
+        rng = np.random.default_rng(seq)
+        buffers = {
+            c.name: np.empty(n, dtype=np.float64 if c.continuous else object) for c in self._columns
+        }
+        gen = self.frozen_generator
+        alpha_idx = torch.from_numpy(self._alpha_idx)
+        span_idx = torch.from_numpy(self._span_idx)
+        with torch.inference_mode():
+            for start in range(0, n, self._chunk):
+                m = min(self._chunk, n - start)
+                total = math.ceil(m / self._group) * self._group if self._group else m
+                z = torch.randn(total, self.meta["embedding_dim"], generator=torch_gen)
+                cond = self._condition_vectors(total, rng, cond_choices)
+                if cond is not None:
+                    z = torch.cat([z, torch.from_numpy(cond)], dim=1)
+                logits = gen(z)[:m]
+                alpha = torch.tanh(logits[:, alpha_idx]).clamp_(-1, 1).numpy()
+                # argmax(logits + g), g ~ Gumbel(0, 1), for every span at once
+                u = torch.rand((m, len(self._span_idx)), generator=torch_gen).clamp_(min=1e-10)
+                scores = (logits[:, span_idx] - torch.log(-torch.log(u))).numpy()
+                self._inverse_into(buffers, start, m, alpha, scores)
+        return self._frame(buffers)
+
+    def _inverse_into(self, buffers: Dict[str, np.ndarray], start: int, m: int, alpha, scores) -> None:
+        for c in self._columns:
+            idx = scores[:, c.span[0] : c.span[1]].argmax(axis=1)
+            out = buffers[c.name][start : start + m]
+            if not c.continuous:
+                np.take(c.lookup, idx, out=out)
+                continue
+            np.take(c.stds, idx, out=out)
+            out *= alpha[:, c.alpha]
+            out *= STD_MULTIPLIER
+            out += c.means[idx]
+            if c.clip is not None:
+                np.clip(out, c.clip[0], c.clip[1], out=out)
+            if c.integer:
+                np.round(out, out=out)
+
+    def _frame(self, buffers: Dict[str, np.ndarray]) -> pd.DataFrame:
+        df = pd.DataFrame(buffers, copy=False)
+        dtypes = self.meta["column_dtypes"]
+        mismatched = {k: v for k, v in dtypes.items() if k in df.columns and str(df[k].dtype) != v}
+        return df.astype(mismatched) if mismatched else df
+
+
+def fast_sampler(model, precision: str = "fp32") -> FastSampler:
+    """FastSampler for a loaded model: an ArtifactModel or a fitted CTGAN."""
+    if isinstance(model, FastSampler) and model.precision == precision:
+        return model
+    if not isinstance(model, ArtifactModel):
+        model = ArtifactModel.from_ctgan(model)
+    return FastSampler(model, precision)
+
+
+def stock_sample(model, n: int, seed: int) -> pd.DataFrame:
+    """n rows from the model's stock sampling path: ArtifactModel.sample, or
+    CTGAN.sample under seeded global RNGs."""
+    if isinstance(model, ArtifactModel):
+        return ArtifactModel.sample(model, n, seed=seed)
+    import torch
+    np.random.seed(seed % (2 ** 32))
+    torch.manual_seed(seed)
+    return model.sample(n)
+
+
+def equivalence_gate(
+    model,
+    rows: int = SYNTH_FAST_SAMPLER_CHECK_ROWS,
+    alpha: float = SYNTH_FAST_SAMPLER_CHECK_ALPHA,
+    seed: int = SYNTH_FAST_SAMPLER_CHECK_SEED,
+) -> Tuple[Any, Dict[str, Any]]:
+    """(model to serve, report): the fp32 FastSampler for `model` when its
+    rows pass equivalence_report against the stock sampler's, otherwise
+    `model` unchanged. Fixed seeds, so a model always gets the same verdict."""
+    report: Dict[str, Any] = {"activated": False}
+    try:
+        fast = fast_sampler(model)
+        if rows <= 0:
+            report.update(activated=True, reason="not checked (SYNTH_FAST_SAMPLER_CHECK_ROWS=0)")
+            return fast, report
+        reference = stock_sample(model, rows, seed)
+        candidate = fast.sample(rows, seed=seed + 1)
+    except Exception as e:  # columns the artifact format cannot express, torch build, ...
+        report["reason"] = str(e)
+        return model, report
+    report.update(equivalence_report(reference, candidate, alpha))
+    report.update({"rows": rows, "seed": seed, "activated": report["ok"]})
+    if not report["ok"]:
+        worst = min(report["columns"], key=lambda c: c["p_value"])
+        report["reason"] = f"column '{worst['column']}' differs from the stock sampler (p={worst['p_value']:.2g})"
+        return model, report
+    return fast, report
+
+
+def fidelity_gate(
+    model,
+    precision: str,
+    max_drift: float = SYNTH_PRECISION_MAX_DRIFT,
+    rows: int = SYNTH_PRECISION_CHECK_ROWS,
+    seed: int = SYNTH_PRECISION_CHECK_SEED,
+) -> Tuple[Any, Dict[str, Any]]:
+    """(model to serve, report): the model in `precision` when its samples
+    stay within max_drift of full precision, otherwise `model` unchanged.
+
+    Both samples use the same seed, so they share z, the condition vectors
+    and the Gumbel noise; the drift is the precision's effect alone.
+    """
+    report: Dict[str, Any] = {"precision": precision, "activated": False}
+    if precision == getattr(model, "precision", "fp32"):
+        report["activated"] = True
+        return model, report
+    if not isinstance(model, FastSampler):
+        report["reason"] = "reduced precision needs the fast sampler (SYNTH_FAST_SAMPLER)"
+        return model, report
+    try:
+        full, reduced = fast_sampler(model, "fp32"), fast_sampler(model, precision)
+        full.frozen_generator, reduced.frozen_generator  # build both before timing
+        t0 = time.perf_counter()
+        reference = full.sample(rows, seed=seed)
+        t1 = time.perf_counter()
+        candidate = reduced.sample(rows, seed=seed)
+        t2 = time.perf_counter()
+    except Exception as e:  # unsupported on this CPU / torch build
+        report["reason"] = str(e)
+        return model, report
+    report.update(drift_report(reference, candidate, max_drift))
+    report.update({"rows": rows, "seed": seed, "speedup": round((t1 - t0) / max(t2 - t1, 1e-9), 2)})
+    report["activated"] = report["ok"]
+    if not report["ok"]:
+        worst = max(report["columns"], key=lambda c: c["drift"])
+        report["reason"] = f"column '{worst['column']}' drifted {worst['drift']:.4f} > {max_drift}"
+        return model, report
+    return reduced, report
+
+
+# ------------------------------------------------------------------
+# Comparing two samplers
+# ------------------------------------------------------------------
+def _is_continuous(values: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(values) and values.nunique() > 20
+
+
+def drift_report(reference: pd.DataFrame, candidate: pd.DataFrame, max_drift: float) -> Dict[str, Any]:
+    """Per column: the largest gap between the two empirical CDFs (KS
+    distance) for continuous columns, the total variation distance of the
+    category frequencies otherwise; ok when every column is <= max_drift."""
+    from scipy import stats
+
+    columns = []
+    for name in reference.columns:
+        a, b = reference[name], candidate[name]
+        if _is_continuous(a):
+            metric, drift = "ks", float(stats.ks_2samp(a.to_numpy(), b.to_numpy()).statistic)
+        else:
+            freq = pd.concat([a.value_counts(normalize=True), b.value_counts(normalize=True)], axis=1).fillna(0)
+            metric, drift = "tvd", float(0.5 * np.abs(freq.iloc[:, 0] - freq.iloc[:, 1]).sum())
+        columns.append({"column": name, "metric": metric, "drift": round(drift, 6), "ok": drift <= max_drift})
+    return {
+        "ok": all(c["ok"] for c in columns),
+        "max_drift": max_drift,
+        "worst_drift": max((c["drift"] for c in columns), default=0.0),
+        "columns": columns,
+    }
+
+
+def equivalence_report(reference: pd.DataFrame, candidate: pd.DataFrame, alpha: float = 0.01) -> Dict[str, Any]:
+    """Per column: two-sample Kolmogorov-Smirnov for numeric columns, a
+    chi-square test of homogeneity on category counts otherwise; a column
+    passes when p >= alpha / number of columns (Bonferroni)."""
+    from scipy import stats
+
+    threshold = alpha / max(1, len(reference.columns))
+    columns = []
+    for name in reference.columns:
+        a, b = reference[name], candidate[name]
+        if _is_continuous(a):
+            res = stats.ks_2samp(a.to_numpy(), b.to_numpy())
+            test, statistic, p = "ks", float(res.statistic), float(res.pvalue)
+        else:
+            counts = pd.concat([a.value_counts(), b.value_counts()], axis=1).fillna(0).to_numpy()
+            # pool categories too rare for the chi-square approximation
+            expected = counts.sum(axis=1) * (counts.sum(axis=0).min() / counts.sum())
+            rare = expected < 5
+            table = counts[~rare]
+            if rare.any():
+                table = np.vstack([table, counts[rare].sum(axis=0)])
+            table = table[table.sum(axis=1) > 0]
+            if len(table) < 2:
+                test, statistic, p = "chi2", 0.0, 1.0
+            else:
+                res = stats.chi2_contingency(table.T)
+                test, statistic, p = "chi2", float(res.statistic), float(res.pvalue)
+        columns.append({"column": name, "test": test, "statistic": statistic, "p_value": p, "ok": p >= threshold})
+    return {"ok": all(c["ok"] for c in columns), "alpha": alpha, "columns": columns}
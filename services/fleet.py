@@ -0,0 +1,212 @@
+# services/fleet.py
+# Fleet mode: N simulated devices x T timestamps at a fixed interval instead
+# of independent rows. Rows go out in time order (every device's reading
+# for a timestamp, then the next timestamp) in windows of whole timestamps,
+# so a window is one sampling batch and the fleet is never held in memory.
+# A fleet with more devices than a batch holds splits each timestamp's
+# devices over several windows instead, so no window exceeds the batch size.
+# The device_id and timestamp columns are built per window with numpy;
+# the readings are ordinary model rows.
+#
+# If the model has a clock-time column (the one the "time" chat parameter
+# maps to), that column, like a "Date" column, is replaced by the timestamp,
+# and a request without conditions of its own has each window conditioned
+# on the categories near the window's time of day. Conditions from the chat
+# (time of day, season, ...) apply to every window as given instead: on top
+# of them the extra rejection would mostly starve the sampler.
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from services.sampling import _category_minute, discrete_categories
+
+load_dotenv()
+
+SYNTH_FLEET_MAX_ROWS = int(os.getenv("SYNTH_FLEET_MAX_ROWS", "10000000"))
+# a window spans at most this much clock time, so its time-of-day condition
+# stays narrow; categories this close to the window still count
+SYNTH_FLEET_WINDOW_MINUTES = int(os.getenv("SYNTH_FLEET_WINDOW_MINUTES", "60"))
+SYNTH_FLEET_TIME_SLACK_MINUTES = int(os.getenv("SYNTH_FLEET_TIME_SLACK_MINUTES", "30"))
+
+_DAY = 24 * 60
+_DURATION_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(s|m|h|d)?\s*$", re.I)
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class FleetSpec(NamedTuple):
+    devices: int
+    start: int  # epoch seconds
+    utc: bool  # start carried a timezone: timestamps are written in UTC with "Z"
+    interval: int  # seconds
+    periods: int
+
+    @property
+    def rows(self) -> int:
+        return self.devices * self.periods
+
+
+def parse_duration(value: Any) -> int:
+    """Seconds from 900, "900", "15m", "1.5h" or "7d" (whole seconds)."""
+    m = _DURATION_RE.match(str(value))
+    if not m:
+        raise ValueError(f"Invalid duration: {value!r} (use seconds or a number with s/m/h/d)")
+    seconds = float(m.group(1)) * _UNIT_SECONDS[(m.group(2) or "s").lower()]
+    if seconds != int(seconds):
+        raise ValueError(f"Duration {value!r} is not a whole number of seconds")
+    return int(seconds)
+
+
+def plan_fleet(devices: int, start: str, interval: Any, duration: Any) -> FleetSpec:
+    """Validate a fleet request; timestamps are start, start + interval, ...
+    before start + duration."""
+    if devices <= 0:
+        raise ValueError("devices must be > 0")
+    try:
+        parsed = datetime.fromisoformat(str(start).strip())
+    except ValueError:
+        raise ValueError(f"Invalid start time: {start!r} (use ISO 8601, e.g. 2025-09-01T00:00:00Z)")
+    utc = parsed.tzinfo is not None
+    epoch = int((parsed if utc else parsed.replace(tzinfo=timezone.utc)).timestamp())
+    step = parse_duration(interval)
+    if step <= 0:
+        raise ValueError("interval must be > 0")
+    periods = -(-parse_duration(duration) // step)  # every timestamp before start + duration
+    if periods <= 0:
+        raise ValueError("duration must be > 0")
+    spec = FleetSpec(devices, epoch, utc, step, periods)
+    if spec.rows > SYNTH_FLEET_MAX_ROWS:
+        raise ValueError(
+            f"Fleet of {devices} devices x {periods} readings is {spec.rows} rows, "
+            f"more than {SYNTH_FLEET_MAX_ROWS}"
+        )
+    return spec
+
+
+class Window(NamedTuple):
+    first: int  # index of the window's first timestamp
+    periods: int
+    device_first: int  # index of the window's first device
+    devices: int
+
+    @property
+    def rows(self) -> int:
+        return self.periods * self.devices
+
+
+def windows(spec: FleetSpec, batch_size: int, aligned: bool = False) -> List[Window]:
+    """Windows of at most batch_size rows in time order: whole timestamps
+    when the fleet fits a batch, else one timestamp's devices split in
+    order. A window conditioned on its time of day spans at most
+    SYNTH_FLEET_WINDOW_MINUTES."""
+    batch_size = max(1, batch_size)
+    if spec.devices > batch_size:
+        return [
+            Window(t, 1, d, min(batch_size, spec.devices - d))
+            for t in range(spec.periods) for d in range(0, spec.devices, batch_size)
+        ]
+    per = batch_size // spec.devices
+    if aligned:
+        per = min(per, max(1, SYNTH_FLEET_WINDOW_MINUTES * 60 // spec.interval))
+    return [Window(first, min(per, spec.periods - first), 0, spec.devices) for first in range(0, spec.periods, per)]
+
+
+# ------------------------------------------------------------------
+# Columns
+# ------------------------------------------------------------------
+def device_ids(spec: FleetSpec) -> np.ndarray:
+    width = len(str(spec.devices))
+    return np.array([f"device-{i:0{width}d}" for i in range(1, spec.devices + 1)], dtype=object)
+
+
+def timestamps(spec: FleetSpec, window: Window) -> np.ndarray:
+    """The window's timestamps as ISO 8601 strings."""
+    seconds = spec.start + (window.first + np.arange(window.periods, dtype=np.int64)) * spec.interval
+    text = np.datetime_as_string(seconds.astype("datetime64[s]"), unit="s")
+    if spec.utc:
+        text = np.char.add(text, "Z")
+    return text.astype(object)
+
+
+def _clock_minutes(spec: FleetSpec, window: Window) -> Tuple[int, int]:
+    first = spec.start + window.first * spec.interval
+    last = first + (window.periods - 1) * spec.interval
+    return (first // 60) % _DAY, (last // 60) % _DAY
+
+
+def time_column(model, mapping: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """The model's discrete clock-time column (what the "time" parameter maps to)."""
+    spec = (mapping or {}).get("time", "time")
+    name = spec.get("column", "time") if isinstance(spec, dict) else spec
+    by_lower = {c.lower(): c for c in discrete_categories(model)}
+    return by_lower.get(str(name).lower())
+
+
+def replaced_columns(model, mapping: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Model columns the timestamp supersedes: its clock-time and date columns."""
+    out = [c for c in discrete_categories(model) if c.lower() == "date"]
+    column = time_column(model, mapping)
+    if column is not None:
+        out.append(column)
+    return out
+
+
+class TimeAligner:
+    """Per-window conditions on the model's clock-time column."""
+
+    def __init__(self, model, column: str):
+        self.column = column
+        cats = discrete_categories(model)[column]
+        minutes = [_category_minute(c) for c in cats]
+        self._cats = [c for c, m in zip(cats, minutes) if m is not None]
+        self._minutes = np.array([m for m in minutes if m is not None], dtype=np.int64)
+
+    def allowed(self, spec: FleetSpec, window: Window) -> list:
+        """Categories within SYNTH_FLEET_TIME_SLACK_MINUTES of the window's
+        clock-time span (empty: leave the column unconditioned)."""
+        if not len(self._minutes):
+            return []
+        first, last = _clock_minutes(spec, window)
+        span = (last - first) % _DAY
+        # circular distance from each category to the [first, last] arc
+        offset = (self._minutes - first) % _DAY
+        distance = np.where(offset <= span, 0, np.minimum(offset - span, _DAY - offset))
+        return [self._cats[i] for i in np.flatnonzero(distance <= SYNTH_FLEET_TIME_SLACK_MINUTES)]
+
+
+def align_column(model, conditions: Dict[str, list], mapping: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """The column windows are conditioned on by time of day, if any: only
+    requests without conditions of their own are aligned."""
+    return None if conditions else time_column(model, mapping)
+
+
+def window_conditions(
+    model, spec: FleetSpec, batches: List[Window], conditions: Dict[str, list],
+    mapping: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, list]]:
+    """Conditions for each window: the request's own, or without any, the
+    window's time of day."""
+    column = align_column(model, conditions, mapping)
+    if column is None:
+        return [conditions] * len(batches)
+    aligner = TimeAligner(model, column)
+    out = []
+    for window in batches:
+        allowed = aligner.allowed(spec, window)
+        out.append({column: allowed} if allowed else {})
+    return out
+
+
+def fleet_frame(spec: FleetSpec, window: Window, ids: np.ndarray, readings: pd.DataFrame, drop: List[str]) -> pd.DataFrame:
+    """device_id and timestamp (time order, then device order) in front of
+    the window's sampled readings."""
+    readings = readings.drop(columns=drop)
+    columns = {
+        "device_id": np.tile(ids[window.device_first:window.device_first + window.devices], window.periods),
+        "timestamp": np.repeat(timestamps(spec, window), window.devices),
+    }
+    for name in readings.columns:
+        columns[name] = readings[name].to_numpy()
+    return pd.DataFrame(columns)
@@ -0,0 +1,227 @@
+# services/metrics.py
+# In-process metrics in the Prometheus text format (GET /metrics), without
+# a client-library dependency: counters, gauges and histograms with labels,
+# all thread-safe. Stdlib only, so main.py can serve /metrics during startup.
+#
+# Generation stages (synth_stage_seconds{stage}):
+#   per batch       sample, encode, compress, pool_refill
+#   per generation  plan, slot_wait, produce_wait (the response waiting for
+#                   the next chunk), send (the client socket taking a chunk)
+# Firestore round trips: firestore_call_seconds{op}.
+# Row pool (services/row_pool.py): synth_row_pool_bytes{model_id},
+#   synth_row_pool_refilled_rows_total{model_id}, synth_row_pool_requests_total
+#   {result=hit|partial|miss}; time to first byte by where the rows came from:
+#   synth_time_to_first_byte_seconds{source}.
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+_REGISTRY: List["_Metric"] = []
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = tuple(float(10 ** e * m) for e in range(3, 9) for m in (1, 2.5, 5))  # 1e3 .. 5e8 per second
+
+
+def _format_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return str(int(v)) if float(v).is_integer() and abs(v) < 1e15 else repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self._samples()
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, v in items:
+            yield f"{self.name}{self._labels(key)} {_format_value(v)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def remove(self, **labels: str) -> None:
+        # drop a label set that no longer exists (e.g. an evicted model)
+        key = self._key(labels)
+        with self._lock:
+            self._values.pop(key, None)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (per-bucket counts, the last one being +Inf; sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall time of the block (also around an await)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(k, list(c), t[0]) for k, (c, t) in self._values.items()]
+        for key, counts, total in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                yield f"{self.name}_bucket{self._labels(key, ('le', _format_value(bound)))} {running}"
+            yield f"{self.name}_sum{self._labels(key)} {_format_value(total)}"
+            yield f"{self.name}_count{self._labels(key)} {running}"
+
+
+def render() -> str:
+    return "\n".join(line for metric in _REGISTRY for line in metric.render()) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ------------------------------------------------------------------
+# The service's metrics
+# ------------------------------------------------------------------
+STAGE_SECONDS = Histogram("synth_stage_seconds", "Time spent per generation stage", ["stage"])
+FIRESTORE_SECONDS = Histogram("firestore_call_seconds", "Firestore round-trip time by operation", ["op"])
+GENERATION_ROWS_PER_SECOND = Histogram(
+    "synth_generation_rows_per_second", "Rows per second of each completed generation", buckets=RATE_BUCKETS,
+)
+GENERATION_BYTES_PER_SECOND = Histogram(
+    "synth_generation_bytes_per_second", "Response bytes per second of each completed generation",
+    buckets=RATE_BUCKETS,
+)
+GENERATION_SECONDS = Histogram("synth_generation_seconds", "Wall time of each completed generation")
+ROWS_TOTAL = Counter("synth_rows_total", "Rows streamed by completed generations")
+BYTES_TOTAL = Counter("synth_bytes_total", "Response bytes streamed by generations")
+GENERATIONS_TOTAL = Counter("synth_generations_total", "Generations by outcome", ["outcome"])
+GENERATIONS_IN_FLIGHT = Gauge("synth_generations_in_flight", "Generations currently streaming or spooling")
+MODEL_LOAD_SECONDS = Gauge("synth_model_load_seconds", "Time the last load of each model took", ["model_id"])
+AUTH_CHECKS_TOTAL = Counter(
+    "auth_token_checks_total", "Bearer token checks by result (cached, verified, rejected)", ["result"],
+)
+AUTH_KEY_REFRESHES_TOTAL = Counter("auth_signing_key_refreshes_total", "Signing key fetches that succeeded")
+ROW_POOL_BYTES = Gauge("synth_row_pool_bytes", "Encoded rows held in each model's row pool", ["model_id"])
+ROW_POOL_REFILLED_ROWS_TOTAL = Counter(
+    "synth_row_pool_refilled_rows_total", "Rows added to each model's row pool", ["model_id"],
+)
+ROW_POOL_REQUESTS_TOTAL = Counter(
+    "synth_row_pool_requests_total", "Pool-eligible requests served entirely, partly or not at all from a pool",
+    ["result"],
+)
+TTFB_SECONDS = Histogram(
+    "synth_time_to_first_byte_seconds", "Time to the first response byte by row source (pool, partial, live, ...)",
+    ["source"],
+)
+STARTUP_PHASE_SECONDS = Gauge("startup_phase_seconds", "Wall time of each background startup phase", ["phase"])
+
+
+def track_generation(chunks: Iterable[bytes], rows: int) -> Iterator[bytes]:
+    """Re-yield a generation's chunks, recording in-flight count, how long
+    the response waited for chunks vs. for the client, and rows / bytes per
+    second once it completes."""
+    GENERATIONS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    waited = sent = 0.0
+    size = 0
+    outcome = "aborted"
+    it = iter(chunks)
+    try:
+        while True:
+            t0 = time.perf_counter()
+            try:
+                chunk = next(it)
+            except StopIteration:
+                break
+            t1 = time.perf_counter()
+            waited += t1 - t0
+            yield chunk
+            sent += time.perf_counter() - t1
+            size += len(chunk)
+        outcome = "completed"
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        GENERATION_SECONDS.observe(elapsed)
+        GENERATION_ROWS_PER_SECOND.observe(rows / elapsed)
+        GENERATION_BYTES_PER_SECOND.observe(size / elapsed)
+        ROWS_TOTAL.inc(rows)
+    except GeneratorExit:
+        raise  # closed early: the client went away
+    except BaseException:
+        outcome = "failed"
+        raise
+    finally:
+        close = getattr(it, "close", None)
+        if close is not None:
+            close()
+        GENERATIONS_IN_FLIGHT.dec()
+        GENERATIONS_TOTAL.inc(outcome=outcome)
+        BYTES_TOTAL.inc(size)
+        STAGE_SECONDS.observe(waited, stage="produce_wait")
+        STAGE_SECONDS.observe(sent, stage="send")
@@ -0,0 +1,320 @@
+# services/model_artifact.py
+# Fast-loading CTGAN artifact: a directory with
+#   meta.json      - architecture, column layout, dtypes, category values
+#   generator.pt   - generator state dict (loaded with mmap, weights only)
+#   <col>.means.npy / <col>.stds.npy - per-column mixture modes (mmap'able)
+#   cond_freq.npy  - original category frequencies for the condition vector
+# Loading reads meta.json and maps the arrays; torch and the weights are only
+# touched on the first sample() call. No ctgan / rdt / sklearn import needed.
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+
+ARTIFACT_FORMAT = "synthiot-ctgan"
+ARTIFACT_VERSION = 1
+META_FILE = "meta.json"
+GENERATOR_FILE = "generator.pt"
+COND_FREQ_FILE = "cond_freq.npy"
+
+# ClusterBasedNormalizer scales the normalised value by 4 standard deviations
+STD_MULTIPLIER = 4
+
+
+def is_artifact(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+# ------------------------------------------------------------------
+# Export (one-time conversion from a fitted CTGAN)
+# ------------------------------------------------------------------
+def _column_meta(info, index: int) -> Dict[str, Any]:
+    tr = info.transform
+    meta: Dict[str, Any] = {
+        "name": info.column_name,
+        "type": info.column_type,
+        "output_dims": [int(s.dim) for s in info.output_info],
+    }
+    if info.column_type == "continuous":
+        if tr.null_transformer is not None and tr.null_transformer.models_missing_values():
+            raise ValueError(f"Column '{info.column_name}': missing-value columns are not supported")
+        valid = np.asarray(tr.valid_component_indicator, dtype=bool)
+        means = tr._bgm_transformer.means_.reshape([-1])[valid]
+        stds = np.sqrt(tr._bgm_transformer.covariances_).reshape([-1])[valid]
+        meta.update({
+            "arrays": f"c{index}",
+            "dtype": str(tr._dtype),
+            "clip": [float(tr._min_value), float(tr._max_value)] if tr.enforce_min_max_values else None,
+            "_means": means.astype(np.float64),
+            "_stds": stds.astype(np.float64),
+        })
+    else:
+        meta["categories"] = [v.item() if isinstance(v, np.generic) else v for v in tr.dummies]
+    return meta
+
+
+def _export_parts(model):
+    # (meta, arrays, cond_freq, generator state dict) of a fitted CTGAN
+    transformer = model._transformer
+    sampler = model._data_sampler
+
+    columns: List[Dict[str, Any]] = []
+    arrays: Dict[str, np.ndarray] = {}
+    for i, info in enumerate(transformer._column_transform_info_list):
+        col = _column_meta(info, i)
+        if "_means" in col:
+            arrays[f"{col['arrays']}.means"] = col.pop("_means")
+            arrays[f"{col['arrays']}.stds"] = col.pop("_stds")
+        columns.append(col)
+
+    cond_dim = int(sampler.dim_cond_vec())
+    cond_freq = None
+    if cond_dim:
+        freq = sampler._discrete_column_category_prob.flatten()
+        freq = freq[freq != 0]
+        cond_freq = (freq / np.sum(freq)).astype(np.float64)
+
+    state = {k: v.detach().cpu() for k, v in model._generator.state_dict().items()}
+
+    meta = {
+        "format": ARTIFACT_FORMAT,
+        "version": ARTIFACT_VERSION,
+        "embedding_dim": int(model._embedding_dim),
+        "generator_dim": [int(d) for d in model._generator_dim],
+        "data_dim": int(transformer.output_dimensions),
+        "cond_dim": cond_dim,
+        "batch_size": int(model._batch_size),
+        # stock sampling runs the generator in whatever mode it was saved in
+        "generator_training": bool(model._generator.training),
+        "column_dtypes": {k: str(v) for k, v in transformer._column_raw_dtypes.items()},
+        "columns": columns,
+    }
+    return meta, arrays, cond_freq, state
+
+
+def export_artifact(model, out_dir: str) -> None:
+    """Write a fitted CTGAN (as loaded by pickle_compat) as an artifact directory."""
+    import torch
+
+    meta, arrays, cond_freq, state = _export_parts(model)
+    os.makedirs(out_dir, exist_ok=True)
+    for name, values in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), values)
+    if cond_freq is not None:
+        np.save(os.path.join(out_dir, COND_FREQ_FILE), cond_freq)
+    torch.save(state, os.path.join(out_dir, GENERATOR_FILE))
+    with open(os.path.join(out_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+# ------------------------------------------------------------------
+# Load / sample
+# ------------------------------------------------------------------
+def _build_generator(embedding_dim: int, generator_dim: List[int], data_dim: int):
+    # Same module layout (and state-dict keys) as ctgan's Generator/Residual.
+    import torch
+    from torch import nn
+
+    class Residual(nn.Module):
+        def __init__(self, i, o):
+            super().__init__()
+            self.fc = nn.Linear(i, o)
+            self.bn = nn.BatchNorm1d(o)
+            self.relu = nn.ReLU()
+
+        def forward(self, x):
+            return torch.cat([self.relu(self.bn(self.fc(x))), x], dim=1)
+
+    class Generator(nn.Module):
+        def __init__(self):
+            super().__init__()
+            dim = embedding_dim
+            seq = []
+            for item in generator_dim:
+                seq.append(Residual(dim, item))
+                dim += item
+            seq.append(nn.Linear(dim, data_dim))
+            self.seq = nn.Sequential(*seq)
+
+        def forward(self, x):
+            return self.seq(x)
+
+    return Generator()
+
+
+class ArtifactModel:
+    """CTGAN sampler backed by an artifact directory.
+
+    sample() follows CTGAN.sample: z ~ N(0, I) plus a condition vector drawn
+    from the original category frequencies, the generator forward pass,
+    tanh / Gumbel-softmax activations and the mode-specific inverse
+    transform - but the inverse transform works on the exported arrays, and
+    for Gumbel-softmax spans only the argmax is kept (which is all the
+    inverse transform reads).
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != ARTIFACT_FORMAT or meta.get("version") != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported model artifact in {path}")
+        arrays: Dict[str, np.ndarray] = {}
+        for col in meta["columns"]:
+            if col["type"] == "continuous":
+                key = col["arrays"]
+                arrays[f"{key}.means"] = np.load(os.path.join(path, f"{key}.means.npy"), mmap_mode="r")
+                arrays[f"{key}.stds"] = np.load(os.path.join(path, f"{key}.stds.npy"), mmap_mode="r")
+        cond_path = os.path.join(path, COND_FREQ_FILE)
+        cond_freq = np.load(cond_path, mmap_mode="r") if meta["cond_dim"] else None
+        self._setup(path, meta, arrays, cond_freq)
+
+    def _setup(self, path: str, meta: Dict[str, Any], arrays: Dict[str, np.ndarray], cond_freq, generator=None):
+        self.path = path
+        self.meta = meta
+        self.columns = meta["columns"]
+        self._arrays = arrays
+        for col in self.columns:
+            if col["type"] == "discrete":
+                col["_lookup"] = np.empty(len(col["categories"]), dtype=object)
+                col["_lookup"][:] = col["categories"]
+        self._cond_freq = cond_freq
+        self._generator = generator
+        self._generator_lock = threading.Lock()
+
+    @classmethod
+    def from_ctgan(cls, model, path: str = "") -> "ArtifactModel":
+        """The same sampler over a fitted CTGAN already in memory (no files
+        written); `path` is only informational."""
+        meta, arrays, cond_freq, state = _export_parts(model)
+        gen = _build_generator(meta["embedding_dim"] + meta["cond_dim"], meta["generator_dim"], meta["data_dim"])
+        gen.load_state_dict(state)
+        gen.train(meta["generator_training"])
+        self = cls.__new__(cls)
+        self._setup(path, meta, arrays, cond_freq, gen)
+        return self
+
+    @property
+    def generator(self):
+        if self._generator is None:
+            with self._generator_lock:
+                if self._generator is None:
+                    import torch
+                    gen = _build_generator(
+                        self.meta["embedding_dim"] + self.meta["cond_dim"],
+                        self.meta["generator_dim"],
+                        self.meta["data_dim"],
+                    )
+                    state = torch.load(
+                        os.path.join(self.path, GENERATOR_FILE),
+                        map_location="cpu", mmap=True, weights_only=True,
+                    )
+                    gen.load_state_dict(state)
+                    gen.train(self.meta["generator_training"])
+                    self._generator = gen
+        return self._generator
+
+    def discrete_categories(self) -> Dict[str, list]:
+        return {c["name"]: list(c["categories"]) for c in self.columns if c["type"] == "discrete"}
+
+    def condition_index(self) -> Dict[str, Tuple[int, list]]:
+        """Discrete column -> (offset in the condition vector, categories)."""
+        out, offset = {}, 0
+        for c in self.columns:
+            if c["type"] == "discrete":
+                out[c["name"]] = (offset, c["categories"])
+                offset += len(c["categories"])
+        return out
+
+    def condition_frequencies(self) -> Optional[np.ndarray]:
+        return self._cond_freq
+
+    def _condition_vectors(
+        self, n: int, rng: np.random.Generator, cond_choices: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    ) -> Optional[np.ndarray]:
+        if self._cond_freq is None:
+            return None
+        if cond_choices is None:
+            idx = rng.choice(len(self._cond_freq), n, p=self._cond_freq)
+        else:
+            # one condition-vector slot per row, drawn from the allowed slots
+            idx = rng.choice(cond_choices[0], n, p=cond_choices[1])
+        cond = np.zeros((n, self.meta["cond_dim"]), dtype=np.float32)
+        cond[np.arange(n), idx] = 1
+        return cond
+
+    def _raw_sample(self, n: int, torch_gen, rng: np.random.Generator, cond_choices=None):
+        """Generator output for n rows: (n, data_dim) pre-activation logits."""
+        import torch
+        gen = self.generator
+        if self.meta["generator_training"]:
+            # BatchNorm normalises with batch statistics in training mode, so
+            # keep CTGAN's full training-sized batches and trim the surplus.
+            step = self.meta["batch_size"]
+            total = (n // step + 1) * step
+        else:
+            # In eval mode batch composition does not matter: one large pass.
+            step = total = n
+        out = []
+        for _ in range(0, total, step):
+            z = torch.randn(step, self.meta["embedding_dim"], generator=torch_gen)
+            cond = self._condition_vectors(step, rng, cond_choices)
+            if cond is not None:
+                z = torch.cat([z, torch.from_numpy(cond)], dim=1)
+            out.append(gen(z))
+        logits = torch.cat(out, dim=0) if len(out) > 1 else out[0]
+        return logits[:n]
+
+    def _inverse(self, logits, torch_gen) -> pd.DataFrame:
+        import torch
+        data: Dict[str, Any] = {}
+        st = 0
+        for col in self.columns:
+            dims = col["output_dims"]
+            if col["type"] == "continuous":
+                alpha = torch.tanh(logits[:, st]).clamp_(-1, 1).numpy()
+                comp = _gumbel_argmax(logits[:, st + 1 : st + 1 + dims[1]], torch_gen)
+                key = col["arrays"]
+                values = alpha * STD_MULTIPLIER * self._arrays[f"{key}.stds"][comp] + self._arrays[f"{key}.means"][comp]
+                if col["clip"] is not None:
+                    values = values.clip(col["clip"][0], col["clip"][1])
+                if np.dtype(col["dtype"]).kind in "iu":
+                    values = values.round(0)
+                data[col["name"]] = values.astype(col["dtype"])
+            else:
+                idx = _gumbel_argmax(logits[:, st : st + dims[0]], torch_gen)
+                data[col["name"]] = col["_lookup"][idx]
+            st += sum(dims)
+        return pd.DataFrame(data).astype(self.meta["column_dtypes"])
+
+    def sample(
+        self,
+        n: int,
+        seed: Optional[int] = None,
+        cond_choices: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ) -> pd.DataFrame:
+        """Sample n rows.
+
+        cond_choices = (slots, probabilities) restricts the condition vector
+        to the given slots (see condition_index) instead of drawing from the
+        original category frequencies; services.sampling builds it.
+        """
+        import torch
+        seq = np.random.SeedSequence(seed)
+        torch_gen = torch.Generator().manual_seed(int(seq.generate_state(1, dtype=np.uint64)[0] >> 1))
+        rng = np.random.default_rng(seq)
+        with torch.inference_mode():
+            logits = self._raw_sample(n, torch_gen, rng, cond_choices)
+            return self._inverse(logits, torch_gen)
+
+
+def _gumbel_argmax(logits, torch_gen) -> np.ndarray:
+    # argmax(softmax((logits + g) / tau)) == argmax(logits + g), g ~ Gumbel(0, 1)
+    import torch
+    u = torch.rand(logits.shape, generator=torch_gen).clamp_(min=1e-10)
+    return torch.argmax(logits - torch.log(-torch.log(u)), dim=1).numpy()
+
+
+def load_artifact(path: str) -> ArtifactModel:
+    return ArtifactModel(path)
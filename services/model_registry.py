@@ -0,0 +1,328 @@
+# services/model_registry.py
+# Maps projects to CTGAN artifacts and keeps the loaded ones in memory.
+#
+# SYNTH_MODEL_REGISTRY is either inline JSON or a path to a JSON file:
+#   {
+#     "models": {"temperature": "/models/temp.pkl",
+#                "humidity": {"path": "/models/hum.pkl", "conditions": {"season": "Season"},
+#                             "precision": "int8"}},
+#     "sensor_types": {"temperature": "temperature", "temp": "temperature"},
+#     "default": "temperature"
+#   }
+# A project may pin a model with its own `model_id` field; otherwise its
+# `sensor_type` is looked up, then the default. Without a registry config the
+# only model is "default" = CTGAN_MODEL_PATH. The file is re-read when it
+# changes, so models can be added without restarting the process. The optional
+# per-model "conditions" map parsed chat parameters onto discrete columns
+# (see services.sampling.resolve_conditions). The optional "precision"
+# ("fp32", "bf16" or "int8"; default SYNTH_MODEL_PRECISION) runs the model's
+# generator in reduced precision, but only if it passes the fidelity gate in
+# services.fast_sampler when the model loads; otherwise it stays at fp32 and
+# /synth/models shows why.
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+from services.metrics import MODEL_LOAD_SECONDS
+
+load_dotenv()
+
+DEFAULT_MODEL_ID = "default"
+
+# Resident budget for loaded models; least-recently-used models are dropped
+# once it is exceeded (0 = unbounded). A model counts once for this process
+# and once more per shard worker process holding a copy (see
+# synth_service's shard pools), and dropping it shuts those pools down. The
+# most recently used model always stays, even if it alone is over budget.
+SYNTH_MODEL_MEMORY_BUDGET_MB = float(os.getenv("SYNTH_MODEL_MEMORY_BUDGET_MB", "0"))
+
+SYNTH_MODEL_PRECISION = os.getenv("SYNTH_MODEL_PRECISION", "fp32")
+
+
+class ResolvedModel(NamedTuple):
+    model_id: str
+    path: str
+    model: Any
+    conditions: Dict[str, Any]
+
+
+class _ModelEntry:
+    def __init__(self, model_id: str, path: str, conditions: Optional[Dict[str, Any]] = None):
+        self.model_id = model_id
+        self.path = path
+        self.conditions = conditions or {}
+        self.precision = SYNTH_MODEL_PRECISION  # requested; the model's own attribute is what runs
+        self.fidelity: Optional[Dict[str, Any]] = None
+        self.equivalence: Optional[Dict[str, Any]] = None  # fast-path sampler check
+        self.lock = threading.Lock()  # serialises loading of this model only
+        self.model = None
+        self.size_bytes = 0
+        self.loaded_at = 0.0
+        self.last_used = 0.0
+
+
+def load_model_file(path: str, fast: Optional[bool] = None):
+    # Artifact directories (tools/convert_model.py) load lazily; anything
+    # else is treated as a legacy CTGAN pickle. With `fast` (default:
+    # SYNTH_FAST_SAMPLER) both are wrapped in the fast-path sampler
+    # (services/fast_sampler.py) unchecked, unless the model has columns the
+    # artifact format cannot express; the registry loads the stock model and
+    # puts it through equivalence_gate instead.
+    from services.fast_sampler import SYNTH_FAST_SAMPLER, fast_sampler
+    from services.model_artifact import is_artifact, load_artifact
+    if is_artifact(path):
+        model = load_artifact(path)
+    else:
+        from services.pickle_compat import load_old_pickle
+        model = load_old_pickle(path)
+    if not (SYNTH_FAST_SAMPLER if fast is None else fast):
+        return model
+    try:
+        return fast_sampler(model)
+    except ValueError as e:
+        print(f"[synth] fast sampler unavailable for {path}: {e}")
+        return model
+
+
+def sampler_kind(model) -> str:
+    precision = getattr(model, "precision", "fp32")
+    return type(model).__name__ if precision == "fp32" else f"{type(model).__name__}/{precision}"
+
+
+def model_precision(model) -> str:
+    return getattr(model, "precision", "fp32")
+
+
+def is_fast_sampler(model) -> bool:
+    from services.fast_sampler import FastSampler
+    return isinstance(model, FastSampler)
+
+
+def model_format(path: str) -> str:
+    from services.model_artifact import is_artifact
+    return "artifact" if is_artifact(path) else "pickle"
+
+
+def _estimate_size(path: str) -> int:
+    # The pickle / artifact files hold the generator weights and every
+    # per-column mixture, so their size tracks the resident footprint
+    # closely enough for budgeting.
+    try:
+        if os.path.isdir(path):
+            return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ModelRegistry:
+    def __init__(self, budget_bytes: int = 0):
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()  # guards the maps below, never held while loading
+        self._entries: Dict[str, _ModelEntry] = {}
+        self._sensor_types: Dict[str, str] = {}
+        self._default_id = DEFAULT_MODEL_ID
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._config_source: Optional[str] = None
+        self._config_mtime: Optional[float] = None
+        self._configured = False
+
+    # -- configuration ---------------------------------------------------
+    def _read_config(self) -> Dict[str, Any]:
+        raw = os.getenv("SYNTH_MODEL_REGISTRY") or ""
+        if not raw.strip():
+            self._config_source, self._config_mtime = None, None
+            return {}
+        if raw.lstrip().startswith("{"):
+            self._config_source, self._config_mtime = None, None
+            return json.loads(raw)
+        self._config_source = raw
+        self._config_mtime = os.path.getmtime(raw)
+        with open(raw, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _apply_config(self, cfg: Dict[str, Any]) -> None:
+        models: Dict[str, Dict[str, Any]] = {}
+        for model_id, spec in (cfg.get("models") or {}).items():
+            models[model_id] = spec if isinstance(spec, dict) else {"path": spec}
+        if not models:
+            models[DEFAULT_MODEL_ID] = {"path": os.getenv("CTGAN_MODEL_PATH") or ""}
+        default_id = cfg.get("default") or (DEFAULT_MODEL_ID if DEFAULT_MODEL_ID in models else next(iter(models)))
+        sensor_types = {k.strip().lower(): v for k, v in (cfg.get("sensor_types") or {}).items()}
+
+        with self._lock:
+            for model_id, spec in models.items():
+                entry = self._entries.get(model_id)
+                if entry is None or entry.path != spec["path"]:
+                    if entry is not None:
+                        self._drop(entry)
+                    entry = self._entries[model_id] = _ModelEntry(model_id, spec["path"])
+                entry.conditions = spec.get("conditions") or {}
+                precision = spec.get("precision") or SYNTH_MODEL_PRECISION
+                if precision != entry.precision:
+                    self._drop(entry)  # reloaded (and re-checked) at the new precision
+                    entry.precision = precision
+            for model_id in list(self._entries):
+                if model_id not in models:
+                    self._drop(self._entries.pop(model_id))
+            self._sensor_types = sensor_types
+            self._default_id = default_id
+            self._configured = True
+
+    def _maybe_reload(self) -> None:
+        if not self._configured:
+            self._apply_config(self._read_config())
+            return
+        if self._config_source:
+            try:
+                mtime = os.path.getmtime(self._config_source)
+            except OSError:
+                return
+            if mtime != self._config_mtime:
+                self._apply_config(self._read_config())
+                print(f"[synth] model registry reloaded from {self._config_source}")
+
+    # -- lookup ----------------------------------------------------------
+    def resolve(self, sensor_type: Optional[str] = None, model_id: Optional[str] = None) -> str:
+        """Return the model id for a project's override / sensor type."""
+        self._maybe_reload()
+        with self._lock:
+            if model_id:
+                if model_id not in self._entries:
+                    raise FileNotFoundError(f"Unknown model '{model_id}'")
+                return model_id
+            if sensor_type:
+                mapped = self._sensor_types.get(sensor_type.strip().lower())
+                if mapped in self._entries:
+                    return mapped
+            return self._default_id
+
+    def get(self, model_id: Optional[str] = None) -> ResolvedModel:
+        """Return a loaded model, loading it on first use."""
+        self._maybe_reload()
+        with self._lock:
+            entry = self._entries.get(model_id or self._default_id)
+        if entry is None:
+            raise FileNotFoundError(f"Unknown model '{model_id}'")
+
+        model = entry.model
+        if model is None:
+            with entry.lock:
+                model = entry.model
+                if model is None:
+                    if not entry.path or not os.path.exists(entry.path):
+                        raise FileNotFoundError(
+                            f"CTGAN model '{entry.model_id}' not found. Set CTGAN_MODEL_PATH "
+                            "or SYNTH_MODEL_REGISTRY."
+                        )
+                    t0 = time.perf_counter()
+                    model = load_model_file(entry.path, fast=False)
+                    from services.fast_sampler import SYNTH_FAST_SAMPLER, equivalence_gate
+                    if SYNTH_FAST_SAMPLER:
+                        model, entry.equivalence = equivalence_gate(model)
+                        if not entry.equivalence["activated"]:
+                            print(
+                                f"[synth] model '{entry.model_id}' keeps the stock sampler, fast path "
+                                f"refused: {entry.equivalence.get('reason')}"
+                            )
+                    if entry.precision != model_precision(model):
+                        from services.fast_sampler import fidelity_gate
+                        model, entry.fidelity = fidelity_gate(model, entry.precision)
+                        if not entry.fidelity["activated"]:
+                            print(
+                                f"[synth] model '{entry.model_id}' stays at fp32, {entry.precision} "
+                                f"refused: {entry.fidelity.get('reason')}"
+                            )
+                    entry.size_bytes = _estimate_size(entry.path)
+                    entry.loaded_at = time.time()
+                    entry.model = model
+                    load_seconds = time.perf_counter() - t0
+                    MODEL_LOAD_SECONDS.set(load_seconds, model_id=entry.model_id)
+                    print(
+                        f"[synth] model '{entry.model_id}' loaded in "
+                        f"{load_seconds:.2f}s ({model_format(entry.path)}, {sampler_kind(model)})"
+                    )
+
+        with self._lock:
+            entry.last_used = time.time()
+            self._lru[entry.model_id] = None
+            self._lru.move_to_end(entry.model_id)
+            self._evict()
+        return ResolvedModel(entry.model_id, entry.path, model, entry.conditions)
+
+    def is_loaded(self, model_id: Optional[str] = None) -> bool:
+        """Whether the model (default: the default model) is resident; never loads."""
+        with self._lock:
+            entry = self._entries.get(model_id or self._default_id)
+            return entry is not None and entry.model is not None
+
+    def loaded(self) -> List[Tuple[str, Any]]:
+        """(model_id, model) of every resident model."""
+        with self._lock:
+            return [(e.model_id, e.model) for e in self._entries.values() if e.model is not None]
+
+    # -- eviction --------------------------------------------------------
+    @staticmethod
+    def _shard_pools():
+        # shard pools only exist once synth_service is in use; importing it
+        # from here would be circular
+        return sys.modules.get("services.synth_service")
+
+    def _footprint(self, entry: _ModelEntry) -> int:
+        shard = self._shard_pools()
+        copies = 1 + (shard.shard_pool_workers(entry.path) if shard is not None else 0)
+        return entry.size_bytes * copies
+
+    def _drop(self, entry: _ModelEntry) -> None:
+        # Streams that already hold the model keep it alive until they
+        # finish; so do streams on its shard pools, which shut down after.
+        entry.model = None
+        entry.size_bytes = 0
+        self._lru.pop(entry.model_id, None)
+        shard = self._shard_pools()
+        if shard is not None:
+            shard.discard_shard_pools(entry.path)
+
+    def _evict(self) -> None:
+        if self.budget_bytes <= 0:
+            return
+        resident = sum(self._footprint(self._entries[m]) for m in self._lru if m in self._entries)
+        while resident > self.budget_bytes and len(self._lru) > 1:
+            victim_id = next(iter(self._lru))
+            victim = self._entries.get(victim_id)
+            if victim is None:
+                self._lru.pop(victim_id)
+                continue
+            resident -= self._footprint(victim)
+            self._drop(victim)
+            print(f"[synth] model '{victim_id}' evicted (budget {self.budget_bytes / 2**20:.0f} MB)")
+
+    def trim(self) -> None:
+        """Evict down to the budget, e.g. after a shard pool started."""
+        with self._lock:
+            self._evict()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "model_id": e.model_id,
+                    "path": e.path,
+                    "loaded": e.model is not None,
+                    "sampler": sampler_kind(e.model) if e.model is not None else None,
+                    "precision": e.precision,
+                    "fidelity": e.fidelity,
+                    "equivalence": e.equivalence,
+                    "size_bytes": e.size_bytes,
+                    "resident_bytes": self._footprint(e),
+                    "last_used": e.last_used,
+                }
+                for e in self._entries.values()
+            ]
+
+
+registry = ModelRegistry(budget_bytes=int(SYNTH_MODEL_MEMORY_BUDGET_MB * 2**20))
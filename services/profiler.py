@@ -0,0 +1,231 @@
+# services/profiler.py
+# Opt-in sampling profiler for single requests. With SYNTH_PROFILING=1 a
+# request carrying "X-Profile: 1" is profiled from the moment it arrives
+# until its last body chunk is sent (a streamed generation included): a
+# thread snapshots every thread's Python stack each
+# SYNTH_PROFILE_INTERVAL_MS and counts the stacks in the folded format
+# (flamegraph.pl, speedscope). The response gets an X-Profile-Id header;
+# GET /debug/profiles/{id} returns the folded stacks, ?format=svg a flame
+# graph. The whole process is sampled (the work runs on threadpool and
+# prefetch threads), so one profile runs at a time; a request asking while
+# another is profiled is served unprofiled. Stdlib only.
+import html
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SYNTH_PROFILING = os.getenv("SYNTH_PROFILING", "0") == "1"
+SYNTH_PROFILE_INTERVAL_MS = float(os.getenv("SYNTH_PROFILE_INTERVAL_MS", "5"))
+SYNTH_PROFILE_MAX_SECONDS = float(os.getenv("SYNTH_PROFILE_MAX_SECONDS", "60"))
+SYNTH_PROFILE_DIR = os.getenv("SYNTH_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "synth-profiles")
+SYNTH_PROFILE_KEEP = int(os.getenv("SYNTH_PROFILE_KEEP", "20"))
+
+PROFILE_HEADER = b"x-profile"
+_ID = re.compile(r"^[0-9a-f]{16}$")
+
+# leaf frames of threads that are parked, not working: left out of the graph
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),  # concurrent.futures idle worker
+    ("profiler.py", "_sample"),
+}
+
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = SYNTH_PROFILE_INTERVAL_MS / 1000, max_seconds: float = SYNTH_PROFILE_MAX_SECONDS):
+        self.interval = max(0.0005, interval)
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._sample, name="synth-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        t0 = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            if time.perf_counter() - t0 > self.max_seconds:
+                break
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                # worker threads are numbered; the graph merges them by pool
+                thread = re.sub(r"[-_]\d+(_\d+)?$", "", names.get(ident, "thread"))
+                stack.append(thread)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+        self.seconds = time.perf_counter() - t0
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+# ------------------------------------------------------------------
+# Storage and rendering
+# ------------------------------------------------------------------
+def _path(profile_id: str) -> str:
+    return os.path.join(SYNTH_PROFILE_DIR, f"{profile_id}.folded")
+
+
+def save(profile_id: str, profiler: SamplingProfiler) -> None:
+    os.makedirs(SYNTH_PROFILE_DIR, exist_ok=True)
+    with open(_path(profile_id), "w") as f:
+        f.write(profiler.folded())
+    # keep the newest SYNTH_PROFILE_KEEP
+    saved = sorted(
+        (os.path.join(SYNTH_PROFILE_DIR, name) for name in os.listdir(SYNTH_PROFILE_DIR) if name.endswith(".folded")),
+        key=os.path.getmtime,
+    )
+    for old in saved[:-SYNTH_PROFILE_KEEP]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+
+def load(profile_id: str) -> Optional[str]:
+    """The folded stacks of a saved profile (None if unknown)."""
+    if not _ID.match(profile_id):
+        return None
+    try:
+        with open(_path(profile_id)) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def flame_svg(folded: str, width: int = 1200, row: int = 16) -> str:
+    """A static flame graph (root at the bottom) of folded stacks."""
+    tree: Dict = {}
+    total = 0
+    for line in folded.splitlines():
+        stack, _, n = line.rpartition(" ")
+        if not stack:
+            continue
+        total += int(n)
+        node = tree
+        for name in stack.split(";"):
+            entry = node.setdefault(name, [0, {}])
+            entry[0] += int(n)
+            node = entry[1]
+    if not total:
+        return f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{row}"></svg>'
+
+    boxes: List[Tuple[int, float, float, str, int]] = []  # depth, x, w, name, samples
+
+    def walk(node: Dict, depth: int, x: float) -> int:
+        deepest = depth
+        for name, (n, children) in sorted(node.items()):
+            w = width * n / total
+            boxes.append((depth, x, w, name, n))
+            deepest = max(deepest, walk(children, depth + 1, x))
+            x += w
+        return deepest
+
+    height = (walk(tree, 0, 0.0) + 1) * row
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">']
+    for depth, x, w, name, n in boxes:
+        if w < 0.5:
+            continue
+        y = height - (depth + 1) * row
+        hue = 20 + sum(name.split(":")[0].encode()) % 40  # by file
+        label = html.escape(name)
+        chars = int((w - 4) / 7)
+        text = label if len(name) <= chars else (html.escape(name[: chars - 2]) + ".." if chars > 3 else "")
+        parts.append(
+            f'<g><title>{label} ({n} samples, {100 * n / total:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="hsl({hue},85%,60%)"/>'
+            f'<text x="{x + 2:.1f}" y="{y + row - 4}">{text}</text></g>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+# ------------------------------------------------------------------
+# ASGI middleware
+# ------------------------------------------------------------------
+class ProfilingMiddleware:
+    """Profiles requests that ask for it with the X-Profile header."""
+
+    def __init__(self, app, enabled: bool = SYNTH_PROFILING):
+        self.app = app
+        self.enabled = enabled
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http" or not self.enabled
+            or dict(scope["headers"]).get(PROFILE_HEADER, b"0") in (b"", b"0")
+            or not self._busy.acquire(blocking=False)
+        ):
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid.uuid4().hex[:16]
+        profiler = SamplingProfiler()
+        finished = False
+
+        def finish() -> None:
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            profiler.stop()
+            try:
+                save(profile_id, profiler)
+                print(
+                    f"[profile] {scope['path']} -> {profile_id}: {profiler.samples} samples "
+                    f"in {profiler.seconds:.2f}s"
+                )
+            except OSError as e:
+                print(f"[profile] could not save {profile_id}: {e}")
+            finally:
+                self._busy.release()
+
+        async def send_profiled(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            finish()
@@ -0,0 +1,165 @@
+# services/project_cache.py
+# In-process cache of project documents, keyed by project_id, for the
+# ownership checks done on every chat message and generation request.
+# Entries expire after PROJECT_CACHE_TTL_SECONDS (bounding staleness across
+# instances) and the least recently used are dropped beyond
+# PROJECT_CACHE_MAX_ENTRIES. Writes through project_service invalidate the
+# entry in this process immediately: invalidation also bumps the project's
+# generation, and a read that was already in flight does not store its
+# (possibly older) document when the generation changed under it. get/owned
+# are for the sampling and job threads (blocking client), aget/aowned for the
+# async request handlers.
+import asyncio
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from utils.firebase import adb, db
+from services.metrics import FIRESTORE_SECONDS
+
+load_dotenv()
+
+PROJECT_CACHE_TTL_SECONDS = float(os.getenv("PROJECT_CACHE_TTL_SECONDS", "30"))
+PROJECT_CACHE_MAX_ENTRIES = int(os.getenv("PROJECT_CACHE_MAX_ENTRIES", "10000"))
+
+
+def _if_owner(data: Optional[Dict[str, Any]], user_id: str) -> Optional[Dict[str, Any]]:
+    if data is None or data.get("user_id") != user_id:
+        return None
+    return data
+
+
+class ProjectCache:
+    def __init__(self, ttl: float = PROJECT_CACHE_TTL_SECONDS, max_entries: int = PROJECT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # project_id -> (expires_at, document or None if it does not exist)
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        # project_id -> pending async read (event loop only)
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+        # project_id -> invalidations so far. clear() bumps the epoch, and so
+        # does dropping counters past max_entries (reads in flight then skip
+        # their store rather than risk a stale one).
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self, project_id: str) -> Optional[Dict[str, Any]]:
+        with FIRESTORE_SECONDS.time(op="project_get"):
+            proj = db.collection("projects").document(project_id).get()
+        return proj.to_dict() if proj.exists else None
+
+    async def _aload(self, project_id: str) -> Optional[Dict[str, Any]]:
+        with FIRESTORE_SECONDS.time(op="project_get"):
+            proj = await adb.collection("projects").document(project_id).get()
+        return proj.to_dict() if proj.exists else None
+
+    def _lookup(self, project_id: str, now: float):
+        # (True, copy of the document) on a fresh hit, (False, None) otherwise
+        with self._lock:
+            entry = self._entries.get(project_id) if self.ttl > 0 and self.max_entries > 0 else None
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(project_id)
+                self.hits += 1
+                return True, copy.deepcopy(entry[1])
+            self.misses += 1
+            return False, None
+
+    def _generation(self, project_id: str) -> Tuple[int, int]:
+        with self._lock:
+            return self._epoch, self._generations.get(project_id, 0)
+
+    def get(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """The project document (a private copy), or None if it does not exist."""
+        now = time.monotonic()
+        hit, data = self._lookup(project_id, now)
+        if hit:
+            return data
+        generation = self._generation(project_id)
+        data = self._load(project_id)
+        self._store(project_id, data, now, generation)
+        return copy.deepcopy(data)
+
+    async def aget(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Async get: a miss is read with the AsyncClient, and concurrent
+        misses for the same project share that one read."""
+        now = time.monotonic()
+        hit, data = self._lookup(project_id, now)
+        if hit:
+            return data
+        load = self._inflight.get(project_id)
+        if load is None:
+            generation = self._generation(project_id)
+            load = asyncio.ensure_future(self._aload(project_id))
+            self._inflight[project_id] = load
+            load.add_done_callback(lambda _: self._forget_inflight(project_id, load))
+            data = await asyncio.shield(load)
+            self._store(project_id, data, now, generation)
+        else:
+            data = await asyncio.shield(load)
+        return copy.deepcopy(data)
+
+    def _forget_inflight(self, project_id: str, load: "asyncio.Future") -> None:
+        # an invalidation may already have replaced it with a newer read
+        if self._inflight.get(project_id) is load:
+            del self._inflight[project_id]
+
+    def _store(
+        self, project_id: str, data: Optional[Dict[str, Any]], now: float, generation: Tuple[int, int],
+    ) -> None:
+        if self.ttl <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            if (self._epoch, self._generations.get(project_id, 0)) != generation:
+                return  # invalidated while the read was in flight
+            self._entries[project_id] = (now + self.ttl, data)
+            self._entries.move_to_end(project_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def owned(self, project_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """The project if it exists and belongs to user_id, else None."""
+        return _if_owner(self.get(project_id), user_id)
+
+    async def aowned(self, project_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        return _if_owner(await self.aget(project_id), user_id)
+
+    def invalidate(self, project_id: str) -> None:
+        with self._lock:
+            self._entries.pop(project_id, None)
+            self._generations[project_id] = self._generations.get(project_id, 0) + 1
+            self._generations.move_to_end(project_id)
+            while len(self._generations) > max(1, self.max_entries):
+                self._generations.popitem(last=False)
+                self._epoch += 1
+        # later readers must not join a read that started before the write
+        self._inflight.pop(project_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+        self._inflight.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+project_cache = ProjectCache()
@@ -1,40 +1,76 @@
 # services/project_service.py
-from utils.firebase import db
+from utils.firebase import adb
 from models.project import ProjectCreate, ProjectUpdate
 from google.cloud.firestore_v1 import FieldFilter  # ← CORRECT
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.api_core.exceptions import NotFound
 import google.cloud.firestore as firestore  # ← CORRECT
+from typing import List, Optional, Tuple
+from utils.pagination import decode_cursor, encode_cursor
+from services.project_cache import project_cache
+from services.metrics import FIRESTORE_SECONDS
 
-def create_project(user_id: str, project: ProjectCreate):
-    proj_ref = db.collection('projects').document()
-    proj_ref.set({
+LIST_PAGE_MAX = 200
+# the fields a project list needs; anything else on the document is skipped
+_LIST_FIELDS = ["user_id", "name", "description", "sensor_type", "model_id", "created_at"]
+
+async def create_project(user_id: str, project: ProjectCreate):
+    proj_ref = adb.collection('projects').document()
+    data = {
         'user_id': user_id,
         'name': project.name,
         'description': project.description,
         'sensor_type': project.sensor_type,
         'created_at': firestore.SERVER_TIMESTAMP  # Now works!
-    })
+    }
+    if project.model_id:
+        data['model_id'] = project.model_id
+    with FIRESTORE_SECONDS.time(op="project_create"):
+        await proj_ref.set(data)
+    project_cache.invalidate(proj_ref.id)  # in case the id was looked up before
     return {"project_id": proj_ref.id, **project.dict()}
 
-def get_user_projects(user_id: str):
-    projects = db.collection('projects') \
+async def get_user_projects(
+    user_id: str, limit: Optional[int] = None, cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    # Ordered by document id: with the equality filter that needs no
+    # composite index, and ids are unique so the cursor is one value.
+    query = adb.collection('projects') \
         .where(filter=FieldFilter('user_id', '==', user_id)) \
-        .stream()
-    return [{"id": p.id, **p.to_dict()} for p in projects]
+        .select(_LIST_FIELDS) \
+        .order_by(FieldPath.document_id())
+    if cursor is not None:
+        (last_id,) = decode_cursor(cursor, 1)
+        query = query.start_after({"__name__": last_id})
+    if limit is not None:
+        query = query.limit(limit)
+    with FIRESTORE_SECONDS.time(op="project_list"):
+        projects = [{"id": p.id, **p.to_dict()} async for p in query.stream()]
+    next_cursor = encode_cursor([projects[-1]["id"]]) if limit is not None and len(projects) == limit else None
+    return projects, next_cursor
 
-def update_project(project_id: str, user_id: str, update: ProjectUpdate):
-    proj_ref = db.collection('projects').document(project_id)
-    proj = proj_ref.get()
-    if not proj.exists or proj.to_dict()['user_id'] != user_id:
+async def update_project(project_id: str, user_id: str, update: ProjectUpdate):
+    # ownership from the cache (user_id never changes); the write below
+    # invalidates the entry so the next read sees it
+    if await project_cache.aowned(project_id, user_id) is None:
         return None
+    proj_ref = adb.collection('projects').document(project_id)
     update_data = {k: v for k, v in update.dict().items() if v is not None}
     if update_data:
-        proj_ref.update(update_data)
+        try:
+            with FIRESTORE_SECONDS.time(op="project_update"):
+                await proj_ref.update(update_data)
+        except NotFound:  # deleted elsewhere while still cached
+            return None
+        finally:
+            project_cache.invalidate(project_id)
     return {"message": "Updated"}
 
-def delete_project(project_id: str, user_id: str):
-    proj_ref = db.collection('projects').document(project_id)
-    proj = proj_ref.get()
-    if not proj.exists or proj.to_dict()['user_id'] != user_id:
+async def delete_project(project_id: str, user_id: str):
+    if await project_cache.aowned(project_id, user_id) is None:
         return None
-    proj_ref.delete()
+    proj_ref = adb.collection('projects').document(project_id)
+    with FIRESTORE_SECONDS.time(op="project_delete"):
+        await proj_ref.delete()
+    project_cache.invalidate(project_id)
     return {"message": "Deleted"}
\ No newline at end of file
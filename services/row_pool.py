@@ -0,0 +1,310 @@
+# services/row_pool.py
+# Warm reservoir of pre-sampled, pre-encoded CSV rows for each loaded model.
+# A background thread tops every resident model's pool up to
+# SYNTH_ROW_POOL_MAX_MB, one SYNTH_ROW_POOL_BLOCK_ROWS block at a time, and
+# only while the generation scheduler has nothing active or queued.
+# Unseeded, unconditioned CSV requests (not fleets) are served from the pool first (a
+# request the pool covers entirely needs no generation slot at all); the
+# rest is sampled live. Seeded requests never use it: their bytes must be a
+# function of the seed (see synth_cache).
+#
+# Off unless SYNTH_ROW_POOL=1. GET /synth/pool shows fill level, refill
+# rate, hit rate and time-to-first-byte by source; /metrics has the same as
+# synth_row_pool_* and synth_time_to_first_byte_seconds (services/metrics.py).
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from services.metrics import (
+    ROW_POOL_BYTES, ROW_POOL_REFILLED_ROWS_TOTAL, ROW_POOL_REQUESTS_TOTAL, STAGE_SECONDS, TTFB_SECONDS,
+)
+from services.model_registry import registry
+from services.sampling import sample_rows
+from services.synth_formats import csv_chunk_encoder
+from services.synth_scheduler import apply_torch_threads, generation_scheduler
+
+load_dotenv()
+
+SYNTH_ROW_POOL = os.getenv("SYNTH_ROW_POOL", "0") == "1"
+SYNTH_ROW_POOL_MAX_MB = float(os.getenv("SYNTH_ROW_POOL_MAX_MB", "32"))  # per model
+SYNTH_ROW_POOL_BLOCK_ROWS = int(os.getenv("SYNTH_ROW_POOL_BLOCK_ROWS", "2000"))
+SYNTH_ROW_POOL_IDLE_SECONDS = float(os.getenv("SYNTH_ROW_POOL_IDLE_SECONDS", "0.05"))
+
+_RATE_WINDOW_SECONDS = 60.0
+_TTFB_SAMPLES = 512
+
+
+class _Block:
+    """Encoded CSV rows (no header) and the offset just past each row."""
+
+    __slots__ = ("data", "rows", "ends")
+
+    def __init__(self, data: bytes, rows: int, ends: Optional[np.ndarray]):
+        self.data = data
+        self.rows = rows
+        self.ends = ends  # None when a quoted field may hold a newline: never split
+
+    @classmethod
+    def encoded(cls, data: bytes, rows: int) -> "_Block":
+        if b'"' in data:
+            return cls(data, rows, None)
+        return cls(data, rows, np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10) + 1)
+
+    def split(self, n: int) -> Tuple["_Block", "_Block"]:
+        cut = int(self.ends[n - 1])
+        return _Block(self.data[:cut], n, self.ends[:n]), _Block(self.data[cut:], self.rows - n, self.ends[n:] - cut)
+
+
+class Pooled(NamedTuple):
+    """Rows taken from a pool for one request."""
+    pool: "RowPool"
+    header: bytes
+    blocks: List[_Block]
+    rows: int
+    requested: int
+
+    def data(self):
+        # the header, then the rows; counted once the rows are actually sent
+        # (a request refused after taking them is not)
+        ROW_POOL_REQUESTS_TOTAL.inc(result="hit" if self.rows == self.requested else "partial")
+        yield self.header
+        for block in self.blocks:
+            yield block.data
+
+
+class RowPool:
+    def __init__(self, model_id: str, model, max_bytes: int):
+        self.model_id = model_id
+        self.model = model
+        self.max_bytes = max_bytes
+        self.header: Optional[bytes] = None
+        self._lock = threading.Lock()
+        self._blocks: Deque[_Block] = deque()
+        self._rows = 0
+        self._bytes = 0
+        self._encode = csv_chunk_encoder()  # refill thread only
+        self.refilled_rows = 0
+        self.refill_seconds = 0.0
+        self._recent: Deque[Tuple[float, int]] = deque()  # (time, rows) refills in the rate window
+        self._closed = False
+
+    def _publish(self) -> None:
+        # under self._lock; a dropped pool leaves the gauge to its successor
+        if not self._closed:
+            ROW_POOL_BYTES.set(self._bytes, model_id=self.model_id)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            ROW_POOL_BYTES.remove(model_id=self.model_id)
+
+    def room(self) -> bool:
+        with self._lock:
+            return self._bytes < self.max_bytes
+
+    def refill_one(self, rows: int) -> None:
+        t0 = time.perf_counter()
+        df = sample_rows(self.model, rows, None, None)
+        if self.header is None:
+            # the encoder's own header line, split off a one-row encoding
+            head = bytes(self._encode(df.iloc[:1], header=True))
+            self.header = head[: len(head) - len(bytes(self._encode(df.iloc[:1], header=False)))]
+        block = _Block.encoded(bytes(self._encode(df, header=False)), len(df))
+        now = time.perf_counter()
+        with self._lock:
+            self._blocks.append(block)
+            self._rows += block.rows
+            self._bytes += len(block.data)
+            self.refilled_rows += block.rows
+            self.refill_seconds += now - t0
+            self._recent.append((now, block.rows))
+            self._publish()
+        ROW_POOL_REFILLED_ROWS_TOTAL.inc(block.rows, model_id=self.model_id)
+        STAGE_SECONDS.observe(now - t0, stage="pool_refill")
+
+    def take(self, n: int) -> Pooled:
+        """Up to n rows, oldest first; a block is split when it is safe to."""
+        blocks: List[_Block] = []
+        taken = 0
+        with self._lock:
+            while self._blocks and taken < n:
+                block = self._blocks.popleft()
+                if taken + block.rows > n:
+                    if block.ends is None:
+                        self._blocks.appendleft(block)
+                        break
+                    block, rest = block.split(n - taken)
+                    self._blocks.appendleft(rest)
+                blocks.append(block)
+                taken += block.rows
+                self._rows -= block.rows
+                self._bytes -= len(block.data)
+            self._publish()
+        return Pooled(self, self.header or b"", blocks, taken, n)
+
+    def restore(self, pooled: Pooled) -> None:
+        # rows taken for a request that was then refused go back to the front
+        with self._lock:
+            for block in reversed(pooled.blocks):
+                self._blocks.appendleft(block)
+                self._rows += block.rows
+                self._bytes += len(block.data)
+            self._publish()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.perf_counter()
+            while self._recent and now - self._recent[0][0] > _RATE_WINDOW_SECONDS:
+                self._recent.popleft()
+            return {
+                "model_id": self.model_id,
+                "rows": self._rows,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "blocks": len(self._blocks),
+                "refilled_rows": self.refilled_rows,
+                # rows added per second of wall time over the last minute, and
+                # per second of refill work
+                "refill_rows_per_second": round(sum(r for _, r in self._recent) / _RATE_WINDOW_SECONDS, 1),
+                "refill_throughput": round(self.refilled_rows / self.refill_seconds, 1) if self.refill_seconds else 0.0,
+            }
+
+
+class RowPools:
+    def __init__(
+        self,
+        enabled: bool = SYNTH_ROW_POOL,
+        max_bytes: int = int(SYNTH_ROW_POOL_MAX_MB * 2**20),
+        block_rows: int = SYNTH_ROW_POOL_BLOCK_ROWS,
+    ):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.block_rows = max(1, block_rows)
+        self._lock = threading.Lock()
+        self._pools: Dict[str, RowPool] = {}
+        self._filler: Optional[threading.Thread] = None
+        # requests: served entirely / partly / not at all from a pool
+        self.hits = 0
+        self.partial = 0
+        self.misses = 0
+        self.rows_requested = 0
+        self.rows_served = 0
+        self._ttfb: Dict[str, Deque[float]] = {}
+
+    # -- serving -------------------------------------------------------------
+    def eligible(self, plan) -> bool:
+        return (
+            self.enabled and plan.seed is None and not plan.conditions
+            and plan.fmt == "csv" and not plan.sharded and plan.fleet is None
+        )
+
+    def take(self, plan) -> Optional[Pooled]:
+        """Rows for an eligible plan from its model's pool (None if not eligible)."""
+        if not self.eligible(plan):
+            return None
+        self.start()
+        with self._lock:
+            pool = self._pools.get(plan.resolved.model_id)
+        if pool is None or pool.model is not plan.resolved.model or pool.header is None:
+            pooled = None
+        else:
+            pooled = pool.take(plan.rows)
+        served = pooled.rows if pooled is not None else 0
+        with self._lock:
+            self.rows_requested += plan.rows
+            self.rows_served += served
+            if served == plan.rows:
+                self.hits += 1
+            elif served:
+                self.partial += 1
+            else:
+                self.misses += 1
+        if not served:
+            ROW_POOL_REQUESTS_TOTAL.inc(result="miss")
+        return pooled if served else None
+
+    def restore(self, pooled: Optional[Pooled]) -> None:
+        # the request was refused after all: not counted
+        if pooled is not None:
+            pooled.pool.restore(pooled)
+            with self._lock:
+                self.rows_served -= pooled.rows
+                self.rows_requested -= pooled.requested
+                if pooled.rows == pooled.requested:
+                    self.hits -= 1
+                else:
+                    self.partial -= 1
+
+    def record_ttfb(self, source: str, seconds: float) -> None:
+        TTFB_SECONDS.observe(seconds, source=source)
+        with self._lock:
+            self._ttfb.setdefault(source, deque(maxlen=_TTFB_SAMPLES)).append(seconds)
+
+    # -- refilling -----------------------------------------------------------
+    def start(self) -> None:
+        if not self.enabled or self._filler is not None:
+            return
+        with self._lock:
+            if self._filler is None:
+                self._filler = threading.Thread(target=self._fill_loop, name="synth-row-pool", daemon=True)
+                self._filler.start()
+
+    def _sync_pools(self) -> List[RowPool]:
+        # one pool per resident model; a reloaded or evicted model's pool goes
+        resident = dict(registry.loaded())
+        with self._lock:
+            for model_id in list(self._pools):
+                if resident.get(model_id) is not self._pools[model_id].model:
+                    self._pools.pop(model_id).close()
+            for model_id, model in resident.items():
+                if model_id not in self._pools:
+                    self._pools[model_id] = RowPool(model_id, model, self.max_bytes)
+            return list(self._pools.values())
+
+    def _fill_loop(self) -> None:
+        apply_torch_threads(1)  # background work: stay off the other cores
+        while True:
+            filled = False
+            try:
+                if generation_scheduler.idle():
+                    for pool in self._sync_pools():
+                        if pool.room():
+                            pool.refill_one(self.block_rows)
+                            filled = True
+                            break
+            except Exception as e:
+                print(f"[synth] row pool refill failed: {e}")
+            if not filled:
+                time.sleep(SYNTH_ROW_POOL_IDLE_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pools = list(self._pools.values())
+            requests = self.hits + self.partial + self.misses
+            ttfb = {}
+            for source, samples in self._ttfb.items():
+                ordered = sorted(samples)
+                ttfb[source] = {
+                    "count": len(ordered),
+                    "p50_ms": round(ordered[(len(ordered) - 1) // 2] * 1000, 2),
+                    "p95_ms": round(ordered[int(0.95 * (len(ordered) - 1))] * 1000, 2),
+                }
+            out = {
+                "enabled": self.enabled,
+                "block_rows": self.block_rows,
+                "requests": requests,
+                "hits": self.hits,
+                "partial": self.partial,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / requests, 4) if requests else 0.0,
+                "row_hit_rate": round(self.rows_served / self.rows_requested, 4) if self.rows_requested else 0.0,
+                "ttfb": ttfb,
+            }
+        out["pools"] = [p.stats() for p in pools]
+        return out
+
+
+row_pools = RowPools()
@@ -0,0 +1,290 @@
+# services/sampling.py
+# Row sampling shared by the streaming and sharded paths: per-batch seeding
+# and conditional sampling on discrete columns from parsed chat parameters
+# (services.ai_service.parse_prompt).
+import os
+import re
+import threading
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from services.model_artifact import ArtifactModel
+
+# Parsed parameters that can become row conditions. request_type picks the
+# data, not rows, so it is not one of them.
+CONDITION_KEYS = ("ac", "season", "indoor", "time", "location")
+
+# Conditions the generator does not honour exactly are enforced by rejection;
+# drawing more than this many rows per requested row means the conditions are
+# too rare for the model, which is an error (never rows that don't match).
+SYNTH_CONDITION_MAX_OVERSAMPLE = float(os.getenv("SYNTH_CONDITION_MAX_OVERSAMPLE", "20"))
+# rows drawn while planning to check that the conditions can be met at all,
+# so a hopeless request is refused before its response starts
+SYNTH_CONDITION_PROBE_ROWS = int(os.getenv("SYNTH_CONDITION_PROBE_ROWS", "512"))
+# the probe is seeded so its verdict is the same on every request (and every
+# replica); verdicts are cached per (model, conditions), so only the first
+# request for a combination pays for the probe and 304/cache hits never do
+SYNTH_CONDITION_PROBE_SEED = int(os.getenv("SYNTH_CONDITION_PROBE_SEED", "0"))
+SYNTH_CONDITION_PROBE_CACHE = int(os.getenv("SYNTH_CONDITION_PROBE_CACHE", "1024"))
+
+# minutes of day, [start, end); windows may wrap past midnight
+TIME_WORDS = {
+    "morning": (6 * 60, 12 * 60),
+    "afternoon": (12 * 60, 17 * 60),
+    "evening": (17 * 60, 21 * 60),
+    "night": (21 * 60, 6 * 60),
+    "noon": (12 * 60, 13 * 60),
+    "midnight": (0, 60),
+}
+
+_CLOCK_RE = re.compile(r"^\s*(\d{1,2})(?::(\d{2}))?(?::(\d{2}))?\s*(am|pm)?\s*$", re.I)
+
+
+# ------------------------------------------------------------------
+# Time expressions
+# ------------------------------------------------------------------
+def _parse_clock(text: str, meridiem: Optional[str] = None) -> Optional[Tuple[int, Optional[str], bool]]:
+    """'3', '3 pm', '15:30', '23:29:54' -> (minute of day, meridiem, had_minutes)."""
+    m = _CLOCK_RE.match(text)
+    if not m:
+        return None
+    hour, minute = int(m.group(1)), int(m.group(2) or 0)
+    mer = (m.group(4) or meridiem or "").lower() or None
+    if mer == "pm" and hour < 12:
+        hour += 12
+    elif mer == "am" and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return hour * 60 + minute, mer, m.group(2) is not None
+
+
+def parse_time_window(expr: str) -> Optional[Tuple[int, int]]:
+    """ai_service time expression -> (start, end) minutes of day."""
+    expr = expr.strip().lower()
+    if expr in TIME_WORDS:
+        return TIME_WORDS[expr]
+    if " - " in expr:
+        a, b = expr.split(" - ", 1)
+        end = _parse_clock(b)
+        if end is None:
+            return None
+        # "3 - 4 pm": the first bound borrows the second one's am/pm
+        start = _parse_clock(a, end[1])
+        if start is None:
+            return None
+        stop = end[0] + (1 if end[2] else 60)
+        return start[0], stop % (24 * 60)
+    single = _parse_clock(expr)
+    if single is None:
+        return None
+    # "3 pm" means the whole hour, "3:30 pm" that minute
+    return single[0], (single[0] + (1 if single[2] else 60)) % (24 * 60)
+
+
+def _in_window(minute: Optional[int], window: Tuple[int, int]) -> bool:
+    if minute is None:
+        return False
+    start, end = window
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def _category_minute(value: Any) -> Optional[int]:
+    parsed = _parse_clock(str(value))
+    return parsed[0] if parsed else None
+
+
+# ------------------------------------------------------------------
+# Model introspection
+# ------------------------------------------------------------------
+def discrete_categories(model) -> Dict[str, list]:
+    if isinstance(model, ArtifactModel):
+        return model.discrete_categories()
+    return {
+        info.column_name: list(info.transform.dummies)
+        for info in model._transformer._column_transform_info_list
+        if info.column_type == "discrete"
+    }
+
+
+def _category_frequencies(model, column: str) -> np.ndarray:
+    if isinstance(model, ArtifactModel):
+        offset, cats = model.condition_index()[column]
+        return np.asarray(model.condition_frequencies()[offset : offset + len(cats)], dtype=np.float64)
+    discrete = [
+        info for info in model._transformer._column_transform_info_list if info.column_type == "discrete"
+    ]
+    j = [info.column_name for info in discrete].index(column)
+    n_cat = len(discrete[j].transform.dummies)
+    return np.asarray(model._data_sampler._discrete_column_category_prob[j][:n_cat], dtype=np.float64)
+
+
+# ------------------------------------------------------------------
+# Conditions
+# ------------------------------------------------------------------
+def resolve_conditions(model, params: Dict[str, Any], mapping: Optional[Dict[str, Any]] = None) -> Dict[str, list]:
+    """Map parsed chat parameters to the allowed values of discrete columns.
+
+    By default a parameter applies to the discrete column of the same name
+    (case-insensitive). A model's registry entry can map it elsewhere:
+      {"season": "Season", "ac": {"column": "AC", "values": {"on": "ON"}}}
+    The "time" parameter selects every category whose clock time falls in
+    the parsed window. Parameters without a matching column are ignored;
+    a parameter whose column has no matching category raises ValueError.
+    """
+    categories = discrete_categories(model)
+    by_lower = {name.lower(): name for name in categories}
+    mapping = mapping or {}
+    out: Dict[str, list] = {}
+    for key in CONDITION_KEYS:
+        value = params.get(key)
+        if value in (None, "", "mentioned"):
+            continue
+        spec = mapping.get(key, key)
+        if isinstance(spec, str):
+            spec = {"column": spec}
+        column = by_lower.get(str(spec.get("column", key)).lower())
+        if column is None:
+            continue
+        cats = categories[column]
+        if key == "time":
+            window = parse_time_window(str(value))
+            if window is None:
+                continue
+            allowed = [c for c in cats if _in_window(_category_minute(c), window)]
+        else:
+            target = (spec.get("values") or {}).get(str(value).lower(), value)
+            targets = {str(t).lower() for t in (target if isinstance(target, list) else [target])}
+            allowed = [c for c in cats if str(c).lower() in targets]
+        if not allowed:
+            raise ValueError(f"No '{column}' values in the model match {key}={value!r}")
+        out[column] = allowed
+    return out
+
+
+def _condition_plan(model, conditions: Dict[str, list]):
+    """Pick the most selective condition for the generator's condition vector.
+
+    CTGAN conditions on one discrete category per row; the column whose
+    allowed values are rarest in the training data benefits most from it,
+    the remaining conditions are enforced by rejection.
+    """
+    best = None
+    for column, allowed in conditions.items():
+        cats = discrete_categories(model)[column]
+        idx = np.array([cats.index(v) for v in allowed], dtype=np.int64)
+        freq = _category_frequencies(model, column)[idx]
+        mass = float(freq.sum())
+        if best is None or mass < best[0]:
+            best = (mass, column, idx, freq)
+    _, column, idx, freq = best
+    probs = freq / freq.sum() if freq.sum() > 0 else np.full(len(idx), 1.0 / len(idx))
+    return column, idx, probs
+
+
+def seed_global_rngs(seed: int) -> None:
+    import torch
+    torch.manual_seed(seed)
+    np.random.seed(seed % (2 ** 32))
+
+
+def _sample_plain(model, n: int, seed: Optional[int]) -> pd.DataFrame:
+    if isinstance(model, ArtifactModel):
+        return model.sample(n, seed=seed)  # own RNG streams, no global state
+    if seed is not None:
+        seed_global_rngs(seed)
+    return model.sample(n)
+
+
+def _sample_with_plan(model, n: int, plan, rng: np.random.Generator) -> pd.DataFrame:
+    column, idx, probs = plan
+    if isinstance(model, ArtifactModel):
+        offset, _ = model.condition_index()[column]
+        seed = int(rng.integers(2 ** 63))
+        return model.sample(n, seed=seed, cond_choices=(offset + idx, probs))
+    # stock CTGAN takes a single condition value per call
+    cats = discrete_categories(model)[column]
+    counts = rng.multinomial(n, probs)
+    frames = [model.sample(int(k), column, cats[i]) for i, k in zip(idx, counts) if k > 0]
+    df = pd.concat(frames, ignore_index=True)
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+
+def _matches(df: pd.DataFrame, conditions: Dict[str, list]) -> np.ndarray:
+    mask = np.ones(len(df), dtype=bool)
+    for column, allowed in conditions.items():
+        mask &= df[column].isin(allowed).to_numpy()
+    return mask
+
+
+def _too_rare(conditions: Dict[str, list], matched: int, drawn: int) -> ValueError:
+    return ValueError(
+        f"Conditions on {', '.join(sorted(conditions))} are too rare for this model: "
+        f"{matched} of {drawn} sampled rows matched"
+    )
+
+
+_probe_verdicts: "weakref.WeakKeyDictionary[Any, Dict[tuple, Optional[Tuple[int, int]]]]" = weakref.WeakKeyDictionary()
+_probe_lock = threading.Lock()
+
+
+def _probe(model, conditions: Dict[str, list]) -> Tuple[int, int]:
+    """(matched, drawn) for a seeded probe sample under `conditions`."""
+    rng = np.random.default_rng(SYNTH_CONDITION_PROBE_SEED)
+    if not isinstance(model, ArtifactModel):
+        seed_global_rngs(SYNTH_CONDITION_PROBE_SEED)  # stock CTGAN draws from the global RNGs
+    df = _sample_with_plan(model, SYNTH_CONDITION_PROBE_ROWS, _condition_plan(model, conditions), rng)
+    return int(_matches(df, conditions).sum()), len(df)
+
+
+def check_conditions(model, conditions: Dict[str, list]) -> None:
+    """Raise ValueError when a probe sample shows `conditions` matching fewer
+    rows than the oversample budget allows for."""
+    if not conditions or SYNTH_CONDITION_PROBE_ROWS <= 0:
+        return
+    key = tuple(sorted((column, tuple(map(str, allowed))) for column, allowed in conditions.items()))
+    with _probe_lock:
+        verdicts = _probe_verdicts.setdefault(model, {})
+        hit = key in verdicts
+        failed = verdicts.get(key)
+    if not hit:
+        matched, drawn = _probe(model, conditions)
+        failed = (matched, drawn) if matched * SYNTH_CONDITION_MAX_OVERSAMPLE < drawn else None
+        with _probe_lock:
+            if len(verdicts) >= SYNTH_CONDITION_PROBE_CACHE:
+                verdicts.pop(next(iter(verdicts)))  # oldest first
+            verdicts[key] = failed
+    if failed is not None:
+        raise _too_rare(conditions, *failed)
+
+
+def sample_rows(model, n: int, conditions: Optional[Dict[str, list]] = None, seed: Optional[int] = None) -> pd.DataFrame:
+    """Sample n rows, optionally restricted to `conditions` (see resolve_conditions).
+
+    Every row returned matches the conditions; ValueError if n matching rows
+    were not found within the oversample budget.
+    """
+    if not conditions:
+        return _sample_plain(model, n, seed)
+    if not isinstance(model, ArtifactModel) and seed is not None:
+        seed_global_rngs(seed)
+    rng = np.random.default_rng(seed)
+    plan = _condition_plan(model, conditions)
+    budget = int(n * SYNTH_CONDITION_MAX_OVERSAMPLE)
+    accepted: List[pd.DataFrame] = []
+    have = drawn = 0
+    rate = 1.0
+    while have < n and drawn < budget:
+        m = min(budget - drawn, max(64, int((n - have) / rate * 1.1)))
+        df = _sample_with_plan(model, m, plan, rng)
+        drawn += m
+        hit = df[_matches(df, conditions)]
+        accepted.append(hit)
+        have += len(hit)
+        rate = max(len(hit) / m, 1.0 / SYNTH_CONDITION_MAX_OVERSAMPLE)
+    if have < n:
+        raise _too_rare(conditions, have, drawn)
+    return pd.concat(accepted, ignore_index=True).head(n)
@@ -0,0 +1,49 @@
+# services/shard_worker.py
+# Runs inside the sharded-generation process pool. Kept free of Firebase and
+# FastAPI imports so spawned workers start with only the ML stack.
+from typing import Dict, Optional, Tuple, Union
+import pandas as pd
+from services.dataset_profile import DatasetProfile
+from services.synth_formats import csv_chunk_encoder
+from services.sampling import sample_rows
+
+_MODEL = None
+_CSV = None
+
+def init_worker(model_path: str, torch_threads: int = 1, precision: str = "fp32", fast: bool = True) -> None:
+    # Process pool initializer: load one model copy per worker process, on
+    # the sampler and at the precision the parent's gates already accepted.
+    global _MODEL
+    import torch
+    from services.model_registry import load_model_file, model_precision
+    torch.set_num_threads(max(1, torch_threads))
+    _MODEL = load_model_file(model_path, fast=fast)
+    if precision != model_precision(_MODEL):
+        from services.fast_sampler import fast_sampler
+        _MODEL = fast_sampler(_MODEL, precision)
+
+def sample_shard(
+    job: Tuple[int, int, Optional[int], Optional[bool], Optional[Dict[str, list]], bool]
+) -> Union[bytes, pd.DataFrame, Tuple[bytes, DatasetProfile]]:
+    """Sample one shard and return it already encoded as CSV.
+
+    job = (shard_index, rows, seed, csv_header, conditions, profile); with
+    csv_header=None the raw DataFrame is returned instead, for formats
+    encoded in the parent. With profile set the CSV comes back as
+    (bytes, partial DatasetProfile of the shard) for the parent to merge.
+    """
+    global _CSV
+    _, n, seed, header, conditions, profile = job
+    if _MODEL is None:
+        raise RuntimeError("shard worker not initialised")
+    df = sample_rows(_MODEL, n, conditions, seed)
+    if header is None:
+        return df
+    if _CSV is None:
+        _CSV = csv_chunk_encoder()  # buffer reused by every shard of this worker
+    payload = bytes(_CSV(df, header=header))
+    if not profile:
+        return payload
+    partial = DatasetProfile()
+    partial.update(df)
+    return payload, partial
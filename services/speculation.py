@@ -0,0 +1,407 @@
+# services/speculation.py
+# Speculative pre-generation. When a chat message parses to a usable
+# request, the chat router starts sampling it in the background right away
+# instead of waiting for the /synth/generate the browser sends after the
+# "Your data is getting generated" reply. The rows are encoded as CSV and
+# spooled to local disk, one entry per chat. A download from that chat
+# whose plan matches (same model and conditions, unseeded CSV, not a
+# fleet) attaches to the entry, finished or still being written, instead
+# of sampling again. A smaller download is cut from the entry; a larger
+# one gets the rest sampled live behind it, like a partial row pool hit
+# (services/row_pool.py).
+#
+# Speculation is a guess, so it gets little CPU: SYNTH_SPECULATE_WORKERS
+# threads sampling at SYNTH_SPECULATE_TORCH_THREADS torch threads each, no
+# generation slot, and a pause while streamed requests wait for a slot.
+# Once a download attaches, the entry samples at a normal generation's
+# thread share. Entries nobody attached to within
+# SYNTH_SPECULATE_IDLE_SECONDS are cancelled and deleted, and a new message
+# in the chat replaces its entry. The spool stays under
+# SYNTH_SPECULATE_MAX_MB by dropping the oldest unattached entries.
+#
+# Off unless SYNTH_SPECULATE=1. GET /synth/speculation shows the counters.
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from services.metrics import STAGE_SECONDS
+from services.model_registry import registry
+from services.project_cache import project_cache
+from services.sampling import sample_rows
+from services.synth_formats import csv_chunk_encoder
+from services.synth_scheduler import apply_torch_threads, generation_scheduler
+from services.synth_service import GenerationPlan, plan_generation
+
+load_dotenv()
+
+SYNTH_SPECULATE = os.getenv("SYNTH_SPECULATE", "0") == "1"
+# rows sampled per speculation: what the client usually downloads
+SYNTH_SPECULATE_ROWS = int(os.getenv("SYNTH_SPECULATE_ROWS", "10000"))
+SYNTH_SPECULATE_BATCH_ROWS = int(os.getenv("SYNTH_SPECULATE_BATCH_ROWS", "2000"))
+SYNTH_SPECULATE_WORKERS = int(os.getenv("SYNTH_SPECULATE_WORKERS", "1"))
+SYNTH_SPECULATE_TORCH_THREADS = int(os.getenv("SYNTH_SPECULATE_TORCH_THREADS", "1"))
+SYNTH_SPECULATE_IDLE_SECONDS = float(os.getenv("SYNTH_SPECULATE_IDLE_SECONDS", "120"))
+SYNTH_SPECULATE_MAX_MB = float(os.getenv("SYNTH_SPECULATE_MAX_MB", "256"))
+SYNTH_SPECULATE_DIR = os.getenv("SYNTH_SPECULATE_DIR") or os.path.join(tempfile.gettempdir(), "synth-speculative")
+SYNTH_SPECULATE_PAUSE_SECONDS = float(os.getenv("SYNTH_SPECULATE_PAUSE_SECONDS", "0.05"))
+
+# entry states
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+_QUOTED_OR_NEWLINE = re.compile(rb'"(?:[^"]|"")*"|\n')
+
+
+class _Cancelled(Exception):
+    pass
+
+
+def _cut(data: bytes, rows: int) -> bytes:
+    """The first `rows` CSV records of `data` (newlines inside quotes don't end one)."""
+    if b'"' not in data:
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+        return data[: int(ends[rows - 1]) + 1]
+    seen = 0
+    for m in _QUOTED_OR_NEWLINE.finditer(data):
+        if m.group() == b"\n":
+            seen += 1
+            if seen == rows:
+                return data[: m.end()]
+    return data
+
+
+def _usable(params: Optional[dict]) -> bool:
+    # parse_prompt always returns a dict (raw_prompt, confidence, ...): only a
+    # message that asked for data is worth sampling for, not "hello"
+    return bool(params) and bool(params.get("request_type"))
+
+
+class _Entry:
+    """One chat's speculative generation and its spool file."""
+
+    def __init__(self, key: Tuple[str, str, str], params: dict, path: str):
+        self.key = key  # (project_id, user_id, chat_id)
+        self.params = params
+        self.path = path
+        self.plan: Optional[GenerationPlan] = None  # planned on the worker
+        self.header: Optional[bytes] = None
+        self.batches: List[Tuple[int, int]] = []  # (end offset, rows) of each written batch
+        self.bytes = 0
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.cancelled = False
+        self.attached = False
+        self.created_at = time.monotonic()
+        self.cond = threading.Condition()
+        # the writer, and the spool index or the download that took the entry;
+        # the file goes when both are done with it
+        self._refs = 2
+
+
+class Speculated:
+    """Rows of a speculative entry taken for one download; same interface
+    as row_pool.Pooled for stream_plan."""
+
+    def __init__(self, pool: "Speculator", entry: _Entry, rows: int, requested: int):
+        self.pool = pool
+        self.entry = entry
+        self.rows = rows
+        self.requested = requested
+        # the download is done with the entry when the stream ends, or when
+        # it is dropped without ever being iterated
+        self._done = weakref.finalize(self, pool._detach, entry)
+
+    def data(self) -> Iterator[bytes]:
+        # the header, then the entry's rows as they are written, cut at `rows`
+        entry, sent, i, f = self.entry, 0, 0, None
+        try:
+            while sent < self.rows:
+                with entry.cond:
+                    while i >= len(entry.batches) and entry.state in (QUEUED, RUNNING):
+                        entry.cond.wait()
+                    if i >= len(entry.batches):
+                        raise RuntimeError(f"Speculative generation {entry.state}: {entry.error}")
+                    start = entry.batches[i - 1][0] if i else 0
+                    end, n = entry.batches[i]
+                if f is None:
+                    f = open(entry.path, "rb")
+                    yield entry.header
+                f.seek(start)
+                chunk = f.read(end - start)
+                if sent + n > self.rows:
+                    chunk, n = _cut(chunk, self.rows - sent), self.rows - sent
+                sent += n
+                i += 1
+                yield chunk
+        finally:
+            if f is not None:
+                f.close()
+            self._done()
+
+
+class Speculator:
+    def __init__(
+        self,
+        enabled: bool = SYNTH_SPECULATE,
+        rows: int = SYNTH_SPECULATE_ROWS,
+        max_bytes: int = int(SYNTH_SPECULATE_MAX_MB * 2**20),
+        spool_dir: str = SYNTH_SPECULATE_DIR,
+    ):
+        self.enabled = enabled
+        self.rows = max(1, rows)
+        self.max_bytes = max_bytes
+        self.spool_dir = spool_dir
+        self._lock = threading.Lock()
+        # unattached entries by (project_id, user_id, chat_id), oldest first
+        self._entries: "OrderedDict[Tuple[str, str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._sweeper: Optional[threading.Thread] = None
+        self.started = 0
+        self.skipped = 0  # not planned: model not resident, conditions unusable, ...
+        self.attached = 0
+        self.mismatched = 0  # the chat's download asked for something else
+        self.replaced = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _start(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._pool = ThreadPoolExecutor(
+                    max_workers=max(1, SYNTH_SPECULATE_WORKERS), thread_name_prefix="synth-speculate",
+                )
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="synth-speculate-sweeper", daemon=True)
+                self._sweeper.start()
+            return self._pool
+
+    # -- starting ------------------------------------------------------------
+    def start(self, project_id: str, chat_id: str, user_id: str, params: Optional[dict]) -> bool:
+        """Speculate on a chat's newly parsed request; replaces the chat's
+        previous entry. Cheap: planning and sampling happen on a worker."""
+        if not self.enabled or not _usable(params):
+            return False
+        pool = self._start()
+        key = (project_id, user_id, chat_id)
+        entry = _Entry(key, params, os.path.join(self.spool_dir, f"{uuid.uuid4().hex}.csv"))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            self._entries[key] = entry
+            self.started += 1
+            if old is not None:
+                self.replaced += 1
+        if old is not None:
+            self._cancel(old)
+        pool.submit(self._run, entry)
+        return True
+
+    def _plan(self, entry: _Entry) -> Optional[GenerationPlan]:
+        project_id, user_id, _ = entry.key
+        project = project_cache.owned(project_id, user_id)
+        if project is None:
+            return None
+        # never load a model on a guess
+        model_id = registry.resolve(project.get("sensor_type"), project.get("model_id"))
+        if model_id not in dict(registry.loaded()):
+            return None
+        try:
+            return plan_generation(
+                project_id, user_id, self.rows, SYNTH_SPECULATE_BATCH_ROWS, params=entry.params, project=project,
+            )
+        except (ValueError, PermissionError, FileNotFoundError):
+            return None
+
+    def _pace(self, entry: _Entry) -> None:
+        # unattached: yield to streamed requests waiting for a slot, on few threads
+        while not entry.attached and not entry.cancelled and generation_scheduler.busy():
+            time.sleep(SYNTH_SPECULATE_PAUSE_SECONDS)
+        if entry.cancelled:
+            raise _Cancelled()
+        apply_torch_threads(generation_scheduler.torch_threads() if entry.attached else SYNTH_SPECULATE_TORCH_THREADS)
+
+    def _run(self, entry: _Entry) -> None:
+        try:
+            if entry.cancelled:
+                raise _Cancelled()
+            plan = self._plan(entry)
+            with entry.cond:
+                entry.plan = plan
+                entry.state = RUNNING if plan is not None else FAILED
+                entry.cond.notify_all()
+            if plan is None:
+                with self._lock:
+                    self.skipped += 1
+                self._discard(entry)
+                return
+            encode = csv_chunk_encoder()
+            with open(entry.path, "wb") as f:
+                for n in plan.sizes:
+                    self._pace(entry)
+                    with STAGE_SECONDS.time(stage="speculate"):
+                        df = sample_rows(plan.resolved.model, n, plan.conditions, None)
+                        if entry.header is None:
+                            # the encoder's own header line, split off a one-row encoding
+                            head = bytes(encode(df.iloc[:1], header=True))
+                            entry.header = head[: len(head) - len(bytes(encode(df.iloc[:1], header=False)))]
+                        data = bytes(encode(df, header=False))
+                    f.write(data)
+                    f.flush()
+                    with entry.cond:
+                        entry.bytes += len(data)
+                        entry.batches.append((entry.bytes, len(df)))
+                        entry.cond.notify_all()
+                    self._account(len(data))
+            entry.state = DONE
+        except _Cancelled:
+            entry.state = CANCELLED
+        except Exception as e:
+            print(f"[synth] speculative generation for chat {entry.key[2]} failed: {e}")
+            entry.state, entry.error = FAILED, str(e)
+            self._discard(entry)
+        finally:
+            with entry.cond:
+                entry.cond.notify_all()
+            self._unref(entry)
+
+    # -- attaching -----------------------------------------------------------
+    def take(self, plan: GenerationPlan, project_id: str, user_id: str, chat_id: str) -> Optional[Speculated]:
+        """The chat's speculative rows if they fit the download's plan."""
+        if not self.enabled or plan.seed is not None or plan.fmt != "csv" or plan.fleet is not None:
+            return None
+        key = (project_id, user_id, chat_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            spec = entry.plan
+            usable = (
+                spec is not None and entry.state in (RUNNING, DONE)
+                and spec.resolved.model is plan.resolved.model and spec.conditions == plan.conditions
+            )
+            del self._entries[key]
+            if usable:
+                entry.attached = True
+                self.attached += 1
+            else:
+                self.mismatched += 1
+        if not usable:
+            # still queued, failed, or not what was asked for: sample live
+            self._cancel(entry)
+            return None
+        return Speculated(self, entry, min(plan.rows, spec.rows), plan.rows)
+
+    def restore(self, spec: Speculated) -> None:
+        # the download was refused after all: the entry waits for the next one
+        entry = spec.entry
+        spec._done.detach()
+        with self._lock:
+            if entry.key not in self._entries:
+                entry.attached = False
+                self.attached -= 1
+                self._entries[entry.key] = entry
+                return
+        self._cancel(entry)  # the chat has moved on meanwhile
+
+    def _detach(self, entry: _Entry) -> None:
+        # the download is done with the entry; a writer still going is not needed
+        entry.cancelled = True
+        self._unref(entry)
+
+    # -- cleanup -------------------------------------------------------------
+    def _cancel(self, entry: _Entry) -> None:
+        # an entry taken out of the index: stop its writer, drop the index's ref
+        entry.cancelled = True
+        with entry.cond:
+            entry.cond.notify_all()
+        self._unref(entry)
+
+    def _discard(self, entry: _Entry) -> None:
+        # a failed entry leaves the index if it is still there
+        with self._lock:
+            if self._entries.get(entry.key) is not entry:
+                return
+            del self._entries[entry.key]
+        self._cancel(entry)
+
+    def _unref(self, entry: _Entry) -> None:
+        with entry.cond:
+            entry._refs -= 1
+            if entry._refs:
+                return
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[synth] could not remove {entry.path}: {e}")
+        with self._lock:
+            self._bytes -= entry.bytes
+
+    def _account(self, n: int) -> None:
+        # keep the spool under max_bytes: drop the oldest unattached entries
+        victims = []
+        with self._lock:
+            self._bytes += n
+            excess = self._bytes - self.max_bytes
+            for key, entry in list(self._entries.items()):
+                if excess <= 0:
+                    break
+                del self._entries[key]
+                victims.append(entry)
+                excess -= entry.bytes
+            self.evicted += len(victims)
+        for entry in victims:
+            self._cancel(entry)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Cancel entries no download attached to within the idle time."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expired = [e for e in self._entries.values() if now - e.created_at > SYNTH_SPECULATE_IDLE_SECONDS]
+            for entry in expired:
+                del self._entries[entry.key]
+            self.expired += len(expired)
+        for entry in expired:
+            self._cancel(entry)
+        return len(expired)
+
+    def _sweep_loop(self) -> None:
+        while True:
+            time.sleep(max(1.0, min(10.0, SYNTH_SPECULATE_IDLE_SECONDS / 4)))
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[synth] speculation sweep failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            states: Dict[str, int] = {}
+            for entry in self._entries.values():
+                states[entry.state] = states.get(entry.state, 0) + 1
+            return {
+                "enabled": self.enabled,
+                "rows": self.rows,
+                "entries": len(self._entries),
+                "states": states,
+                "spool_bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "started": self.started,
+                "skipped": self.skipped,
+                "attached": self.attached,
+                "mismatched": self.mismatched,
+                "replaced": self.replaced,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "hit_rate": round(self.attached / self.started, 4) if self.started else 0.0,
+            }
+
+
+speculator = Speculator()
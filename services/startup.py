@@ -0,0 +1,153 @@
+# services/startup.py
+# Background startup. main.py only builds the app and answers /, /healthz
+# and /readyz; the heavy phases (Firebase init, importing the routers and
+# the data layer, torch, the default model) run one after another on a
+# thread started from the startup hook. Requests that arrive early wait up
+# to SYNTH_READY_WAIT_SECONDS for the phase they need and are refused with
+# 503 + Retry-After after that. Every phase's wall time is logged and shown
+# by /readyz (and /metrics). Kept free of heavy imports: main.py imports it first.
+#
+# Ready means every required phase succeeded and every readiness check
+# passes now. Checks look at the live state (e.g. "the default model is
+# resident"), so an optional phase that failed at startup stops blocking
+# readiness once a later request has done its work.
+import asyncio
+import math
+import os
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from services.metrics import STARTUP_PHASE_SECONDS
+
+load_dotenv()
+
+SYNTH_READY_WAIT_SECONDS = float(os.getenv("SYNTH_READY_WAIT_SECONDS", "5"))
+
+_POLL_SECONDS = 0.05
+
+
+class Phase:
+    def __init__(self, name: str, fn: Callable[[], Any], required: bool):
+        self.name = name
+        self.fn = fn
+        self.required = required  # later phases are skipped if this one fails
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+    @property
+    def ok(self) -> bool:
+        return self.done.is_set() and self.error is None
+
+
+class Startup:
+    def __init__(self):
+        self.created = time.perf_counter()  # ~ process start: main.py imports this first
+        self.boot_seconds: Optional[float] = None  # until the startup hook ran
+        self.total_seconds: Optional[float] = None
+        self._phases: Dict[str, Phase] = {}
+        self._checks: Dict[str, Callable[[], bool]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def start(
+        self,
+        phases: List[Tuple[str, Callable[[], Any], bool]],
+        checks: Optional[Dict[str, Callable[[], bool]]] = None,
+    ) -> None:
+        """Run (name, fn, required) phases in order on a background thread;
+        `checks` are the readiness conditions evaluated by ready()."""
+        if self._thread is not None:
+            return
+        self.boot_seconds = time.perf_counter() - self.created
+        self._phases = {name: Phase(name, fn, required) for name, fn, required in phases}
+        self._checks = dict(checks or {})
+        self._thread = threading.Thread(target=self._run, name="startup", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        t_start = time.perf_counter()
+        failed: Optional[str] = None
+        for phase in self._phases.values():
+            t0 = time.perf_counter()
+            if failed is not None:
+                phase.error = f"skipped: '{failed}' failed"
+            else:
+                try:
+                    phase.fn()
+                except Exception as e:
+                    phase.error = f"{type(e).__name__}: {e}"
+                    traceback.print_exc()
+                    if phase.required:
+                        failed = phase.name
+            phase.seconds = time.perf_counter() - t0
+            STARTUP_PHASE_SECONDS.set(phase.seconds, phase=phase.name)
+            phase.done.set()
+        self.total_seconds = self.boot_seconds + time.perf_counter() - t_start
+        timings = " | ".join(
+            f"{p.name} {p.seconds:.2f}s{'' if p.error is None else ' (failed)'}" for p in self._phases.values()
+        )
+        print(f"[startup] boot {self.boot_seconds:.2f}s | {timings} | total {self.total_seconds:.2f}s")
+
+    # -- waiting ---------------------------------------------------------------
+    def finished(self, name: str) -> bool:
+        # phases that were never registered (routers used without main.py,
+        # tools, benchmarks) count as finished
+        phase = self._phases.get(name)
+        return phase is None or phase.done.is_set()
+
+    def ok(self, name: str) -> bool:
+        phase = self._phases.get(name)
+        return phase is None or phase.ok
+
+    async def wait(self, name: str, timeout: float = SYNTH_READY_WAIT_SECONDS) -> bool:
+        """Wait (without holding a thread) until the phase has finished,
+        successfully or not; False if it is still running after `timeout`."""
+        deadline = time.monotonic() + timeout
+        while not self.finished(name):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(_POLL_SECONDS)
+        return True
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(SYNTH_READY_WAIT_SECONDS))
+
+    # -- reporting -------------------------------------------------------------
+    def _check_results(self) -> Dict[str, bool]:
+        results = {}
+        for name, check in self._checks.items():
+            try:
+                results[name] = bool(check())
+            except Exception:
+                results[name] = False
+        return results
+
+    def ready(self, checks: Optional[Dict[str, bool]] = None) -> bool:
+        if self._thread is None or not all(p.ok for p in self._phases.values() if p.required):
+            return False
+        return all((self._check_results() if checks is None else checks).values())
+
+    def status(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        checks = self._check_results()
+        return {
+            "ready": self.ready(checks),
+            "checks": checks,
+            "uptime_seconds": round(now - self.created, 3),
+            "boot_seconds": None if self.boot_seconds is None else round(self.boot_seconds, 3),
+            "total_seconds": None if self.total_seconds is None else round(self.total_seconds, 3),
+            "phases": [
+                {
+                    "name": p.name,
+                    "state": "done" if p.ok else ("failed" if p.done.is_set() else "pending"),
+                    "seconds": None if p.seconds is None else round(p.seconds, 3),
+                    "error": p.error,
+                }
+                for p in self._phases.values()
+            ],
+        }
+
+
+startup = Startup()
@@ -0,0 +1,234 @@
+# services/synth_cache.py
+# Content-addressed on-disk cache of seeded generations. With a seed the
+# output bytes are a pure function of (model file contents, sampler, seed,
+# rows, batch_size, conditions, format, encoding and encoder settings), so a hash
+# of those is both the cache key and the response ETag. Entries are evicted
+# least-recently-used once SYNTH_CACHE_MAX_MB is exceeded.
+import hashlib, json, os, tempfile, threading, uuid
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+from services import csv_encoder, synth_formats
+from services.model_registry import sampler_kind
+
+load_dotenv()
+
+SYNTH_CACHE_DIR = os.getenv("SYNTH_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "synthiot-cache")
+SYNTH_CACHE_MAX_MB = float(os.getenv("SYNTH_CACHE_MAX_MB", "1024"))  # 0 = no caching (ETags still work)
+
+# bump when the sampling / encoding output changes for the same inputs
+CACHE_VERSION = 2
+
+_TMP_SUFFIX = ".tmp"
+
+
+# ------------------------------------------------------------------
+# Keys
+# ------------------------------------------------------------------
+_FINGERPRINTS: Dict[Tuple[str, int, int], str] = {}
+_FINGERPRINTS_LOCK = threading.Lock()
+
+
+def _stat_key(path: str) -> Tuple[str, int, int]:
+    if os.path.isdir(path):
+        stats = [e.stat() for e in os.scandir(path) if e.is_file()]
+        return path, sum(s.st_size for s in stats), max((s.st_mtime_ns for s in stats), default=0)
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+
+def model_fingerprint(path: str) -> str:
+    """sha256 of a model pickle or artifact directory (memoised by size/mtime)."""
+    stat_key = _stat_key(path)
+    with _FINGERPRINTS_LOCK:
+        cached = _FINGERPRINTS.get(stat_key)
+    if cached is not None:
+        return cached
+    h = hashlib.sha256()
+    files = sorted(e.path for e in os.scandir(path) if e.is_file()) if os.path.isdir(path) else [path]
+    for name in files:
+        h.update(os.path.basename(name).encode("utf-8") + b"\0")
+        with open(name, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    digest = h.hexdigest()
+    with _FINGERPRINTS_LOCK:
+        _FINGERPRINTS[stat_key] = digest
+    return digest
+
+
+def _encoder_settings(fmt: str) -> Dict[str, Any]:
+    if fmt == "csv":
+        return {
+            "encoder": synth_formats.CSV_ENCODER,
+            "precision": csv_encoder.DEFAULT_FLOAT_PRECISION,
+            "columns": csv_encoder.COLUMN_FLOAT_PRECISION,
+        }
+    if fmt == "parquet":
+        return {"compression": synth_formats.PARQUET_COMPRESSION}
+    return {}
+
+
+def plan_key(plan) -> str:
+    """Cache key / ETag value of a seeded GenerationPlan (services.synth_service)."""
+    if plan.seed is None:
+        raise ValueError("only seeded generations are deterministic")
+    parts = {
+        "v": CACHE_VERSION,
+        "model": model_fingerprint(plan.resolved.path),
+        # samplers draw different random streams from the same seed
+        "sampler": sampler_kind(plan.resolved.model),
+        "seed": plan.seed,
+        "rows": plan.rows,
+        "batch_size": plan.batch_size,
+        "conditions": {col: sorted(map(str, values)) for col, values in plan.conditions.items()},
+        "format": plan.fmt,
+        "encoder": _encoder_settings(plan.fmt),
+        "encoding": plan.content_encoding,
+        "levels": {"gzip": synth_formats.GZIP_LEVEL, "zstd": synth_formats.ZSTD_LEVEL}
+        if plan.content_encoding else None,
+    }
+    if plan.fleet is not None:
+        parts["fleet"] = plan.fleet._asdict()
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+# ------------------------------------------------------------------
+# Store
+# ------------------------------------------------------------------
+class DatasetCache:
+    def __init__(self, directory: str = SYNTH_CACHE_DIR, max_bytes: int = int(SYNTH_CACHE_MAX_MB * 2**20)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _load(self) -> None:
+        # caller holds the lock; picks up entries written by a previous process
+        if self._loaded:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for e in os.scandir(self.directory):
+            if not e.is_file():
+                continue
+            if e.name.endswith(_TMP_SUFFIX):
+                _remove(e.path)  # interrupted write
+                continue
+            st = e.stat()
+            entries.append((st.st_mtime, e.name, st.st_size))
+        for _, key, size in sorted(entries):
+            self._lru[key] = size
+        self._loaded = True
+
+    def open(self, key: str) -> Optional[Tuple[BinaryIO, int]]:
+        """Return (open file, size) for a cached entry, or None on a miss.
+
+        The file is opened here so eviction cannot pull it from under a
+        response that is about to stream it.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load()
+            if key not in self._lru:
+                self.misses += 1
+                return None
+            try:
+                f = open(self._path(key), "rb")
+            except FileNotFoundError:
+                self._lru.pop(key, None)
+                self.misses += 1
+                return None
+            self._lru.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(self._path(key))  # keeps LRU order across restarts
+        except OSError:
+            pass
+        return f, os.fstat(f.fileno()).st_size
+
+    def store(self, key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass `chunks` through, keeping a copy that becomes the entry once complete."""
+        if not self.enabled:
+            yield from chunks
+            return
+        with self._lock:
+            self._load()
+        tmp = self._path(f"{key}.{uuid.uuid4().hex}{_TMP_SUFFIX}")
+        size = 0
+        done = False
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            done = True
+        finally:
+            # an aborted download leaves no partial entry behind
+            if not done:
+                _remove(tmp)
+        if size > self.max_bytes:
+            _remove(tmp)
+            return
+        os.replace(tmp, self._path(key))
+        with self._lock:
+            self._lru[key] = size
+            self._lru.move_to_end(key)
+            self._evict()
+
+    def _evict(self) -> None:
+        total = sum(self._lru.values())
+        while total > self.max_bytes and len(self._lru) > 1:
+            key, size = self._lru.popitem(last=False)
+            _remove(self._path(key))
+            total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._lru),
+                "size_bytes": sum(self._lru.values()),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def iter_open_file(f: BinaryIO, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    with f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            yield block
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[synth] could not remove {path}: {e}")
+
+
+dataset_cache = DatasetCache()
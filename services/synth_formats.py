@@ -0,0 +1,233 @@
+# services/synth_formats.py
+# Output encoders for synthetic data streams. Every encoder turns one sampled
+# batch (DataFrame) into bytes as soon as it arrives, so memory stays bounded
+# by a single batch no matter how many rows are requested.
+import io
+import os
+import zlib
+from typing import Iterable, Iterator, Optional
+import pandas as pd
+from services.csv_encoder import CsvBatchEncoder
+from services.metrics import STAGE_SECONDS
+
+FORMATS = ("csv", "parquet", "arrow")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+EXTENSIONS = {"csv": "csv", "parquet": "parquet", "arrow": "arrows"}
+
+# Parquet carries its own page compression, so HTTP content-encoding is only
+# negotiated for the row-oriented / IPC streams.
+COMPRESSIBLE_FORMATS = ("csv", "arrow")
+# file suffix for compressed spool files / downloads
+COMPRESSION_SUFFIXES = {"gzip": "gz", "zstd": "zst"}
+
+PARQUET_COMPRESSION = os.getenv("SYNTH_PARQUET_COMPRESSION", "zstd")
+GZIP_LEVEL = int(os.getenv("SYNTH_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("SYNTH_ZSTD_LEVEL", "3"))
+# "fast" = vectorised CsvBatchEncoder, "pandas" = DataFrame.to_csv per batch
+CSV_ENCODER = os.getenv("SYNTH_CSV_ENCODER", "fast")
+
+def df_to_csv_chunk(df: pd.DataFrame, header: bool) -> bytes:
+    # Reference encoder (and SYNTH_CSV_ENCODER=pandas fallback).
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=header)
+    return buf.getvalue().encode("utf-8")
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet/Arrow output requires pyarrow to be installed")
+    return pyarrow
+
+def _zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+# ------------------------------------------------------------------
+# Encoders: encode(df) -> bytes per batch, finish() -> trailing bytes.
+# encode() may return a memoryview into a buffer the encoder reuses for
+# the next batch, so consumers must use (or copy) it before asking for more.
+# ------------------------------------------------------------------
+def csv_chunk_encoder():
+    """Return encode(df, header) for the configured CSV encoder."""
+    if CSV_ENCODER == "fast":
+        return CsvBatchEncoder().encode_into
+    return df_to_csv_chunk
+
+class CsvEncoder:
+    def __init__(self, header: bool = True):
+        self._header = header
+        self._encode = csv_chunk_encoder()
+
+    def encode(self, df: pd.DataFrame):
+        chunk = self._encode(df, header=self._header)
+        self._header = False
+        return chunk
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _ChunkSink:
+    # Minimal writable file object handed to pyarrow writers; whatever they
+    # write for a batch is drained and forwarded, then the buffer is reused.
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+
+class ParquetEncoder:
+    """One Parquet row group per sampled batch; the footer is sent last."""
+
+    def __init__(self):
+        self._pa = _require_pyarrow()
+        self._sink = _ChunkSink()
+        self._writer = None
+
+    def encode(self, df: pd.DataFrame) -> bytes:
+        table = self._pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pa.parquet.ParquetWriter(
+                self._sink, table.schema, compression=PARQUET_COMPRESSION
+            )
+        self._writer.write_table(table, row_group_size=max(1, table.num_rows))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        if self._writer is not None:
+            self._writer.close()
+        return self._sink.drain()
+
+
+class ArrowEncoder:
+    """Arrow IPC stream: schema message, then one record batch per sampled batch."""
+
+    def __init__(self):
+        self._pa = _require_pyarrow()
+        self._sink = _ChunkSink()
+        self._writer = None
+
+    def encode(self, df: pd.DataFrame) -> bytes:
+        batch = self._pa.RecordBatch.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pa.ipc.new_stream(self._sink, batch.schema)
+        self._writer.write_batch(batch)
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        if self._writer is not None:
+            self._writer.close()
+        return self._sink.drain()
+
+
+_ENCODERS = {"csv": CsvEncoder, "parquet": ParquetEncoder, "arrow": ArrowEncoder}
+
+def make_encoder(fmt: str):
+    if fmt not in _ENCODERS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    return _ENCODERS[fmt]()
+
+
+# ------------------------------------------------------------------
+# HTTP content-encoding
+# ------------------------------------------------------------------
+def negotiate_encoding(fmt: str, accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the content-encoding for a response from the Accept-Encoding header.
+
+    zstd is preferred over gzip when the client accepts both and the
+    zstandard package is installed. Returns None for identity.
+    """
+    if fmt not in COMPRESSIBLE_FORMATS or not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token.strip().lower()] = q
+    candidates = ["zstd", "gzip"] if _zstd_available() else ["gzip"]
+    best = None
+    for enc in candidates:
+        q = accepted.get(enc, accepted.get("*", 0.0))
+        if q > 0 and (best is None or q > best[1]):
+            best = (enc, q)
+    return best[0] if best else None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "gzip":
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif encoding == "zstd":
+            import zstandard
+            self._c = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        else:
+            raise ValueError(f"Unsupported content-encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.compress(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+def compress_stream(chunks: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    if encoding is None:
+        for chunk in chunks:
+            if chunk:
+                # the ASGI server may hold on to the body after send(), so a
+                # reusable encoder buffer gets its one copy here
+                yield bytes(chunk) if isinstance(chunk, memoryview) else chunk
+        return
+    comp = _Compressor(encoding)
+    for chunk in chunks:
+        with STAGE_SECONDS.time(stage="compress"):
+            out = comp.compress(chunk)  # consumes the view immediately, no copy
+        if out:
+            yield out
+    yield comp.flush()
+
+def encode_stream(frames: Iterable[pd.DataFrame], encoder, encoding: Optional[str] = None) -> Iterator[bytes]:
+    def _chunks():
+        for df in frames:
+            with STAGE_SECONDS.time(stage="encode"):
+                chunk = encoder.encode(df)
+            yield chunk
+        yield encoder.finish()
+    return compress_stream(_chunks(), encoding)
@@ -0,0 +1,275 @@
+# services/synth_jobs.py
+# Asynchronous generation jobs: a submitted generation is sampled by a
+# background worker and spooled to local disk, so the download is a plain
+# file transfer that can be resumed with HTTP Range instead of re-sampling.
+# Job records live in this process (like the model registry); spool files
+# and records are removed SYNTH_JOB_TTL_SECONDS after the job finishes.
+# A profiled job also leaves its dataset profile as a JSON sidecar next to
+# the spool file (services.dataset_profile).
+import json, os, tempfile, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from services.metrics import STAGE_SECONDS
+from services.synth_scheduler import generation_scheduler
+
+load_dotenv()
+
+SYNTH_JOB_WORKERS = int(os.getenv("SYNTH_JOB_WORKERS", "2"))
+SYNTH_JOB_SPOOL_DIR = os.getenv("SYNTH_JOB_SPOOL_DIR") or os.path.join(tempfile.gettempdir(), "synthiot-jobs")
+SYNTH_JOB_TTL_SECONDS = float(os.getenv("SYNTH_JOB_TTL_SECONDS", "3600"))
+SYNTH_JOB_SWEEP_SECONDS = float(os.getenv("SYNTH_JOB_SWEEP_SECONDS", "60"))
+# encoded chunks are small; buffer them into larger disk writes
+SYNTH_JOB_WRITE_BUFFER = int(os.getenv("SYNTH_JOB_WRITE_BUFFER", str(1 << 20)))
+
+# status values
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class SynthJob:
+    def __init__(self, user_id: str, project_id: str, chat_id: str, rows: int, filename: str, media_type: str):
+        self.job_id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.project_id = project_id
+        self.chat_id = chat_id
+        self.rows = rows
+        self.filename = filename
+        self.media_type = media_type
+        self.status = QUEUED
+        self.rows_done = 0
+        self.bytes_written = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self.path = ""  # spool file, set on submit
+        self.profile = None  # DatasetProfile filled by the stream, if requested
+        self.slots = 1  # scheduler slots it takes (see synth_service.generation_slots)
+
+    @property
+    def profile_path(self) -> Optional[str]:
+        # sidecar written once the job is done
+        return self.path + ".profile.json" if self.profile is not None and self.status == DONE else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "project_id": self.project_id,
+            "chat_id": self.chat_id,
+            "rows": self.rows,
+            "rows_done": self.rows_done,
+            "progress": round(self.rows_done / self.rows, 4) if self.rows else 0.0,
+            "bytes_written": self.bytes_written,
+            "filename": self.filename,
+            "profiled": self.profile is not None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "expires_at": self.finished_at + SYNTH_JOB_TTL_SECONDS if self.finished_at else None,
+        }
+
+
+class JobManager:
+    def __init__(self, workers: int = SYNTH_JOB_WORKERS, spool_dir: str = SYNTH_JOB_SPOOL_DIR):
+        self.workers = max(1, workers)
+        self.spool_dir = spool_dir
+        self._jobs: Dict[str, SynthJob] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._sweeper: Optional[threading.Thread] = None
+
+    def _start(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="synth-job")
+                self._sweeper = threading.Thread(target=self._sweep_loop, name="synth-job-sweeper", daemon=True)
+                self._sweeper.start()
+            return self._pool
+
+    # -- submit / run ------------------------------------------------------
+    def submit(self, job: SynthJob, chunks: Iterator[bytes]) -> SynthJob:
+        """Queue an already validated byte stream (see synth_service.stream_plan)."""
+        pool = self._start()
+        job.path = os.path.join(self.spool_dir, f"{job.job_id}.part")
+        with self._lock:
+            self._jobs[job.job_id] = job
+        pool.submit(self._run, job, chunks)
+        return job
+
+    def _run(self, job: SynthJob, chunks: Iterator[bytes]) -> None:
+        # jobs share the generation slots with streamed requests; they wait
+        # for one as long as it takes (no 429), checking for cancellation
+        ticket = generation_scheduler.submit(job.user_id, job.rows, bounded=False, slots=job.slots)
+        try:
+            with STAGE_SECONDS.time(stage="slot_wait"):
+                while not generation_scheduler.wait(ticket, timeout=1.0):
+                    if job.cancel_requested:
+                        break
+            if job.cancel_requested:
+                raise JobCancelled()  # cancelled while queued
+            job.status, job.started_at = RUNNING, time.time()
+            with open(job.path, "wb", buffering=SYNTH_JOB_WRITE_BUFFER) as f:
+                for chunk in chunks:
+                    if job.cancel_requested:
+                        raise JobCancelled()
+                    f.write(chunk)
+                    job.bytes_written += len(chunk)
+            final = job.path[: -len(".part")]
+            os.replace(job.path, final)
+            job.path = final
+            if job.profile is not None:
+                _write_json(final + ".profile.json", job.profile.to_dict())
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+            _remove(job.path)
+        except Exception as e:
+            print(f"[synth] job {job.job_id} failed: {e}")
+            job.status, job.error = FAILED, str(e)
+            _remove(job.path)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()  # stops prefetching / sharded sampling of a cancelled job
+            generation_scheduler.release(ticket)
+            job.finished_at = time.time()
+
+    def progress_callback(self, job: SynthJob):
+        def progress(n: int) -> None:
+            job.rows_done += n
+        return progress
+
+    # -- lookup ------------------------------------------------------------
+    def get(self, job_id: str, user_id: str) -> Optional[SynthJob]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def for_user(self, user_id: str) -> List[SynthJob]:
+        with self._lock:
+            return [j for j in self._jobs.values() if j.user_id == user_id]
+
+    def cancel(self, job_id: str, user_id: str) -> Optional[SynthJob]:
+        """Stop a queued/running job, or delete a finished job's spool file."""
+        job = self.get(job_id, user_id)
+        if job is None:
+            return None
+        if job.status in FINISHED:
+            self._forget(job)
+        else:
+            job.cancel_requested = True
+        return job
+
+    # -- cleanup -----------------------------------------------------------
+    def _forget(self, job: SynthJob) -> None:
+        with self._lock:
+            self._jobs.pop(job.job_id, None)
+        _remove(job.path)
+        if job.profile is not None:
+            _remove(job.path + ".profile.json")
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Drop finished jobs older than the TTL, and orphaned spool files."""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [
+                j for j in self._jobs.values()
+                if j.finished_at is not None and now - j.finished_at > SYNTH_JOB_TTL_SECONDS
+            ]
+            known = {os.path.basename(j.path) for j in self._jobs.values()}
+            known |= {name + ".profile.json" for name in known}
+        for job in expired:
+            self._forget(job)
+        # files left behind by a previous process
+        try:
+            entries = list(os.scandir(self.spool_dir))
+        except OSError:
+            entries = []
+        for e in entries:
+            if e.name not in known and e.is_file() and now - e.stat().st_mtime > SYNTH_JOB_TTL_SECONDS:
+                _remove(e.path)
+        return len(expired)
+
+    def _sweep_loop(self) -> None:
+        while True:
+            time.sleep(SYNTH_JOB_SWEEP_SECONDS)
+            try:
+                removed = self.sweep()
+                if removed:
+                    print(f"[synth] removed {removed} expired job(s)")
+            except Exception as e:
+                print(f"[synth] job sweep failed: {e}")
+
+
+def _write_json(path: str, data: Any) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"[synth] could not remove {path}: {e}")
+
+
+# ------------------------------------------------------------------
+# HTTP Range (single range, RFC 9110 section 14)
+# ------------------------------------------------------------------
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """'bytes=a-b' / 'bytes=a-' / 'bytes=-n' -> inclusive (start, end).
+
+    None means "send the whole file" (no or unsupported header, e.g. several
+    ranges); ValueError means the range cannot be satisfied (416).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None  # malformed ranges are ignored
+    if start is None:
+        if end is None or end <= 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(0, size - end), size - 1
+    end = size - 1 if end is None else end
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def iter_file(path: str, start: int, end: int, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+jobs = JobManager()
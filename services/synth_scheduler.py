@@ -0,0 +1,302 @@
+# services/synth_scheduler.py
+# Admission control for generations. Every streamed generation and every
+# async job takes a slot before it samples. The number of slots is bounded
+# by the core count (SYNTH_MAX_ACTIVE). Each user can hold at most
+# SYNTH_USER_MAX_ACTIVE slots and have SYNTH_USER_MAX_ROWS rows in flight.
+# Requests that cannot start yet wait in per-user FIFO queues, and freed
+# slots go to users in round-robin order, so one user's burst does not
+# delay everyone else's single request. Past the queue bounds, or after
+# SYNTH_QUEUE_TIMEOUT_SECONDS of waiting, a streaming request is refused
+# with Overloaded (HTTP 429 with Retry-After) rather than queueing
+# indefinitely.
+#
+# torch's intra-op thread pool is sized to the share of the cores each
+# active generation gets (cores // active), applied per sampling thread,
+# so concurrent generations do not oversubscribe the CPU. A generation that
+# runs on more cores than one slot's share (a sharded one, on the process
+# pool) takes as many slots as it has cores' worth (slots_for), and a
+# waiting generation is not overtaken by smaller ones behind it.
+import asyncio
+import math
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterator, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SYNTH_CPU_CORES = int(os.getenv("SYNTH_CPU_CORES", "0")) or (os.cpu_count() or 1)
+SYNTH_MAX_ACTIVE = int(os.getenv("SYNTH_MAX_ACTIVE", "0")) or max(1, SYNTH_CPU_CORES // 2)
+SYNTH_USER_MAX_ACTIVE = int(os.getenv("SYNTH_USER_MAX_ACTIVE", "2"))
+SYNTH_QUEUE_MAX = int(os.getenv("SYNTH_QUEUE_MAX", "0")) or 4 * SYNTH_MAX_ACTIVE
+SYNTH_USER_QUEUE_MAX = int(os.getenv("SYNTH_USER_QUEUE_MAX", "4"))
+SYNTH_USER_MAX_ROWS = int(os.getenv("SYNTH_USER_MAX_ROWS", "2000000"))  # streamed, active + queued
+SYNTH_QUEUE_TIMEOUT_SECONDS = float(os.getenv("SYNTH_QUEUE_TIMEOUT_SECONDS", "10"))
+SYNTH_TORCH_THREAD_BUDGET = os.getenv("SYNTH_TORCH_THREAD_BUDGET", "1") != "0"
+
+
+class Overloaded(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One generation's claim on a slot: waiting, then granted, then released."""
+
+    def __init__(self, user_id: str, rows: int, bounded: bool, slots: int = 1):
+        self.user_id = user_id
+        self.rows = rows
+        self.bounded = bounded  # streamed request: subject to the queue / row limits
+        self.slots = slots
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.done = False  # released or withdrawn
+        self._event = threading.Event()
+        self._waiters: List = []
+
+    @property
+    def granted(self) -> bool:
+        return self._event.is_set()
+
+
+class GenerationScheduler:
+    def __init__(
+        self,
+        max_active: int = SYNTH_MAX_ACTIVE,
+        user_max_active: int = SYNTH_USER_MAX_ACTIVE,
+        queue_max: int = SYNTH_QUEUE_MAX,
+        user_queue_max: int = SYNTH_USER_QUEUE_MAX,
+        user_max_rows: int = SYNTH_USER_MAX_ROWS,
+        cores: int = SYNTH_CPU_CORES,
+    ):
+        self.max_active = max(1, max_active)
+        self.user_max_active = max(1, user_max_active)
+        self.queue_max = queue_max
+        self.user_queue_max = user_queue_max
+        self.user_max_rows = user_max_rows
+        self.cores = max(1, cores)
+        self._lock = threading.Lock()
+        # user_id -> waiting tickets; the order of the users is the
+        # round-robin order (a user moves to the back when served)
+        self._queues: "OrderedDict[str, deque[Ticket]]" = OrderedDict()
+        self._queued = 0
+        self._active = 0  # slots held
+        self._running = 0  # generations holding them
+        self._user_active: Dict[str, int] = {}
+        self._user_rows: Dict[str, int] = {}
+        self._service_ewma = 1.0  # seconds a generation holds a slot
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._wait_total = 0.0
+
+    # -- admission -----------------------------------------------------------
+    def slots_for(self, cores: int) -> int:
+        """Slots a generation running on `cores` cores takes (1 to max_active)."""
+        return min(self.max_active, max(1, math.ceil(cores * self.max_active / self.cores)))
+
+    def submit(self, user_id: str, rows: int, bounded: bool = True, slots: int = 1) -> Ticket:
+        """A ticket that is granted now or queued; Overloaded if it can't be queued."""
+        ticket = Ticket(user_id, rows, bounded, min(max(1, slots), self.max_active))
+        with self._lock:
+            if bounded:
+                self._admit_or_raise(ticket)
+                self._user_rows[user_id] = self._user_rows.get(user_id, 0) + rows
+            self._queues.setdefault(user_id, deque()).append(ticket)
+            self._queued += 1
+            self._dispatch()
+        return ticket
+
+    def _admit_or_raise(self, ticket: Ticket) -> None:
+        user_id = ticket.user_id
+        if self.user_max_rows and self._user_rows.get(user_id, 0) + ticket.rows > self.user_max_rows:
+            self.rejected += 1
+            raise Overloaded("Too many rows in flight for this user", self._retry_after())
+        if self._active + ticket.slots <= self.max_active and not self._queued:
+            return
+        if self._queued >= self.queue_max or len(self._queues.get(user_id, ())) >= self.user_queue_max:
+            self.rejected += 1
+            raise Overloaded("Generation queue is full", self._retry_after())
+
+    def _grant(self, ticket: Ticket) -> None:
+        # lock held
+        self._active += ticket.slots
+        self._running += 1
+        self._user_active[ticket.user_id] = self._user_active.get(ticket.user_id, 0) + 1
+        ticket.granted_at = time.monotonic()
+        self.admitted += 1
+        self._wait_total += ticket.granted_at - ticket.enqueued_at
+        ticket._event.set()
+        for notify in ticket._waiters:
+            notify()
+
+    def _dispatch(self) -> None:
+        # lock held: hand free slots to waiting users, round robin
+        while self._active < self.max_active and self._queued:
+            for user_id, queue in self._queues.items():
+                if self._user_active.get(user_id, 0) < self.user_max_active:
+                    break
+            else:
+                return  # everyone waiting is at their per-user limit
+            if self._active + queue[0].slots > self.max_active:
+                return  # the next one needs more slots: hold them for it as they free up
+            self._grant(queue.popleft())
+            self._queued -= 1
+            if queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+
+    def _retry_after(self) -> int:
+        # lock held: time for the queue ahead to drain at the current pace
+        return max(1, math.ceil(self._service_ewma * (self._queued + 1) / self.max_active))
+
+    # -- waiting -------------------------------------------------------------
+    def wait(self, ticket: Ticket, timeout: Optional[float] = None) -> bool:
+        return ticket._event.wait(timeout)
+
+    async def acquire(
+        self, user_id: str, rows: int, timeout: float = SYNTH_QUEUE_TIMEOUT_SECONDS, slots: int = 1,
+    ) -> Ticket:
+        """Wait (without holding a thread) for `slots` slots; Overloaded when
+        refused or when the wait exceeds `timeout`."""
+        ticket = self.submit(user_id, rows, slots=slots)
+        if ticket.granted:
+            return ticket
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def notify() -> None:
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        with self._lock:
+            ticket._waiters.append(notify)
+            if ticket.granted:
+                notify()
+        try:
+            await asyncio.wait_for(granted, timeout)
+            return ticket
+        except asyncio.TimeoutError:
+            if self.withdraw(ticket):
+                with self._lock:
+                    self.timed_out += 1
+                    retry_after = self._retry_after()
+                raise Overloaded("Timed out waiting for a generation slot", retry_after)
+            return ticket  # granted just as the wait ran out
+        except BaseException:
+            self.release(ticket)  # client went away while queued
+            raise
+
+    # -- leaving -------------------------------------------------------------
+    def withdraw(self, ticket: Ticket) -> bool:
+        """Take a still-waiting ticket out of its queue; False if it was granted."""
+        with self._lock:
+            if ticket.granted or ticket.done:
+                return False
+            queue = self._queues.get(ticket.user_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[ticket.user_id]
+            self._finish(ticket)
+            return True
+
+    def release(self, ticket: Ticket) -> None:
+        """Give the slot back (or leave the queue). Safe to call more than once."""
+        if self.withdraw(ticket):
+            return
+        with self._lock:
+            if ticket.done:
+                return
+            self._active -= ticket.slots
+            self._running -= 1
+            left = self._user_active.get(ticket.user_id, 1) - 1
+            if left:
+                self._user_active[ticket.user_id] = left
+            else:
+                self._user_active.pop(ticket.user_id, None)
+            held = time.monotonic() - ticket.granted_at
+            self._service_ewma = 0.8 * self._service_ewma + 0.2 * held
+            self._finish(ticket)
+            self._dispatch()
+
+    def _finish(self, ticket: Ticket) -> None:
+        # lock held
+        ticket.done = True
+        if ticket.bounded:
+            left = self._user_rows.get(ticket.user_id, 0) - ticket.rows
+            if left > 0:
+                self._user_rows[ticket.user_id] = left
+            else:
+                self._user_rows.pop(ticket.user_id, None)
+
+    def hold(self, ticket: Ticket, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Yield chunks, releasing the ticket when the stream ends, fails, is
+        closed, or is dropped without ever being iterated."""
+        def gen():
+            try:
+                yield from chunks
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+                self.release(ticket)
+        stream = gen()
+        weakref.finalize(stream, self.release, ticket)
+        return stream
+
+    # -- CPU budget ------------------------------------------------------------
+    def idle(self) -> bool:
+        """Nothing active or queued (background work may use the CPU)."""
+        with self._lock:
+            return not self._active and not self._queued
+
+    def busy(self) -> bool:
+        """Requests are waiting for a slot (background work should yield)."""
+        with self._lock:
+            return self._queued > 0
+
+    def torch_threads(self) -> int:
+        """Intra-op threads for one generation at the current load."""
+        with self._lock:
+            active = self._active
+        return max(1, self.cores // max(1, active))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cores": self.cores,
+                "max_active": self.max_active,
+                "active": self._running,
+                "slots_used": self._active,
+                "queued": self._queued,
+                "queued_users": len(self._queues),
+                "user_max_active": self.user_max_active,
+                "queue_max": self.queue_max,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_wait_seconds": round(self._wait_total / self.admitted, 4) if self.admitted else 0.0,
+                "avg_service_seconds": round(self._service_ewma, 4),
+                "torch_threads": max(1, self.cores // max(1, self._active)),
+            }
+
+
+_THREAD_STATE = threading.local()
+
+
+def apply_torch_threads(n: int) -> None:
+    # torch.set_num_threads on the calling sampler thread, only when it changes
+    if not SYNTH_TORCH_THREAD_BUDGET or getattr(_THREAD_STATE, "torch_threads", None) == n:
+        return
+    import torch
+    torch.set_num_threads(n)
+    _THREAD_STATE.torch_threads = n
+
+
+generation_scheduler = GenerationScheduler()
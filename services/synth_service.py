@@ -1,58 +1,416 @@
 # services/synth_service.py
-import os, io, math, pickle, threading
-from typing import Iterator, Optional
-import pandas as pd
-from utils.firebase import db
+import os, math, pickle, threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+import multiprocessing
+import numpy as np
+from services import fleet as fleet_mode
+from services.dataset_profile import DatasetProfile, merge_partials, profile_frames
+from services.synth_formats import CsvEncoder, compress_stream, encode_stream, make_encoder
+from services.metrics import STAGE_SECONDS
+from services.model_registry import ResolvedModel, is_fast_sampler, model_precision, registry
+from services.project_cache import project_cache
+from services.model_artifact import ArtifactModel
+from services.sampling import check_conditions, resolve_conditions, sample_rows
+from services.synth_scheduler import SYNTH_MAX_ACTIVE, apply_torch_threads, generation_scheduler
 from dotenv import load_dotenv
 
 load_dotenv()
 
-CTGAN_MODEL_PATH = os.getenv("CTGAN_MODEL_PATH") 
+CTGAN_MODEL_PATH = os.getenv("CTGAN_MODEL_PATH")
 
-_MODEL = None
-_MODEL_LOCK = threading.Lock()
+# Pipelined generation: how many sampled batches may be in flight / buffered
+# ahead of the one being encoded and sent, and how many sampler threads are
+# shared by all concurrent downloads (default: one per scheduler slot, see
+# synth_scheduler). A depth of 0 samples inline.
+SYNTH_PREFETCH_DEPTH = int(os.getenv("SYNTH_PREFETCH_DEPTH", "2"))
+SYNTH_SAMPLER_WORKERS = int(os.getenv("SYNTH_SAMPLER_WORKERS", "0")) or SYNTH_MAX_ACTIVE
+
+# Sharded generation: rows are split into batch-sized shards sampled by a
+# process pool holding one model copy per worker. Requests with at least
+# SYNTH_SHARD_MIN_ROWS rows are sharded automatically (0 = only on request).
+SYNTH_SHARD_WORKERS = int(os.getenv("SYNTH_SHARD_WORKERS", "0")) or (os.cpu_count() or 1)
+SYNTH_SHARD_MIN_ROWS = int(os.getenv("SYNTH_SHARD_MIN_ROWS", "0"))
+SYNTH_SHARD_TORCH_THREADS = int(os.getenv("SYNTH_SHARD_TORCH_THREADS", "1"))
+SYNTH_SHARD_START_METHOD = os.getenv("SYNTH_SHARD_START_METHOD", "spawn")
+
+_SAMPLER_POOL: Optional[ThreadPoolExecutor] = None
+_SAMPLER_POOL_LOCK = threading.Lock()
+
+class _ShardPool:
+    # a model's worker processes (one model copy each) and the streams
+    # sampling on them; a pool discarded while in use shuts down when the
+    # last of those streams ends
+    def __init__(self, executor: ProcessPoolExecutor, model_path: str, workers: int):
+        self.executor = executor
+        self.model_path = model_path
+        self.workers = workers
+        self.users = 0
+        self.retired = False
+
+_SHARD_POOLS: Dict[Tuple[str, str, bool], _ShardPool] = {}
+_SHARD_POOLS_RETIRED: List[_ShardPool] = []
+_SHARD_POOLS_LOCK = threading.Lock()
 
 def get_model_path() -> str:
     return os.getenv("CTGAN_MODEL_PATH") or ""
 
-def _load_model() -> None:
-    global _MODEL
-    if _MODEL is not None:
+def ensure_model_loaded(model_id: Optional[str] = None) -> None:
+    # Loads (and keeps resident) the given model, or the registry default;
+    # models are loaded lazily under their own lock, see model_registry.
+    registry.get(model_id)
+
+def _get_owned_project(project_id: str, user_id: str) -> Optional[dict]:
+    # served from the shared project cache; see services/project_cache.py
+    return project_cache.owned(project_id, user_id)
+
+def resolve_project_model(project: dict):
+    model_id = registry.resolve(project.get("sensor_type"), project.get("model_id"))
+    return registry.get(model_id)
+
+def _get_sampler_pool() -> ThreadPoolExecutor:
+    global _SAMPLER_POOL
+    with _SAMPLER_POOL_LOCK:
+        if _SAMPLER_POOL is None:
+            _SAMPLER_POOL = ThreadPoolExecutor(
+                max_workers=max(1, SYNTH_SAMPLER_WORKERS),
+                thread_name_prefix="synth-sampler",
+            )
+        return _SAMPLER_POOL
+
+def _acquire_shard_pool(model_path: str, precision: str = "fp32", fast: bool = True) -> _ShardPool:
+    from services.shard_worker import init_worker
+    with _SHARD_POOLS_LOCK:
+        pool = _SHARD_POOLS.get((model_path, precision, fast))
+        created = pool is None
+        if created:
+            workers = max(1, SYNTH_SHARD_WORKERS)
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(SYNTH_SHARD_START_METHOD),
+                initializer=init_worker,
+                initargs=(model_path, SYNTH_SHARD_TORCH_THREADS, precision, fast),
+            )
+            pool = _SHARD_POOLS[(model_path, precision, fast)] = _ShardPool(executor, model_path, workers)
+        pool.users += 1
+    if created:
+        # every worker holds a copy of the model, which counts against the
+        # registry's memory budget
+        registry.trim()
+    return pool
+
+def _release_shard_pool(pool: _ShardPool) -> None:
+    with _SHARD_POOLS_LOCK:
+        pool.users -= 1
+        if pool.users > 0 or not pool.retired:
+            return
+        _SHARD_POOLS_RETIRED.remove(pool)
+    pool.executor.shutdown(wait=False)
+
+def _discard_shard_pool(model_path: str, precision: str = "fp32", fast: bool = True) -> None:
+    # shut down now, or once the streams still sampling on it end
+    with _SHARD_POOLS_LOCK:
+        pool = _SHARD_POOLS.pop((model_path, precision, fast), None)
+        if pool is None:
+            return
+        if pool.users:
+            pool.retired = True
+            _SHARD_POOLS_RETIRED.append(pool)
+            return
+    pool.executor.shutdown(wait=False, cancel_futures=True)
+
+def discard_shard_pools(model_path: str) -> None:
+    """Shut down the model's shard pools (at every precision), e.g. when it is evicted."""
+    with _SHARD_POOLS_LOCK:
+        keys = [k for k in _SHARD_POOLS if k[0] == model_path]
+    for key in keys:
+        _discard_shard_pool(*key)
+
+def shard_pool_workers(model_path: str) -> int:
+    """Worker processes holding a copy of the model, in its live shard pools
+    and in discarded ones still finishing a stream."""
+    with _SHARD_POOLS_LOCK:
+        pools = [*_SHARD_POOLS.values(), *_SHARD_POOLS_RETIRED]
+        return sum(p.workers for p in pools if p.model_path == model_path)
+
+def _batch_seeds(seed: Optional[int], count: int) -> List[int]:
+    # One independent, reproducible seed per batch/shard derived from the
+    # request seed; without a request seed fresh OS entropy is used.
+    children = np.random.SeedSequence(seed).spawn(count)
+    return [int(c.generate_state(1, dtype=np.uint32)[0]) for c in children]
+
+def _batch_sizes(rows: int, batch_size: int) -> List[int]:
+    batches = math.ceil(rows / batch_size)
+    return [
+        batch_size if (i < batches - 1) else (rows - batch_size * (batches - 1))
+        for i in range(batches)
+    ]
+
+def _prefetch(fn: Callable, jobs: Iterable, depth: int, pool) -> Iterator:
+    """Yield fn(job) for every job, in order, running up to `depth` jobs ahead on `pool`.
+
+    A new job is only submitted when the consumer takes a result, so a slow
+    consumer (e.g. a slow client socket) throttles the producer instead of
+    letting finished batches pile up in memory.
+    """
+    if depth <= 0:
+        for job in jobs:
+            yield fn(job)
         return
-    path = get_model_path()
-    if not path or not os.path.exists(path):
-        raise FileNotFoundError("CTGAN model not found. Set CTGAN_MODEL_PATH.")
-    with open(path, "rb") as f:
-        from services.pickle_compat import load_old_pickle
-        _MODEL = load_old_pickle(CTGAN_MODEL_PATH)  
-
-def ensure_model_loaded() -> None:
-    # Call this from routers to fail fast (before streaming)
-    with _MODEL_LOCK:
-        _load_model()
-
-def _project_belongs_to_user(project_id: str, user_id: str) -> bool:
-    proj = db.collection("projects").document(project_id).get()
-    return bool(proj.exists and proj.to_dict().get("user_id") == user_id)
-
-def _df_to_csv_chunk(df: pd.DataFrame, header: bool) -> bytes:
-    buf = io.StringIO()
-    df.to_csv(buf, index=False, header=header)
-    return buf.getvalue().encode("utf-8")
-
-def stream_synthetic_csv(project_id: str, user_id: str, rows: int, batch_size: int = 2000) -> Iterator[bytes]:
+    jobs = iter(jobs)
+    pending = deque()
+    try:
+        for job in jobs:
+            pending.append(pool.submit(fn, job))
+            if len(pending) >= depth:
+                break
+        while pending:
+            result = pending.popleft().result()
+            for job in jobs:
+                pending.append(pool.submit(fn, job))
+                break
+            yield result
+    finally:
+        # consumer went away (client disconnect) -> drop work not yet started
+        for fut in pending:
+            fut.cancel()
+
+class GenerationPlan(NamedTuple):
+    # a validated generation request, see plan_generation
+    resolved: ResolvedModel
+    rows: int
+    batch_size: int
+    sizes: List[int]
+    seed: Optional[int]
+    prefetch: Optional[int]
+    sharded: bool
+    fmt: str
+    content_encoding: Optional[str]
+    conditions: Dict[str, list]
+    fleet: Optional[fleet_mode.FleetSpec] = None  # fleet mode, see services/fleet.py
+
+def plan_generation(
+    project_id: str,
+    user_id: str,
+    rows: int,
+    batch_size: int = 2000,
+    prefetch: Optional[int] = None,
+    sharded: Optional[bool] = None,
+    seed: Optional[int] = None,
+    fmt: str = "csv",
+    content_encoding: Optional[str] = None,
+    params: Optional[dict] = None,
+    project: Optional[dict] = None,
+    fleet: Optional[fleet_mode.FleetSpec] = None,
+) -> GenerationPlan:
+    # Validation runs eagerly so routers can turn errors into HTTP status
+    # codes before the response starts streaming. Async callers that already
+    # hold the owned project document pass it as `project`. With `fleet`
+    # (services.fleet.plan_fleet) rows are devices x timestamps.
+    if fleet is not None:
+        rows = fleet.rows
     if rows <= 0:
         raise ValueError("rows must be > 0")
-    if not _project_belongs_to_user(project_id, user_id):
+    if project is None:
+        project = _get_owned_project(project_id, user_id)
+    if project is None:
         raise PermissionError("Unauthorized")
 
-    # At this point we assume ensure_model_loaded() already succeeded.
-    model = _MODEL  # safe to read without lock after ensure
+    # Loads the project's model on first use (FileNotFoundError if missing).
+    resolved = resolve_project_model(project)
+    # parsed chat parameters -> allowed values per discrete column (ValueError
+    # when the model cannot produce them, or produces them too rarely)
+    conditions = resolve_conditions(resolved.model, params, resolved.conditions) if params else {}
+    check_conditions(resolved.model, conditions)
 
-    batches = math.ceil(rows / batch_size)
-    wrote_header = False
-    for i in range(batches):
-        n = batch_size if (i < batches - 1) else (rows - batch_size * (batches - 1))
-        df = model.sample(n)
-        yield _df_to_csv_chunk(df, header=(not wrote_header))
-        wrote_header = True
+    make_encoder(fmt)  # raises before streaming if e.g. pyarrow is missing
+    if sharded is None:
+        sharded = SYNTH_SHARD_MIN_ROWS > 0 and rows >= SYNTH_SHARD_MIN_ROWS
+    if seed is not None and not isinstance(resolved.model, ArtifactModel):
+        # Pickled CTGANs sample from the process-global torch/numpy RNGs,
+        # which concurrent sampler threads would interleave; a shard worker
+        # samples one seeded batch at a time, so the output is reproducible.
+        sharded = True
+    sizes = _batch_sizes(rows, batch_size)
+    if fleet is not None:
+        # windows of whole timestamps, sampled in-process: shard workers
+        # encode their rows themselves, without the fleet columns
+        if sharded and seed is not None and not isinstance(resolved.model, ArtifactModel):
+            raise ValueError("Seeded fleet generation needs an artifact model")
+        sharded = False
+        aligned = fleet_mode.align_column(resolved.model, conditions, resolved.conditions) is not None
+        sizes = [w.rows for w in fleet_mode.windows(fleet, batch_size, aligned)]
+    return GenerationPlan(
+        resolved, rows, batch_size, sizes, seed, prefetch,
+        bool(sharded), fmt, content_encoding, conditions, fleet,
+    )
+
+def generation_slots(plan: GenerationPlan) -> int:
+    # scheduler slots the plan takes: a sharded one runs on the whole shard
+    # pool, not on one generation's share of the cores
+    if not plan.sharded:
+        return 1
+    return generation_scheduler.slots_for(max(1, SYNTH_SHARD_WORKERS) * max(1, SYNTH_SHARD_TORCH_THREADS))
+
+def stream_plan(
+    plan: GenerationPlan, progress: Optional[Callable[[int], None]] = None, pooled=None,
+    profile: Optional[DatasetProfile] = None,
+) -> Iterator[bytes]:
+    # progress(n) is called as each batch of n rows is handed to the encoder.
+    # With a seed the bytes are a pure function of the plan (see synth_cache).
+    # `pooled` holds rows already encoded, taken from the warm pool
+    # (services.row_pool) or a speculative generation (services.speculation);
+    # they cannot be profiled. `profile` is
+    # filled from every sampled batch (services.dataset_profile).
+    if pooled is not None:
+        return _stream_pooled(plan, pooled, progress)
+    if plan.fleet is not None:
+        return _stream_fleet(plan, progress, profile)
+    encoder = make_encoder(plan.fmt)
+    sizes, seeds = plan.sizes, _batch_seeds(plan.seed, len(plan.sizes))
+    if plan.sharded:
+        # workers run the model on the sampler and at the precision it was
+        # activated with here
+        resolved = plan.resolved.model
+        model = (plan.resolved.path, model_precision(resolved), is_fast_sampler(resolved))
+        if plan.fmt == "csv":
+            # Shards are sampled *and* encoded in the worker processes; the
+            # parent only re-emits the encoded chunks in shard order.
+            # With a profile each worker also profiles its shard and the
+            # partial profiles are merged here.
+            chunks = _sample_sharded(
+                model, sizes, seeds, plan.prefetch, plan.conditions, csv=True, profile=profile is not None,
+            )
+            if profile is not None:
+                chunks = merge_partials(chunks, profile)
+            return compress_stream(_counted(chunks, sizes, progress), plan.content_encoding)
+        frames = _sample_sharded(model, sizes, seeds, plan.prefetch, plan.conditions, csv=False)
+        return encode_stream(_counted(_profiled(frames, profile), sizes, progress), encoder, plan.content_encoding)
+
+    depth = SYNTH_PREFETCH_DEPTH if plan.prefetch is None else plan.prefetch
+    # unseeded pickled models keep drawing from the global RNGs
+    batch_seeds = seeds if plan.seed is not None else None
+    frames = _sample_frames(plan.resolved.model, sizes, batch_seeds, depth, plan.conditions)
+    return encode_stream(_counted(_profiled(frames, profile), sizes, progress), encoder, plan.content_encoding)
+
+def _profiled(frames: Iterable, profile: Optional[DatasetProfile]) -> Iterable:
+    return frames if profile is None else profile_frames(frames, profile)
+
+def _stream_pooled(plan: GenerationPlan, pooled, progress: Optional[Callable[[int], None]]) -> Iterator[bytes]:
+    # the header and the pooled rows go out first; whatever the pool could
+    # not cover is sampled live behind them
+    rest = plan.rows - pooled.rows
+    sizes = _batch_sizes(rest, plan.batch_size) if rest else []
+    depth = SYNTH_PREFETCH_DEPTH if plan.prefetch is None else plan.prefetch
+    encoder = CsvEncoder(header=False)
+
+    def chunks():
+        if progress is not None:
+            progress(pooled.rows)
+        yield from pooled.data()
+        if sizes:
+            frames = _sample_frames(plan.resolved.model, sizes, None, depth, plan.conditions)
+            for df in _counted(frames, sizes, progress):
+                with STAGE_SECONDS.time(stage="encode"):
+                    chunk = encoder.encode(df)
+                yield chunk
+
+    return compress_stream(chunks(), plan.content_encoding)
+
+def _stream_fleet(
+    plan: GenerationPlan, progress: Optional[Callable[[int], None]], profile: Optional[DatasetProfile],
+) -> Iterator[bytes]:
+    # one window per batch, in time order (whole timestamps, or a slice of
+    # one timestamp's devices); each window's rows are sampled under its own
+    # time-of-day condition
+    spec, model, mapping = plan.fleet, plan.resolved.model, plan.resolved.conditions
+    aligned = fleet_mode.align_column(model, plan.conditions, mapping) is not None
+    windows = fleet_mode.windows(spec, plan.batch_size, aligned)
+    seeds = _batch_seeds(plan.seed, len(windows)) if plan.seed is not None else None
+    conditions = fleet_mode.window_conditions(model, spec, windows, plan.conditions, mapping)
+    depth = SYNTH_PREFETCH_DEPTH if plan.prefetch is None else plan.prefetch
+    frames = _sample_frames(model, plan.sizes, seeds, depth, conditions)
+    ids, drop = fleet_mode.device_ids(spec), fleet_mode.replaced_columns(model, mapping)
+
+    def fleet_frames():
+        for window, df in zip(windows, frames):
+            yield fleet_mode.fleet_frame(spec, window, ids, df, drop)
+
+    out = _profiled(fleet_frames(), profile)
+    return encode_stream(_counted(out, plan.sizes, progress), make_encoder(plan.fmt), plan.content_encoding)
+
+def stream_synthetic_csv(
+    project_id: str,
+    user_id: str,
+    rows: int,
+    batch_size: int = 2000,
+    prefetch: Optional[int] = None,
+    sharded: Optional[bool] = None,
+    seed: Optional[int] = None,
+    fmt: str = "csv",
+    content_encoding: Optional[str] = None,
+    params: Optional[dict] = None,
+    progress: Optional[Callable[[int], None]] = None,
+    project: Optional[dict] = None,
+    fleet: Optional[fleet_mode.FleetSpec] = None,
+    profile: Optional[DatasetProfile] = None,
+) -> Iterator[bytes]:
+    with STAGE_SECONDS.time(stage="plan"):
+        plan = plan_generation(
+            project_id, user_id, rows, batch_size, prefetch, sharded, seed, fmt, content_encoding, params,
+            project=project, fleet=fleet,
+        )
+    return stream_plan(plan, progress, profile=profile)
+
+def _counted(items: Iterable, sizes: List[int], progress: Optional[Callable[[int], None]]) -> Iterable:
+    # batches arrive in order, one item per entry of `sizes`
+    if progress is None:
+        return items
+    def gen():
+        for item, n in zip(items, sizes):
+            progress(n)
+            yield item
+    return gen()
+
+def _sample_frames(
+    model, sizes: List[int], seeds: Optional[List[int]], depth: int,
+    conditions: Union[Dict[str, list], List[Dict[str, list]]],
+) -> Iterator:
+    # Sampling of the next `depth` batches overlaps with encoding and sending
+    # the current one; torch releases the GIL inside the generator forward pass.
+    # `conditions` applies to every batch, or is a list with one per batch.
+    pool = _get_sampler_pool() if depth > 0 else None
+    per_batch = conditions if isinstance(conditions, list) else [conditions] * len(sizes)
+    jobs = list(zip(sizes, seeds or [None] * len(sizes), per_batch))
+
+    def sample(job):
+        # this generation's share of the cores at the current load
+        apply_torch_threads(generation_scheduler.torch_threads())
+        with STAGE_SECONDS.time(stage="sample"):
+            return sample_rows(model, job[0], job[2], job[1])
+
+    yield from _prefetch(sample, jobs, depth, pool)
+
+def _sample_sharded(
+    model: Tuple[str, str, bool],
+    sizes: List[int],
+    seeds: List[int],
+    prefetch: Optional[int],
+    conditions: Dict[str, list],
+    csv: bool,
+    profile: bool = False,
+) -> Iterator:
+    from services.shard_worker import sample_shard
+    pool = _acquire_shard_pool(*model)  # (path, precision, fast)
+    depth = prefetch or 2 * SYNTH_SHARD_WORKERS
+    jobs = [(i, n, seeds[i], (i == 0) if csv else None, conditions, profile) for i, n in enumerate(sizes)]
+    try:
+        yield from _prefetch(sample_shard, jobs, depth, pool.executor)
+    except BrokenProcessPool:
+        # a worker died (e.g. OOM); start a fresh pool on the next request
+        _discard_shard_pool(*model)
+        raise
+    finally:
+        _release_shard_pool(pool)
@@ -1,30 +1,36 @@
-from utils.firebase import db, auth
+from utils.firebase import adb, auth
 from models.user import UserCreate, UserLogin
+from services.metrics import FIRESTORE_SECONDS
+import asyncio
 import hashlib
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-def create_user(user_data: UserCreate):
+# firebase_admin.auth has no async API: its calls run on a worker thread
+async def create_user(user_data: UserCreate):
     # Create Auth user
-    auth_user = auth.create_user(email=user_data.email, password=user_data.password)
+    auth_user = await asyncio.to_thread(auth.create_user, email=user_data.email, password=user_data.password)
     hashed_pw = hash_password(user_data.password)
-    
+
     # Store in Firestore
-    user_ref = db.collection('users').document(auth_user.uid)
-    user_ref.set({
-        'uid': auth_user.uid,
-        'name': user_data.name,
-        'email': user_data.email,
-        'password_hash': hashed_pw
-    })
+    user_ref = adb.collection('users').document(auth_user.uid)
+    with FIRESTORE_SECONDS.time(op="user_create"):
+        await user_ref.set({
+            'uid': auth_user.uid,
+            'name': user_data.name,
+            'email': user_data.email,
+            'password_hash': hashed_pw
+        })
     return {"uid": auth_user.uid, "name": user_data.name, "email": user_data.email}
 
-def login_user(login: UserLogin):
+async def login_user(login: UserLogin):
     try:
         # Verify via Firestore (since we store hash)
-        users_ref = db.collection('users').where('email', '==', login.email).stream()
-        for user_doc in users_ref:
+        users_ref = adb.collection('users').where('email', '==', login.email).stream()
+        with FIRESTORE_SECONDS.time(op="user_login"):
+            user_docs = [d async for d in users_ref]
+        for user_doc in user_docs:
             user = user_doc.to_dict()
             if user['password_hash'] == hash_password(login.password):
                 return {"uid": user['uid'], "name": user['name'], "email": user['email']}
@@ -32,14 +38,15 @@ def login_user(login: UserLogin):
     except:
         return None
 
-def update_user(uid: str, name: str = None, password: str = None):
-    user_ref = db.collection('users').document(uid)
+async def update_user(uid: str, name: str = None, password: str = None):
+    user_ref = adb.collection('users').document(uid)
     update_data = {}
     if name:
         update_data['name'] = name
     if password:
         update_data['password_hash'] = hash_password(password)
-        auth.update_user(uid, password=password)
+        await asyncio.to_thread(auth.update_user, uid, password=password)
     if update_data:
-        user_ref.update(update_data)
+        with FIRESTORE_SECONDS.time(op="user_update"):
+            await user_ref.update(update_data)
     return {"message": "Updated"}
\ No newline at end of file
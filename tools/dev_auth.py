@@ -0,0 +1,109 @@
+# tools/dev_auth.py
+# Local stand-in for Firebase's token signing, so bearer auth
+# (services/auth.py) can be run and tested offline: a generated RSA key
+# with a self-signed certificate in the same {"kid": "PEM"} format Google
+# publishes, and ID tokens with Firebase's claims signed by that key.
+#
+#   python -m tools.dev_auth keys OUT_DIR [--kid dev-key]
+#   python -m tools.dev_auth token OUT_DIR --uid USER --project PROJECT_ID [--ttl 3600]
+#
+# then run the API with SYNTH_AUTH=required SYNTH_AUTH_CERTS=OUT_DIR/certs.json
+# SYNTH_AUTH_PROJECT_ID=PROJECT_ID and send "Authorization: Bearer <token>".
+import argparse
+import base64
+import datetime
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Optional
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+_KEY_FILE = "private_key.pem"
+_CERTS_FILE = "certs.json"
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def generate_keys(out_dir: str, kid: str = "dev-key") -> str:
+    """Write a private key and certs.json (kid -> certificate); returns the certs path."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "synthiot-dev-auth")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=365))
+        .sign(key, hashes.SHA256())
+    )
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, _KEY_FILE), "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+        ))
+    certs = os.path.join(out_dir, _CERTS_FILE)
+    with open(certs, "w", encoding="utf-8") as f:
+        json.dump({kid: cert.public_bytes(serialization.Encoding.PEM).decode()}, f, indent=2)
+    return certs
+
+
+def mint_token(
+    out_dir: str, uid: str, project_id: str, ttl: int = 3600,
+    claims: Optional[Dict[str, Any]] = None, kid: Optional[str] = None,
+) -> str:
+    """A Firebase-style ID token for `uid`, signed with the key in out_dir."""
+    with open(os.path.join(out_dir, _KEY_FILE), "rb") as f:
+        key = serialization.load_pem_private_key(f.read(), password=None)
+    if kid is None:
+        with open(os.path.join(out_dir, _CERTS_FILE), encoding="utf-8") as f:
+            kid = next(iter(json.load(f)))
+    now = int(time.time())
+    payload = {
+        "iss": f"https://securetoken.google.com/{project_id}",
+        "aud": project_id,
+        "auth_time": now,
+        "user_id": uid,
+        "sub": uid,
+        "iat": now,
+        "exp": now + ttl,
+        "firebase": {"identities": {}, "sign_in_provider": "custom"},
+        **(claims or {}),
+    }
+    header = {"alg": "RS256", "kid": kid, "typ": "JWT"}
+    signing_input = f"{_b64(json.dumps(header).encode())}.{_b64(json.dumps(payload).encode())}"
+    signature = key.sign(signing_input.encode(), padding.PKCS1v15(), hashes.SHA256())
+    return f"{signing_input}.{_b64(signature)}"
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="command", required=True)
+    keys = sub.add_parser("keys", help="generate a signing key and certs.json")
+    keys.add_argument("out_dir")
+    keys.add_argument("--kid", default="dev-key")
+    token = sub.add_parser("token", help="mint an ID token")
+    token.add_argument("out_dir")
+    token.add_argument("--uid", required=True)
+    token.add_argument("--project", required=True)
+    token.add_argument("--ttl", type=int, default=3600)
+    token.add_argument("--email")
+    args = ap.parse_args()
+    if args.command == "keys":
+        print(generate_keys(args.out_dir, args.kid))
+    else:
+        extra = {"email": args.email} if args.email else None
+        print(mint_token(args.out_dir, args.uid, args.project, args.ttl, extra))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+# tools/migrate_chats.py
+# Bulk migration of chats stored with an in-document "messages" array to the
+# append-only messages subcollection (services/chat_service.py). Chats are
+# also migrated lazily on their next send, so this is optional; it is safe
+# to run while the API is serving.
+#
+#   python -m tools.migrate_chats [--project PROJECT_ID] [--dry-run]
+import argparse
+import asyncio
+from utils.firebase import adb
+from services.chat_service import migrate_chat
+
+
+async def legacy_chats(project_id=None):
+    projects = [adb.collection("projects").document(project_id)] if project_id else [
+        p.reference async for p in adb.collection("projects").select([]).stream()
+    ]
+    for proj_ref in projects:
+        # only the counter is fetched; legacy chats do not have one
+        async for chat in proj_ref.collection("chats").select(["message_count"]).stream():
+            if chat.to_dict().get("message_count") is None:
+                yield chat.reference
+
+
+async def migrate(project_id=None, dry_run=False) -> None:
+    found = migrated = 0
+    async for chat_ref in legacy_chats(project_id):
+        found += 1
+        if dry_run:
+            print(f"legacy: {chat_ref.path}")
+        elif await migrate_chat(chat_ref):
+            migrated += 1
+            print(f"migrated: {chat_ref.path}")
+    print(f"{found} legacy chat(s), {migrated} migrated")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--project", help="only this project")
+    ap.add_argument("--dry-run", action="store_true", help="list legacy chats without changing them")
+    args = ap.parse_args()
+    asyncio.run(migrate(args.project, args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
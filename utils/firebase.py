@@ -1,6 +1,6 @@
 # utils/firebase.py
 import firebase_admin
-from firebase_admin import credentials, firestore, auth
+from firebase_admin import credentials, firestore, firestore_async, auth
 from dotenv import load_dotenv
 import os
 
@@ -13,4 +13,7 @@ if not cred_path or not os.path.exists(cred_path):
 cred = credentials.Certificate(cred_path)
 firebase_admin.initialize_app(cred)
 
-db = firestore.client()
\ No newline at end of file
+db = firestore.client()
+# AsyncClient for the request handlers; the blocking client is kept for the
+# sampling / job threads and the command-line tools.
+adb = firestore_async.client()
@@ -0,0 +1,38 @@
+# utils/pagination.py
+# Opaque cursors for paginated list endpoints: the sort-key values of the
+# last item returned, as URL-safe base64 JSON. Clients only pass them back.
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+
+_DATETIME = "$dt"
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):  # Firestore timestamps
+        return {_DATETIME: value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and _DATETIME in value:
+        return datetime.fromisoformat(value[_DATETIME])
+    return value
+
+
+def encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps([_encode_value(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Inverse of encode_cursor; ValueError if it is not one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return [_decode_value(v) for v in values]